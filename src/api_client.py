@@ -0,0 +1,76 @@
+"""
+Thin client for api_server, shaped like AsyncQueryPipeline (submit / submit_future / get_stats) so
+the Streamlit app can use either. Results come back in columnar form as a ColumnarResult.
+A server that cannot be reached raises APIUnavailableError and one that does not answer in time
+raises TimeoutError; get_stats reports either instead of raising.
+"""
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from async_pipeline import PipelineBusyError
+from query_executor import ColumnarResult
+
+class APIUnavailableError(ConnectionError):
+    """The query server refused the connection or dropped it."""
+
+class QueryAPIClient:
+    """
+    `timeout` covers a whole /query round trip (the server's own limit plus slack);
+    `stats_timeout` is kept short because the sidebar asks for stats on every rerun.
+    """
+    def __init__(self, base_url, timeout=130.0, stats_timeout=2.0, max_workers=8):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.stats_timeout = stats_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-api")
+
+    def submit(self, question, role):
+        """{"question", "query", "result"} like the pipeline; errors are returned as strings."""
+        status, body = self._request("POST", "/query", {"question": question, "format": "columnar"}, role)
+        if status == 429:
+            raise PipelineBusyError(body.get("detail", "Server busy"))
+        if status == 504:
+            raise TimeoutError(body.get("detail", "Query timed out"))
+        if status >= 400 and "error" not in body:
+            raise RuntimeError(body.get("detail", f"HTTP {status}"))
+        if "error" in body:
+            result = body["error"]
+        else:
+            result = ColumnarResult(body["columns"], body["data"], body["row_count"], 0, body["truncated"])
+        return {"question": body.get("question", question), "query": body.get("query", ""), "result": result}
+
+    def submit_future(self, question, role, on_token=None, on_batch=None):
+        """
+        Runs submit on a worker thread. Nothing is streamed over HTTP, so the callbacks are unused,
+        and cancelling the future only stops waiting; the server still finishes the request.
+        """
+        return self._executor.submit(self.submit, question, role)
+
+    def get_stats(self):
+        try:
+            status, body = self._request("GET", "/stats", timeout=self.stats_timeout)
+        except (APIUnavailableError, TimeoutError) as e:
+            return {"error": str(e) or "Query server did not answer in time", "unavailable": True}
+        return body if status == 200 else {"error": body}
+
+    def _request(self, method, path, payload=None, role=None, timeout=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if role:
+            request.add_header("X-Role", role)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read())
+            except ValueError:
+                return e.code, {"detail": str(e)}
+        except (urllib.error.URLError, ConnectionError) as e:
+            reason = getattr(e, "reason", None) or e
+            if isinstance(reason, TimeoutError):
+                raise TimeoutError(f"Query server at {self.base_url} did not answer in time") from e
+            raise APIUnavailableError(f"Query server unavailable at {self.base_url}: {reason}") from e
@@ -0,0 +1,137 @@
+"""
+Headless HTTP API over the same DBManager + LLMEngine + AsyncQueryPipeline the Streamlit app uses.
+
+Each worker process holds one set of pooled engines, one bounded LLM/SQLite pipeline and its
+caches; scale out with more workers. Requests beyond the pipeline's `max_pending` get 429.
+
+    cd src
+    uvicorn api_server:app --host 0.0.0.0 --port 8000 --workers 4
+    curl -s localhost:8000/query -H 'X-Role: PlantDirector' -H 'Content-Type: application/json' \
+         -d '{"question": "Show me the top 5 assets with highest vibration"}'
+    QUERY_API_URL=http://localhost:8000 streamlit run main.py    # UI as a thin client
+
+Responses carry {"question", "query"} plus either "error" (HTTP 422) or the result as
+"records" (format=json, default) or "columns"/"data" (format=columnar).
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from async_pipeline import AsyncQueryPipeline, PipelineBusyError
+from database_manager import ROLE_ATTACHMENTS, DBManager
+from index_advisor import IndexAdvisor
+from llm_engine import LLMEngine
+from metrics import REGISTRY
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+class QueryRequest(BaseModel):
+    question: str
+    format: str = "json"
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    format: str = "json"
+
+@asynccontextmanager
+async def lifespan(app):
+    db_manager = DBManager()
+    llm_engine = LLMEngine(index_advisor=IndexAdvisor())
+    # Created on the server's event loop, which all pipeline coroutines must share
+    app.state.db_manager = db_manager
+    app.state.llm_engine = llm_engine
+    app.state.pipeline = AsyncQueryPipeline(
+        db_manager, llm_engine,
+        max_llm_concurrency=_env_int("API_MAX_LLM_CONCURRENCY", 2),
+        max_db_concurrency=_env_int("API_MAX_DB_CONCURRENCY", 4),
+        max_pending=_env_int("API_MAX_PENDING", 32),
+        timeout=_env_int("API_TIMEOUT_SECONDS", 120),
+    )
+    yield
+    db_manager.invalidate()
+
+app = FastAPI(title="Multi-DB SQL Query API", lifespan=lifespan)
+
+def serialize_response(response, fmt):
+    """Pipeline response -> (status code, JSON body)."""
+    body = {"question": response["question"], "query": response["query"]}
+    result = response["result"]
+    if isinstance(result, str):
+        body["error"] = result
+        return 422, body
+    body["row_count"] = result.row_count
+    body["truncated"] = result.truncated
+    if fmt == "columnar":
+        body["columns"] = result.columns
+        body["data"] = result.data
+    else:
+        body["records"] = [dict(zip(result.columns, row)) for row in zip(*(result.data[c] for c in result.columns))]
+    return 200, body
+
+def _check_format(fmt):
+    if fmt not in ("json", "columnar"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'columnar'")
+
+async def _run(question, role):
+    # Only the role lookup is the caller's fault; other errors (e.g. PartitionLimitError) are not
+    if role not in ROLE_ATTACHMENTS:
+        raise HTTPException(status_code=400, detail=f"Unknown role: {role}")
+    try:
+        return await app.state.pipeline.run(question, role)
+    except PipelineBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Query timed out")
+
+@app.post("/query")
+async def query(request: QueryRequest, x_role: str = Header(...)):
+    _check_format(request.format)
+    with REGISTRY.span("api_request", role=x_role):
+        response = await _run(request.question, x_role)
+        status, body = serialize_response(response, request.format)
+    return JSONResponse(body, status_code=status)
+
+@app.post("/batch")
+async def batch(request: BatchRequest, x_role: str = Header(...)):
+    """Questions run concurrently; each item reports its own status instead of failing the batch."""
+    _check_format(request.format)
+    results = await asyncio.gather(*(_run(q, x_role) for q in request.questions), return_exceptions=True)
+    items = []
+    for question, outcome in zip(request.questions, results):
+        if isinstance(outcome, HTTPException):
+            items.append({"question": question, "status": outcome.status_code, "error": outcome.detail})
+        elif isinstance(outcome, BaseException):
+            items.append({"question": question, "status": 500, "error": str(outcome)})
+        else:
+            status, body = serialize_response(outcome, request.format)
+            body["status"] = status
+            items.append(body)
+    return {"results": items}
+
+@app.get("/stats")
+async def stats():
+    state = app.state
+    return {
+        "pool": state.db_manager.get_stats(),
+        "pipeline": state.pipeline.get_stats(),
+        "governor_limits": state.llm_engine.governor.get_stats(),
+        "sql_repairs": state.llm_engine.sql_repairer.get_stats(),
+        "slow_queries": list(state.llm_engine.slow_query_log.entries)[-5:],
+        "index_recommendations": [r.to_dict() for r in state.llm_engine.index_advisor.recommendations()],
+        "stages": REGISTRY.to_dict()["histograms"],
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return REGISTRY.render_prometheus()
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
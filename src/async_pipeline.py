@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from query_cache import normalize_question
+from query_governor import CancelToken
+
+class PipelineBusyError(Exception):
+    """Raised when the pipeline already holds `max_pending` requests (backpressure)."""
+
+class _InflightRequest:
+    def __init__(self, task, cancel_token):
+        self.task = task
+        self.cancel_token = cancel_token
+        self.waiters = 0
+
+class AsyncQueryPipeline:
+    """
+    Concurrent question -> SQL -> result pipeline on top of DBManager + LLMEngine.
+
+    LLM generation runs through `ainvoke` behind an asyncio.Semaphore; SQLite execution runs on
+    a bounded thread pool. Identical in-flight questions (same role, schema and normalized text)
+    share one task, so N users asking the same thing trigger one generation. Requests beyond
+    `max_pending` are rejected with PipelineBusyError instead of queueing without bound.
+    When the last caller waiting on a request is cancelled (or the request times out), its
+    SQLite statement is interrupted through a CancelToken.
+
+    All coroutines must run on one event loop. Synchronous callers (Streamlit) use `submit`,
+    which runs them on a background loop owned by the pipeline.
+    """
+    def __init__(self, db_manager, llm_engine, max_llm_concurrency=2, max_db_concurrency=4,
+                 max_pending=32, timeout=120.0):
+        self.db_manager = db_manager
+        self.llm_engine = llm_engine
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self._llm_slots = asyncio.Semaphore(max_llm_concurrency)
+        self._db_executor = ThreadPoolExecutor(max_workers=max_db_concurrency, thread_name_prefix="sqlite")
+        self._inflight = {}
+        self._stats = {"submitted": 0, "deduplicated": 0, "rejected": 0, "timeouts": 0, "cancelled": 0,
+                       "completed": 0}
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def run(self, question, role, on_token=None, on_batch=None):
+        """
+        Returns {"question", "query", "result"} like the chain from LLMEngine.get_chain.
+        `on_token` / `on_batch` receive streamed SQL text and result batches; they are only
+        called for the caller that started the request, not for deduplicated followers.
+        """
+        # Building a session and fingerprinting its schema open SQLite files: keep them off the loop
+        loop = asyncio.get_running_loop()
+        db, fingerprint = await loop.run_in_executor(self._db_executor, self._session, role)
+        key = (role, fingerprint, normalize_question(question))
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            if len(self._inflight) >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise PipelineBusyError(f"{len(self._inflight)} requests pending; try again later")
+            self._stats["submitted"] += 1
+            cancel_token = CancelToken()
+            entry = _InflightRequest(asyncio.ensure_future(self._process(db, question, cancel_token, on_token, on_batch)), cancel_token)
+            self._inflight[key] = entry
+            entry.task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats["deduplicated"] += 1
+
+        entry.waiters += 1
+        try:
+            # Shielded so one caller giving up does not cancel the work other callers share
+            return await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            if entry.waiters == 1 and not entry.task.done():
+                self._stats["cancelled"] += 1
+                entry.cancel_token.cancel()
+                entry.task.cancel()
+            raise
+        finally:
+            entry.waiters -= 1
+
+    async def batch(self, questions, role):
+        """Run several questions concurrently; failures are returned in place as exceptions."""
+        return await asyncio.gather(*(self.run(q, role) for q in questions), return_exceptions=True)
+
+    def submit(self, question, role):
+        """Blocking entry point for synchronous callers."""
+        return self.submit_future(question, role).result()
+
+    def submit_future(self, question, role, on_token=None, on_batch=None):
+        """
+        concurrent.futures.Future for the request; cancelling it abandons the request. The
+        callbacks run on pipeline threads, so callers should hand their data over via a queue.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.run(question, role, on_token, on_batch), self._background_loop()
+        )
+
+    def submit_batch(self, questions, role):
+        return asyncio.run_coroutine_threadsafe(self.batch(questions, role), self._background_loop()).result()
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._inflight)
+        return stats
+
+    def _session(self, role):
+        db = self.db_manager.get_db_for_session(role)
+        return db, db.schema_fingerprint
+
+    async def _process(self, db, question, cancel_token, on_token=None, on_batch=None):
+        try:
+            response = await asyncio.wait_for(
+                self._generate_and_execute(db, question, cancel_token, on_token, on_batch), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            # wait_for only cancels the coroutine; the executor thread keeps running the SQL
+            cancel_token.cancel()
+            raise
+        except asyncio.CancelledError:
+            cancel_token.cancel()
+            raise
+        self._stats["completed"] += 1
+        return response
+
+    async def _generate_and_execute(self, db, question, cancel_token, on_token=None, on_batch=None):
+        query = await self.llm_engine.agenerate_query(
+            db, question, llm_slots=self._llm_slots, on_token=on_token, executor=self._db_executor
+        )
+        # Dry run + local repair; re-prompts (bounded) share the LLM slots
+        query = await self.llm_engine.arepair_query(
+            db, question, query, llm_slots=self._llm_slots, executor=self._db_executor
+        )
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._db_executor, self.llm_engine.execute_query, db, query, cancel_token, on_batch
+        )
+        return {"question": question, "query": query, "result": result}
+
+    def _background_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="query-pipeline", daemon=True).start()
+            return self._loop
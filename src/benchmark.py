@@ -0,0 +1,277 @@
+"""
+Offline end-to-end benchmark: DBManager.get_db_for_session -> LLMEngine generation -> repair ->
+execution (the steps of LLMEngine.get_chain), with a canned-SQL chat model standing in for Ollama.
+
+    cd src
+    python benchmark.py --scales 1,4 --concurrency 1,4,16 --requests 40 --llm-latency 0.05 --output bench.json
+    python benchmark.py --compare bench.json          # rerun and diff against a previous result
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database_manager import DBManager
+from fake_llm import CannedSQLChatModel
+from llm_engine import LLMEngine
+from query_cache import SQLQueryCache, normalize_question
+from result_cache import ResultCache
+from rollups import refresh_rollups
+
+STAGES = ["db_setup", "schema", "first_token", "generate", "repair", "execute", "dataframe", "total"]
+
+# (question, SQL the model is assumed to produce) per role
+BENCHMARK_CORPUS = {
+    "SensorViewer": [
+        ("Show me the top 5 assets with highest vibration",
+         "SELECT s.asset_id, AVG(s.vibration) AS avg_vibration FROM sensor_readings AS s "
+         "GROUP BY s.asset_id ORDER BY avg_vibration DESC LIMIT 5;"),
+        ("What is the average temperature per asset?",
+         "SELECT s.asset_id, AVG(s.temperature) AS avg_temperature FROM sensor_readings AS s "
+         "GROUP BY s.asset_id ORDER BY s.asset_id LIMIT 100;"),
+        ("How many sensor readings are above 5 vibration?",
+         "SELECT COUNT(*) AS readings FROM sensor_readings AS s WHERE s.vibration > 5;"),
+    ],
+    "MaintenanceManager": [
+        ("List work orders for AST-001",
+         "SELECT wo.order_id, wo.asset_id, wo.status, wo.priority, wo.cost FROM maintenance.work_orders AS wo "
+         "WHERE wo.asset_id = 'AST-001' LIMIT 5;"),
+        ("Total maintenance cost per asset",
+         "SELECT wo.asset_id, SUM(wo.cost) AS total_cost FROM maintenance.work_orders AS wo "
+         "GROUP BY wo.asset_id ORDER BY total_cost DESC LIMIT 10;"),
+    ],
+    "RevenueAnalyst": [
+        ("Show me the revenue for all assets",
+         "SELECT r.asset_id, SUM(r.amount_usd) AS total_revenue FROM revenue.asset_revenue AS r "
+         "GROUP BY r.asset_id ORDER BY total_revenue DESC LIMIT 100;"),
+        ("Revenue by region and quarter",
+         "SELECT r.region, r.quarter, SUM(r.amount_usd) AS total_revenue FROM revenue.asset_revenue AS r "
+         "GROUP BY r.region, r.quarter;"),
+    ],
+    "PlantDirector": [
+        ("Which critical assets have high revenue but high maintenance costs?",
+         "SELECT a.asset_id, SUM(r.amount_usd) AS total_revenue, SUM(wo.cost) AS total_cost "
+         "FROM assets_shared AS a JOIN revenue.asset_revenue AS r ON a.asset_id = r.asset_id "
+         "JOIN maintenance.work_orders AS wo ON a.asset_id = wo.asset_id WHERE a.criticality = 'High' "
+         "GROUP BY a.asset_id ORDER BY total_revenue DESC, total_cost DESC LIMIT 5;"),
+        ("Top 5 assets by vibration with maintenance count and revenue",
+         "SELECT s.asset_id, AVG(s.vibration) AS avg_vibration, COUNT(wo.order_id) AS maintenance_count, "
+         "SUM(r.amount_usd) AS total_revenue FROM sensor_readings AS s "
+         "JOIN maintenance.work_orders AS wo ON s.asset_id = wo.asset_id "
+         "JOIN revenue.asset_revenue AS r ON s.asset_id = r.asset_id "
+         "GROUP BY s.asset_id ORDER BY avg_vibration DESC LIMIT 5;"),
+    ],
+}
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else None,
+        "p50_ms": percentile(samples, 50) * 1000 if samples else None,
+        "p95_ms": percentile(samples, 95) * 1000 if samples else None,
+        "p99_ms": percentile(samples, 99) * 1000 if samples else None,
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if os.uname().sysname == "Linux" else rss / (1024 * 1024)
+
+def prepare_scaled_data(source_dir, scale, dest_dir):
+    """
+    Copy the databases and replicate sensor_readings `scale` times (scale 1 = unchanged copy).
+    The rollups are refreshed so rewritten aggregations see every copy.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        if name.endswith(".db"):
+            shutil.copy(os.path.join(source_dir, name), os.path.join(dest_dir, name))
+    if scale > 1:
+        conn = sqlite3.connect(os.path.join(dest_dir, "db1_sensors.db"))
+        with conn:
+            n = conn.execute("SELECT MAX(reading_id) FROM sensor_readings").fetchone()[0]
+            for k in range(1, scale):
+                conn.execute(
+                    "INSERT INTO sensor_readings (reading_id, asset_id, timestamp, temperature, vibration) "
+                    "SELECT reading_id + ?, asset_id, timestamp, temperature, vibration "
+                    "FROM sensor_readings WHERE reading_id <= ?",
+                    (k * n, n),
+                )
+        refresh_rollups(conn)
+        conn.close()
+    return dest_dir
+
+def build_engine(llm_latency, seconds_per_token, use_caches):
+    responses = {
+        normalize_question(question): sql
+        for corpus in BENCHMARK_CORPUS.values() for question, sql in corpus
+    }
+    llm = CannedSQLChatModel(responses=responses, latency=llm_latency, seconds_per_token=seconds_per_token)
+    if use_caches:
+        return LLMEngine(llm=llm, query_cache=SQLQueryCache(), result_cache=ResultCache())
+    # Zero-capacity caches: every request pays for generation and execution
+    return LLMEngine(llm=llm, query_cache=SQLQueryCache(max_entries=0), result_cache=ResultCache(max_bytes=0))
+
+def run_request(db_manager, engine, role, question, stream=False):
+    timings = {}
+    start = time.perf_counter()
+    db = db_manager.get_db_for_session(role)
+    t = time.perf_counter()
+    timings["db_setup"] = t - start
+
+    db.get_table_info()
+    timings["schema"] = time.perf_counter() - t
+    t = time.perf_counter()
+
+    if stream:
+        pieces = []
+        for piece in engine.stream_query(db, question):
+            if not pieces:
+                timings["first_token"] = time.perf_counter() - t
+            pieces.append(piece)
+        query = "".join(pieces).strip()
+    else:
+        query = engine.generate_query(db, question)
+    timings["generate"] = time.perf_counter() - t
+    t = time.perf_counter()
+
+    # Same dry run / local repair / bounded LLM retry the app's chain applies before execution
+    query = engine.repair_or_retry(db, question, query)
+    timings["repair"] = time.perf_counter() - t
+    t = time.perf_counter()
+
+    result = engine.execute_query(db, query)
+    timings["execute"] = time.perf_counter() - t
+    t = time.perf_counter()
+
+    if isinstance(result, str):
+        raise RuntimeError(f"{role}: {question}: {result}")
+    result.to_dataframe()
+    timings["dataframe"] = time.perf_counter() - t
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+def run_level(db_manager, engine, concurrency, n_requests, seed, stream=False):
+    rng = random.Random(seed)
+    roles = rng.choices(list(BENCHMARK_CORPUS), k=n_requests)
+    workload = [(role, rng.choice(BENCHMARK_CORPUS[role])[0]) for role in roles]
+    samples = {stage: [] for stage in STAGES}
+    errors = []
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_request, db_manager, engine, role, q, stream) for role, q in workload]
+        for future in futures:
+            try:
+                for stage, value in future.result().items():
+                    samples[stage].append(value)
+            except Exception as e:
+                errors.append(str(e))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_s": wall,
+        "throughput_rps": n_requests / wall if wall else None,
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous, current):
+    old_runs = {(r["scale"], r["concurrency"]): r for r in previous["runs"]}
+    print(f"\nComparison against {previous.get('commit')} ({previous.get('timestamp')}):")
+    for run in current["runs"]:
+        old = old_runs.get((run["scale"], run["concurrency"]))
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            before, after = old["stages"]["total"][metric], run["stages"]["total"][metric]
+            if before and after:
+                change = (after - before) / before * 100
+                print(f"  scale={run['scale']:<3} conc={run['concurrency']:<3} total {metric}: "
+                      f"{before:8.2f} -> {after:8.2f} ({change:+.1f}%)")
+
+def print_run(run):
+    print(f"\nscale={run['scale']} concurrency={run['concurrency']} requests={run['requests']} "
+          f"errors={run['errors']} throughput={run['throughput_rps']:.1f} req/s peak_rss={run['peak_rss_mb']:.0f} MB")
+    print(f"  {'stage':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in STAGES:
+        s = run["stages"][stage]
+        if s["count"]:
+            print(f"  {stage:<10} {s['p50_ms']:9.2f} {s['p95_ms']:9.2f} {s['p99_ms']:9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--data-dir", default=os.path.join(project_root, "data"))
+    parser.add_argument("--scales", default="1", help="comma-separated sensor_readings multipliers")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=40, help="requests per (scale, concurrency) level")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="fixed fake-LLM delay per call (s)")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0, help="extra fake-LLM delay per output token")
+    parser.add_argument("--with-caches", action="store_true", help="keep the SQL and result caches enabled")
+    parser.add_argument("--stream", action="store_true", help="stream generation (stops at the first complete statement)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="previous JSON result to diff against")
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "runs": [],
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="sql-bench-")
+    try:
+        for scale in [int(s) for s in args.scales.split(",")]:
+            data_dir = prepare_scaled_data(args.data_dir, scale, os.path.join(work_dir, f"scale{scale}"))
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                db_manager = DBManager(data_dir=data_dir)
+                engine = build_engine(args.llm_latency, args.seconds_per_token, args.with_caches)
+                run = run_level(db_manager, engine, concurrency, args.requests, args.seed, args.stream)
+                run["scale"] = scale
+                report["runs"].append(run)
+                print_run(run)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if previous is not None:
+        compare(previous, report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Read-optimized SQLite connection settings, configurable per database file.
+
+Files are opened (and ATTACHed) through `file:` URIs with mode=ro, so the engine itself rejects
+writes; `query_only` additionally blocks write statements on the whole connection. `immutable=1`
+is for static snapshots only: SQLite then skips locking and change detection entirely, so the
+file must not be modified while connections are open (DBManager rebuilds its engines when the
+file is replaced, but in-place writes such as `rollups.py --refresh` would go unnoticed).
+"""
+import sqlite3
+from urllib.parse import quote
+
+class FileProfile:
+    def __init__(self, read_only=True, immutable=False, mmap_size=512 * 1024 * 1024, cache_size_kib=32 * 1024):
+        self.read_only = read_only
+        self.immutable = immutable
+        # Bytes of the file SQLite reads through mmap instead of read() into its own page cache
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+
+    def uri(self, path):
+        params = []
+        if self.read_only:
+            params.append("mode=ro")
+        if self.immutable:
+            params.append("immutable=1")
+        uri = "file:" + quote(path, safe="/:")
+        return uri + ("?" + "&".join(params) if params else "")
+
+    def schema_pragmas(self, schema):
+        return [
+            f"PRAGMA {schema}.mmap_size = {int(self.mmap_size)}",
+            # Negative cache_size is in KiB rather than pages
+            f"PRAGMA {schema}.cache_size = -{int(self.cache_size_kib)}",
+        ]
+
+DEFAULT_PROFILE = FileProfile()
+
+class ConnectionProfile:
+    """
+    FileProfile per database filename (DEFAULT_PROFILE for the rest) plus connection-wide settings.
+
+        ConnectionProfile({"db3_revenue.db": FileProfile(immutable=True)})
+    """
+    def __init__(self, files=None, default=DEFAULT_PROFILE, temp_store_memory=True):
+        self.files = dict(files or {})
+        self.default = default
+        self.temp_store_memory = temp_store_memory
+
+    def for_file(self, filename):
+        return self.files.get(filename, self.default)
+
+    @property
+    def read_only(self):
+        return self.default.read_only and all(p.read_only for p in self.files.values())
+
+    def connect(self, main_path, main_filename, attachments):
+        """
+        Open `main_path` and ATTACH [(alias, filename, path)], each through its profile's URI, and
+        apply the pragmas. Used as the SQLAlchemy engine `creator`.
+        """
+        profile = self.for_file(main_filename)
+        conn = sqlite3.connect(profile.uri(main_path), uri=True, check_same_thread=False)
+        for alias, filename, path in attachments:
+            self.attach(conn, alias, filename, path)
+        pragmas = profile.schema_pragmas("main")
+        if self.temp_store_memory:
+            # Sorts, GROUP BY and automatic indexes stay off disk
+            pragmas.append("PRAGMA temp_store = MEMORY")
+        if self.read_only:
+            pragmas.append("PRAGMA query_only = ON")
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def attach(self, conn, alias, filename, path):
+        """ATTACH one more file to an open connection through its profile's URI and pragmas."""
+        profile = self.for_file(filename)
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (profile.uri(path),))
+        for pragma in profile.schema_pragmas(alias):
+            conn.execute(pragma)
@@ -1,87 +1,241 @@
 import os
+import re
+import sqlite3
+import threading
 from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 from langchain_community.utilities import SQLDatabase
+from schema_cache import SchemaContextCache
+from metrics import REGISTRY
+from connection_profile import ConnectionProfile
+from sensor_partitions import SensorPartitions, default_partition_dir
+
+# Databases attached on top of db1_sensors.db for each role
+ROLE_ATTACHMENTS = {
+    "PlantDirector": [("maintenance", "db2_maintenance.db"), ("revenue", "db3_revenue.db")],
+    "MaintenanceManager": [("maintenance", "db2_maintenance.db")],
+    "RevenueAnalyst": [("revenue", "db3_revenue.db")],
+    "SensorViewer": [],
+}
+
+MAIN_DB_FILE = "db1_sensors.db"
 
 class CustomSQLDatabase(SQLDatabase):
-    def __init__(self, *args, custom_table_info_suffix="", **kwargs):
+    def __init__(self, *args, schema_cache=None, schema_files=None, role=None, sensor_partitions=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self._custom_table_info_suffix = custom_table_info_suffix
-    
+        self._schema_cache = schema_cache
+        self._schema_files = schema_files
+        self.role = role
+        # SensorPartitions when sensor_readings is stored per month, else None
+        self.sensor_partitions = sensor_partitions
+
+    def schema_context(self):
+        return self._schema_cache.get(self.role, self._schema_files)
+
+    def file_versions(self, query=None):
+        """
+        (schema, mtime_ns, size) for each database file; any rewrite changes it. With partitioned
+        sensor data only the partitions `query` reads are included (all of them without a query).
+        """
+        versions = []
+        for alias, path in self._schema_files:
+            st = os.stat(path)
+            versions.append((alias, st.st_mtime_ns, st.st_size))
+        if self.sensor_partitions is not None:
+            versions += self.sensor_partitions.versions(query)
+        return tuple(versions)
+
+    def denied_table(self, error):
+        """
+        True when a prepare error ("no such table: [schema.]table") names a database this role
+        does not attach, or a table that only exists in one; no rewrite or re-prompt can fix that.
+        """
+        m = re.match(r"^no such table: (?:(\w+)\.)?(\w+)$", error or "")
+        if m is None:
+            return False
+        schema, table = m.groups()
+        granted = {alias for alias, _ in ROLE_ATTACHMENTS[self.role]}
+        denied = {alias: filename for attachments in ROLE_ATTACHMENTS.values()
+                  for alias, filename in attachments if alias not in granted}
+        if schema is not None:
+            return schema in denied
+        data_dir = os.path.dirname(self._schema_files[0][1])
+        for filename in set(denied.values()):
+            try:
+                conn = sqlite3.connect(f"file:{os.path.join(data_dir, filename)}?mode=ro", uri=True)
+            except sqlite3.Error:
+                continue
+            try:
+                found = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)
+                ).fetchone()
+            except sqlite3.Error:
+                found = None
+            finally:
+                conn.close()
+            if found:
+                return True
+        return False
+
+    def bind_partitions(self, dbapi_connection, query):
+        """Attach the sensor partitions `query` needs; returns a PartitionBinding, or None if unpartitioned."""
+        if self.sensor_partitions is None:
+            return None
+        with REGISTRY.span("partitions", role=self.role):
+            binding = self.sensor_partitions.bind(
+                dbapi_connection, query, reserved_attachments=len(ROLE_ATTACHMENTS[self.role])
+            )
+        REGISTRY.observe("partitions_attached", len(binding.partitions), role=self.role)
+        return binding
+
+    @property
+    def schema_fingerprint(self) -> str:
+        return self.schema_context().fingerprint
+
     @property
     def table_info(self) -> str:
-        base_info = super().table_info
-        return base_info + self._custom_table_info_suffix
+        return self.schema_context().render()
+
+    def get_table_info(self, table_names=None) -> str:
+        with REGISTRY.span("schema", role=self.role):
+            return self.schema_context().render(table_names)
+
+class _PoolEntry:
+    """Long-lived engine + SQLDatabase for one role, tagged with the file signature it was built from."""
+    def __init__(self, engine, db, signature):
+        self.engine = engine
+        self.db = db
+        self.signature = signature
 
 class DBManager:
-    def __init__(self):
-        pass
+    def __init__(self, data_dir=None, pool_size=5, max_overflow=10, connection_profile=None, partition_dir=None):
+        if data_dir is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            data_dir = os.path.join(os.path.dirname(current_dir), 'data')
+        self.data_dir = data_dir
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        # Read-only URIs and mmap/cache pragmas, per database file
+        self.connection_profile = connection_profile or ConnectionProfile()
+        self.schema_cache = SchemaContextCache(os.path.join(data_dir, '.cache', 'schema_context.json'))
+        # sensor_readings is partitioned once data/sensor_partitions exists (sensor_partitions.py --migrate)
+        partition_dir = partition_dir or default_partition_dir(data_dir)
+        self.sensor_partitions = (
+            SensorPartitions(partition_dir, self.connection_profile) if os.path.isdir(partition_dir) else None
+        )
+
+        self._pool = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._build_locks = {}
+        # Checkouts are counted under their own lock: the listener fires while entries are built
+        self._checkout_lock = threading.Lock()
+        self._checkouts = 0
+
+    def _path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def role_files(self, role):
+        """Return [(schema_name, path)] for every database file the role's connections use."""
+        if role not in ROLE_ATTACHMENTS:
+            raise ValueError(f"Unknown role: {role}")
+        files = [("main", self._path(MAIN_DB_FILE))]
+        files += [(alias, self._path(filename)) for alias, filename in ROLE_ATTACHMENTS[role]]
+        return files
+
+    def file_signature(self, role):
+        """(schema, mtime_ns, size) per file; changes whenever a data/*.db file is rewritten."""
+        signature = []
+        for alias, path in self.role_files(role):
+            try:
+                st = os.stat(path)
+                signature.append((alias, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append((alias, None, None))
+        return tuple(signature)
 
     def get_db_for_session(self, role):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)
-        
-        path_sensors = os.path.join(project_root, 'data', 'db1_sensors.db')
-        path_maint = os.path.join(project_root, 'data', 'db2_maintenance.db')
-        path_revenue = os.path.join(project_root, 'data', 'db3_revenue.db')
-        
+        with REGISTRY.span("db_setup", role=role):
+            return self._get_db(role)
+
+    def _get_db(self, role):
+        signature = self.file_signature(role)
+        with self._lock:
+            entry = self._pool.get(role)
+            if entry is not None and entry.signature == signature:
+                self._stats["hits"] += 1
+                return entry.db
+            build_lock = self._build_locks.setdefault(role, threading.Lock())
+
+        # Built outside self._lock: reflection checks out a connection, whose listener takes locks too.
+        # The per-role build lock keeps concurrent first requests from building the same entry twice.
+        with build_lock:
+            with self._lock:
+                entry = self._pool.get(role)
+                if entry is not None and entry.signature == signature:
+                    self._stats["hits"] += 1
+                    return entry.db
+            entry = self._build_entry(role, signature)
+            with self._lock:
+                stale = self._pool.get(role)
+                self._pool[role] = entry
+                self._stats["misses"] += 1
+                if stale is not None:
+                    self._stats["invalidations"] += 1
+
+        if stale is not None:
+            # Connections already checked out keep working; idle ones are closed
+            stale.engine.dispose()
+        return entry.db
+
+    def invalidate(self, role=None):
+        """Drop pooled entries (all roles if role is None) so the next request rebuilds them."""
+        with self._lock:
+            roles = list(self._pool) if role is None else [role]
+            stale = [self._pool.pop(r) for r in roles if r in self._pool]
+            self._stats["invalidations"] += len(stale)
+        for entry in stale:
+            entry.engine.dispose()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pooled_roles"] = sorted(self._pool)
+        with self._checkout_lock:
+            stats["checkouts"] = self._checkouts
+        stats["schema_cache"] = self.schema_cache.get_stats()
+        if self.sensor_partitions is not None:
+            stats["sensor_partitions"] = [p.filename for p in self.sensor_partitions.partitions()]
+        return stats
+
+    def _build_entry(self, role, signature):
+        path_sensors = self._path(MAIN_DB_FILE)
+        attachments = [(alias, filename, self._path(filename)) for alias, filename in ROLE_ATTACHMENTS[role]]
+        profile = self.connection_profile
+
         # Layer 1: Read-Only Database Connection
-        # Note: SQLite read-only mode (?mode=ro) is difficult to enforce reliably with SQLAlchemy/pysqlite
-        # across all environments without URI issues. We will rely on Layers 2 & 3 (Validator & Prompt).
-        engine = create_engine(f"sqlite:///{path_sensors}")        
-        @event.listens_for(engine, "connect")
-        def connect(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            if role in ["MaintenanceManager", "PlantDirector"]:
-                cursor.execute(f"ATTACH DATABASE '{path_maint}' AS maintenance")
-            if role in ["RevenueAnalyst", "PlantDirector"]:
-                cursor.execute(f"ATTACH DATABASE '{path_revenue}' AS revenue")
-            cursor.close()
-
-        custom_table_info = ""
-        
-        if role in ["MaintenanceManager", "PlantDirector"]:
-            custom_table_info += """
-
-CREATE TABLE maintenance.work_orders (
-    order_id TEXT,
-    asset_id TEXT,
-    employee_id TEXT,
-    status TEXT,
-    priority TEXT,
-    cost REAL,
-    date_logged TIMESTAMP
-)
-
-/*
-2 rows from maintenance.work_orders table:
-order_id        asset_id        employee_id     status          priority        cost            date_logged
-WO-1000         AST-051         EMP-115         Closed          Low             976.66          2025-05-10 03:37:14.300091
-WO-1001         AST-002         EMP-150         Closed          Medium          429.06          2024-12-24 03:37:14.300106
-*/
-"""
-        
-        if role in ["RevenueAnalyst", "PlantDirector"]:
-            custom_table_info += """
-
-CREATE TABLE revenue.asset_revenue (
-    revenue_id TEXT,
-    asset_id TEXT,
-    quarter TEXT,
-    amount_usd REAL,
-    region TEXT
-)
-
-/*
-2 rows from revenue.asset_revenue table:
-revenue_id      asset_id        quarter         amount_usd      region
-4d29f4ea        AST-006         2024-Q1         6316.72         North America
-c332942e        AST-019         2024-Q1         9836.26         APAC
-*/
-"""
-        
-        # Create custom SQLDatabase with attached table info
-        return CustomSQLDatabase(
+        # Every file is opened/attached as a mode=ro URI with query_only set, so writes fail in SQLite itself.
+        # A creator is used because the URL form would make SQLAlchemy pick its in-memory pool.
+        engine = create_engine(
+            "sqlite://",
+            creator=lambda: profile.connect(path_sensors, MAIN_DB_FILE, attachments),
+            poolclass=QueuePool,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+        )
+
+        @event.listens_for(engine, "checkout")
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._checkout_lock:
+                self._checkouts += 1
+
+        # Schema context is rendered once per (role, file versions) by the shared cache
+        db = CustomSQLDatabase(
             engine=engine,
-            sample_rows_in_table_info=2,
-            custom_table_info_suffix=custom_table_info
+            lazy_table_reflection=True,
+            schema_cache=self.schema_cache,
+            schema_files=self.role_files(role),
+            role=role,
+            sensor_partitions=self.sensor_partitions,
         )
+        return _PoolEntry(engine, db, signature)
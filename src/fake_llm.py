@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Dict
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from query_cache import normalize_question
+
+class CannedSQLChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOllama: answers the `Question:` in the prompt with canned SQL
+    after an artificial delay, so benchmarks exercise the full chain without a model server.
+    Streaming yields one whitespace-separated token at a time, `seconds_per_token` apart.
+    """
+    responses: Dict[str, str] = {}
+    default_sql: str = "SELECT asset_id FROM assets_shared LIMIT 5;"
+    latency: float = 0.0
+    seconds_per_token: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "canned-sql"
+
+    def _answer(self, messages):
+        prompt = messages[-1].content
+        question = prompt.rsplit("Question:", 1)[-1].split("SQLQuery:", 1)[0]
+        sql = self.responses.get(normalize_question(question), self.default_sql)
+        delay = self.latency + self.seconds_per_token * len(sql.split())
+        return sql, delay
+
+    def _result(self, sql):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=sql))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        sql, delay = self._answer(messages)
+        if delay:
+            time.sleep(delay)
+        return self._result(sql)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        sql, delay = self._answer(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._result(sql)
+
+    def _tokens(self, messages):
+        sql, _ = self._answer(messages)
+        pieces = sql.split(" ")
+        return [piece + " " for piece in pieces[:-1]] + pieces[-1:]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for piece in self._tokens(messages):
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for piece in self._tokens(messages):
+            if self.seconds_per_token:
+                await asyncio.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
@@ -1,9 +1,29 @@
+"""
+Generates the three SQLite databases.
+
+Rows are produced in fixed-size, vectorized NumPy chunks and streamed into SQLite with
+executemany inside one large transaction, so memory stays flat regardless of row count.
+The three databases are built in parallel processes. Output is deterministic for a given
+--seed and --anchor (the timestamp the newest reading is anchored to).
+
+    cd src
+    python generate_data.py                       # default sizes
+    python generate_data.py --scale-factor 2000   # ~100M sensor rows
+"""
+import argparse
+import os
 import sqlite3
-import pandas as pd
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
 import numpy as np
+import pandas as pd
 from faker import Faker
-import os
-from datetime import datetime, timedelta
+
+from index_advisor import BASELINE_INDEXES, ensure_indexes
+from rollups import refresh_rollups
+from sensor_partitions import PartitionWriter, SensorPartitions, default_partition_dir
 
 NUM_ASSETS = 100
 NUM_EMPLOYEES = 200
@@ -12,130 +32,221 @@ SENSOR_ROWS = 50000
 WORK_ORDER_ROWS = 2000
 REVENUE_ROWS = 1000
 
-fake = Faker()
-np.random.seed(42)
+# Rows per generated chunk; also the unit of the per-chunk random streams
+CHUNK_ROWS = 100_000
+# Readings are spread over the same window at any scale (one every 5 minutes at scale 1)
+SENSOR_WINDOW_SECONDS = SENSOR_ROWS * 5 * 60
+
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+SCHEMAS = {
+    "assets_shared": "asset_id TEXT, name TEXT, location TEXT, department TEXT, criticality TEXT",
+    "employees_shared": "employee_id TEXT, name TEXT, role TEXT, clearance_level TEXT",
+    "sensor_readings": "reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, temperature REAL, vibration REAL",
+    "work_orders": (
+        "order_id TEXT, asset_id TEXT, employee_id TEXT, status TEXT, priority TEXT, cost REAL, date_logged TIMESTAMP"
+    ),
+    "asset_revenue": "revenue_id TEXT, asset_id TEXT, quarter TEXT, amount_usd REAL, region TEXT",
+}
 
-def ensure_directory():
-    if not os.path.exists('data'):
-        os.makedirs('data')
+def ensure_directory(out_dir='data'):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
 
-def generate_master_data():
+def _rng(seed, *stream):
+    # Independent, reproducible stream per (seed, database, chunk)
+    return np.random.default_rng([seed, *stream])
+
+def _format_timestamps(values):
+    return np.char.replace(np.datetime_as_string(values, unit='us'), 'T', ' ')
+
+def generate_master_data(seed):
     print("Generating Master Data...")
-    
+    rng = _rng(seed, 0)
+    fake = Faker()
+    fake.seed_instance(seed)
+
     assets = pd.DataFrame({
         'asset_id': [f'AST-{i:03d}' for i in range(1, NUM_ASSETS + 1)],
         'name': [f'Machine-{fake.word().capitalize()}-{i}' for i in range(1, NUM_ASSETS + 1)],
-        'location': np.random.choice(['Plant-Austin', 'Plant-Berlin', 'Plant-Tokyo'], NUM_ASSETS),
-        'department': np.random.choice(['Assembly', 'Welding', 'Painting', 'Packaging'], NUM_ASSETS),
-        'criticality': np.random.choice(['High', 'Medium', 'Low'], NUM_ASSETS, p=[0.2, 0.5, 0.3])
+        'location': rng.choice(['Plant-Austin', 'Plant-Berlin', 'Plant-Tokyo'], NUM_ASSETS),
+        'department': rng.choice(['Assembly', 'Welding', 'Painting', 'Packaging'], NUM_ASSETS),
+        'criticality': rng.choice(['High', 'Medium', 'Low'], NUM_ASSETS, p=[0.2, 0.5, 0.3])
     })
-    
+
     employees = pd.DataFrame({
         'employee_id': [f'EMP-{i:03d}' for i in range(1, NUM_EMPLOYEES + 1)],
         'name': [fake.name() for _ in range(NUM_EMPLOYEES)],
-        'role': np.random.choice(['Operator', 'Technician', 'Engineer', 'Manager'], NUM_EMPLOYEES, p=[0.4, 0.3, 0.2, 0.1]),
-        'clearance_level': np.random.choice(['L1', 'L2', 'L3', 'L4'], NUM_EMPLOYEES, p=[0.4, 0.3, 0.2, 0.1])
+        'role': rng.choice(['Operator', 'Technician', 'Engineer', 'Manager'], NUM_EMPLOYEES, p=[0.4, 0.3, 0.2, 0.1]),
+        'clearance_level': rng.choice(['L1', 'L2', 'L3', 'L4'], NUM_EMPLOYEES, p=[0.4, 0.3, 0.2, 0.1])
     })
 
     return assets, employees
 
-def get_db_subset(df, subset_size, core_df):
-    core_ids = core_df.index.tolist()
-    remaining_pool = df.index.difference(core_ids)
+def get_db_subset(df, subset_size, core_size, rng):
+    core_ids = df.index[:core_size].to_numpy()
+    remaining_pool = df.index[core_size:].to_numpy()
     random_count = subset_size - len(core_ids)
-    
+
     if random_count > 0:
-        random_selection = np.random.choice(remaining_pool, random_count, replace=False)
+        random_selection = rng.choice(remaining_pool, random_count, replace=False)
         final_indices = np.concatenate([core_ids, random_selection])
     else:
         final_indices = core_ids
 
     return df.loc[final_indices].copy()
 
-def create_sensor_db(assets, employees, core_assets, core_employees):
+def _open_for_bulk_load(path):
+    # Build next to the target and swap in at the end, so readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    for pragma in BULK_LOAD_PRAGMAS:
+        conn.execute(pragma)
+    conn.execute("BEGIN")
+    return conn, tmp_path
+
+def _finish_bulk_load(conn, tmp_path, path, index_key):
+    conn.execute("COMMIT")
+    # Indexes are cheaper to build once after the load than to maintain row by row
+    ensure_indexes(conn, BASELINE_INDEXES[index_key])
+    conn.close()
+    os.replace(tmp_path, path)
+
+def _create_table(conn, table):
+    conn.execute(f"CREATE TABLE {table} ({SCHEMAS[table]})")
+
+def _insert_frame(conn, table, df):
+    placeholders = ", ".join("?" * len(df.columns))
+    conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", df.itertuples(index=False, name=None))
+
+def _insert_columns(conn, table, columns):
+    placeholders = ", ".join("?" * len(columns))
+    conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", zip(*(c.tolist() for c in columns)))
+
+def create_sensor_db(out_dir, seed, scale_factor, anchor, assets, employees):
     print("Creating DB1: Sensor Data...")
-    path = 'data/db1_sensors.db'
+    path = os.path.join(out_dir, 'db1_sensors.db')
+    conn, tmp_path = _open_for_bulk_load(path)
+
+    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.8), CORE_OVERLAP_SIZE, _rng(seed, 1))
+    for table, df in (('assets_shared', db_assets), ('employees_shared', employees)):
+        _create_table(conn, table)
+        _insert_frame(conn, table, df)
+
+    _create_table(conn, 'sensor_readings')
+    asset_ids = db_assets['asset_id'].to_numpy()
+    total_rows = int(SENSOR_ROWS * scale_factor)
+    step_us = SENSOR_WINDOW_SECONDS * 1_000_000 // max(total_rows, 1)
+    anchor_us = np.datetime64(anchor, 'us')
+
+    for chunk, start in enumerate(range(0, total_rows, CHUNK_ROWS)):
+        n = min(CHUNK_ROWS, total_rows - start)
+        rng = _rng(seed, 1, chunk + 1)
+        offsets = np.arange(start, start + n, dtype=np.int64)
+
+        temperature = rng.normal(75, 5, n)
+        vibration = rng.exponential(1.5, n)
+        temperature[vibration > 5.0] += 20
+
+        _insert_columns(conn, 'sensor_readings', [
+            offsets + 1,
+            rng.choice(asset_ids, n),
+            _format_timestamps(anchor_us - (offsets * step_us).astype('timedelta64[us]')),
+            temperature,
+            vibration,
+        ])
+
+    _finish_bulk_load(conn, tmp_path, path, 'db1_sensors.db')
     conn = sqlite3.connect(path)
-    
-    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.8), core_assets)
-    db_assets.to_sql('assets_shared', conn, if_exists='replace', index=False)
-    employees.to_sql('employees_shared', conn, if_exists='replace', index=False)
-
-    readings = pd.DataFrame({
-        'reading_id': range(1, SENSOR_ROWS + 1),
-        'asset_id': np.random.choice(db_assets['asset_id'], SENSOR_ROWS),
-        'timestamp': [datetime.now() - timedelta(minutes=x*5) for x in range(SENSOR_ROWS)]
-    })
-    
-    readings['temperature'] = np.random.normal(75, 5, SENSOR_ROWS)
-    readings['vibration'] = np.random.exponential(1.5, SENSOR_ROWS)
-    
-    mask = (readings['vibration'] > 5.0)
-    readings.loc[mask, 'temperature'] += 20
-    
-    readings.to_sql('sensor_readings', conn, if_exists='replace', index=False)
+    refresh_rollups(conn, rebuild=True)
     conn.close()
+    return path, total_rows
 
-def create_maintenance_db(assets, employees, core_assets, core_employees):
+def create_maintenance_db(out_dir, seed, scale_factor, anchor, assets, employees):
     print("Creating DB2: Maintenance Data...")
-    path = 'data/db2_maintenance.db'
-    conn = sqlite3.connect(path)
-    
-    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.6), core_assets)
-    db_employees = get_db_subset(employees, int(NUM_EMPLOYEES * 0.5), core_employees)
-    
-    db_assets.to_sql('assets_shared', conn, if_exists='replace', index=False)
-    db_employees.to_sql('employees_shared', conn, if_exists='replace', index=False)
-
-    orders = pd.DataFrame({
-        'order_id': [f'WO-{1000+i}' for i in range(WORK_ORDER_ROWS)],
-        'asset_id': np.random.choice(db_assets['asset_id'], WORK_ORDER_ROWS),
-        'employee_id': np.random.choice(db_employees['employee_id'], WORK_ORDER_ROWS),
-        'status': np.random.choice(['Open', 'In Progress', 'Closed', 'Blocked'], WORK_ORDER_ROWS, p=[0.1, 0.2, 0.6, 0.1]),
-        'priority': np.random.choice(['Critical', 'High', 'Medium', 'Low'], WORK_ORDER_ROWS),
-        'cost': np.round(np.random.lognormal(6, 0.5, WORK_ORDER_ROWS), 2),
-        'date_logged': [datetime.now() - timedelta(days=np.random.randint(0, 365)) for _ in range(WORK_ORDER_ROWS)]
-    })
+    path = os.path.join(out_dir, 'db2_maintenance.db')
+    conn, tmp_path = _open_for_bulk_load(path)
 
-    orders.to_sql('work_orders', conn, if_exists='replace', index=False)
-    conn.close()
+    subset_rng = _rng(seed, 2)
+    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.6), CORE_OVERLAP_SIZE, subset_rng)
+    db_employees = get_db_subset(employees, int(NUM_EMPLOYEES * 0.5), CORE_OVERLAP_SIZE, subset_rng)
+    for table, df in (('assets_shared', db_assets), ('employees_shared', db_employees)):
+        _create_table(conn, table)
+        _insert_frame(conn, table, df)
+
+    _create_table(conn, 'work_orders')
+    asset_ids = db_assets['asset_id'].to_numpy()
+    employee_ids = db_employees['employee_id'].to_numpy()
+    total_rows = int(WORK_ORDER_ROWS * scale_factor)
+    anchor_us = np.datetime64(anchor, 'us')
 
-def create_revenue_db(assets, employees, core_assets, core_employees):
+    for chunk, start in enumerate(range(0, total_rows, CHUNK_ROWS)):
+        n = min(CHUNK_ROWS, total_rows - start)
+        rng = _rng(seed, 2, chunk + 1)
+        order_numbers = np.arange(1000 + start, 1000 + start + n)
+        days_ago = rng.integers(0, 365, n).astype('timedelta64[D]').astype('timedelta64[us]')
+
+        _insert_columns(conn, 'work_orders', [
+            np.char.add('WO-', order_numbers.astype(str)),
+            rng.choice(asset_ids, n),
+            rng.choice(employee_ids, n),
+            rng.choice(['Open', 'In Progress', 'Closed', 'Blocked'], n, p=[0.1, 0.2, 0.6, 0.1]),
+            rng.choice(['Critical', 'High', 'Medium', 'Low'], n),
+            np.round(rng.lognormal(6, 0.5, n), 2),
+            _format_timestamps(anchor_us - days_ago),
+        ])
+
+    _finish_bulk_load(conn, tmp_path, path, 'db2_maintenance.db')
+    return path, total_rows
+
+def create_revenue_db(out_dir, seed, scale_factor, anchor, assets, employees):
     print("Creating DB3: Revenue Data...")
-    path = 'data/db3_revenue.db'
-    conn = sqlite3.connect(path)
-    
-    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.5), core_assets)
-    db_assets.to_sql('assets_shared', conn, if_exists='replace', index=False)
-    
-    revenue = []
+    path = os.path.join(out_dir, 'db3_revenue.db')
+    conn, tmp_path = _open_for_bulk_load(path)
+
+    db_assets = get_db_subset(assets, int(NUM_ASSETS * 0.5), CORE_OVERLAP_SIZE, _rng(seed, 3))
+    _create_table(conn, 'assets_shared')
+    _insert_frame(conn, 'assets_shared', db_assets)
+
+    _create_table(conn, 'asset_revenue')
+    asset_ids = db_assets['asset_id'].to_numpy()
+    base_revenue = np.where(db_assets['criticality'].to_numpy() == 'High', 50000, 10000)
     quarters = ['2024-Q1', '2024-Q2', '2024-Q3', '2024-Q4']
-    
-    for _ in range(REVENUE_ROWS):
-        asset = np.random.choice(db_assets['asset_id'])
-        is_critical = db_assets.loc[db_assets['asset_id'] == asset, 'criticality'].iloc[0] == 'High'
-        base_rev = 50000 if is_critical else 10000
-        
-        revenue.append({
-            'revenue_id': fake.uuid4()[:8],
-            'asset_id': asset,
-            'quarter': np.random.choice(quarters),
-            'amount_usd': np.round(np.random.normal(base_rev, 5000), 2),
-            'region': np.random.choice(['North America', 'EMEA', 'APAC'])
-        })
-        
-    pd.DataFrame(revenue).to_sql('asset_revenue', conn, if_exists='replace', index=False)
-    conn.close()
+    total_rows = int(REVENUE_ROWS * scale_factor)
+
+    for chunk, start in enumerate(range(0, total_rows, CHUNK_ROWS)):
+        n = min(CHUNK_ROWS, total_rows - start)
+        rng = _rng(seed, 3, chunk + 1)
+        asset_index = rng.integers(0, len(asset_ids), n)
+
+        _insert_columns(conn, 'asset_revenue', [
+            np.char.mod('%08x', rng.integers(0, 2**32, n, dtype=np.uint64)),
+            asset_ids[asset_index],
+            rng.choice(quarters, n),
+            np.round(rng.normal(base_revenue[asset_index], 5000), 2),
+            rng.choice(['North America', 'EMEA', 'APAC'], n),
+        ])
 
-def test_cross_db_query():
+    _finish_bulk_load(conn, tmp_path, path, 'db3_revenue.db')
+    return path, total_rows
+
+def test_cross_db_query(out_dir='data'):
     print("\nValidating cross-database joins...")
     try:
-        conn = sqlite3.connect('data/db1_sensors.db')
-        conn.execute("ATTACH DATABASE 'data/db2_maintenance.db' AS maintenance")
-        conn.execute("ATTACH DATABASE 'data/db3_revenue.db' AS revenue")
-        
+        conn = sqlite3.connect(os.path.join(out_dir, 'db1_sensors.db'))
+        conn.execute("ATTACH DATABASE ? AS maintenance", (os.path.join(out_dir, 'db2_maintenance.db'),))
+        conn.execute("ATTACH DATABASE ? AS revenue", (os.path.join(out_dir, 'db3_revenue.db'),))
+
         query = """
-        SELECT 
+        SELECT
             s.asset_id,
             AVG(s.vibration) as avg_vibration,
             COUNT(w.order_id) as maintenance_count,
@@ -147,7 +258,7 @@ def test_cross_db_query():
         ORDER BY avg_vibration DESC
         LIMIT 5;
         """
-        
+
         df = pd.read_sql(query, conn)
         print("Success! Top 5 assets across all databases:")
         print(df)
@@ -155,12 +266,56 @@ def test_cross_db_query():
     except Exception as e:
         print(f"Validation failed: {e}")
 
+def repartition(out_dir):
+    """
+    Once sensor_readings is partitioned, queries read data/sensor_partitions/ rather than
+    db1_sensors.db, so partitions left by an earlier run would hide the new readings. Replace
+    them with the new readings.
+    """
+    partitions = SensorPartitions(default_partition_dir(out_dir))
+    stale = partitions.partitions()
+    if not stale:
+        return
+    print(f"Replacing {len(stale)} sensor partitions from an earlier run...")
+    for p in stale:
+        os.remove(p.path)
+    writer = PartitionWriter(partitions)
+    moved = writer.migrate(os.path.join(out_dir, "db1_sensors.db"))
+    print(f"  Moved {moved:,} readings into {len(partitions.partitions())} partitions")
+
+def _default_anchor():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale-factor", type=float, default=1.0, help="multiplier for sensor, work order and revenue rows")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--anchor", default=_default_anchor(), help="ISO timestamp of the newest reading (default: today 00:00 UTC)")
+    parser.add_argument("--out-dir", default="data")
+    parser.add_argument("--workers", type=int, default=3, help="parallel processes (one per database)")
+    parser.add_argument("--skip-validation", action="store_true")
+    args = parser.parse_args()
+
+    ensure_directory(args.out_dir)
+    anchor = datetime.fromisoformat(args.anchor)
+    all_assets, all_employees = generate_master_data(args.seed)
+
+    start = time.perf_counter()
+    builders = [create_sensor_db, create_maintenance_db, create_revenue_db]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(build, args.out_dir, args.seed, args.scale_factor, anchor, all_assets, all_employees)
+            for build in builders
+        ]
+        for future in futures:
+            path, rows = future.result()
+            print(f"  {path}: {rows:,} rows")
+    print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+    if not args.skip_validation:
+        test_cross_db_query(args.out_dir)
+    repartition(args.out_dir)
+
 if __name__ == "__main__":
-    ensure_directory()
-    all_assets, all_employees = generate_master_data()
-    core_assets = all_assets.head(CORE_OVERLAP_SIZE)
-    core_employees = all_employees.head(CORE_OVERLAP_SIZE)
-    create_sensor_db(all_assets, all_employees, core_assets, core_employees)
-    create_maintenance_db(all_assets, all_employees, core_assets, core_employees)
-    create_revenue_db(all_assets, all_employees, core_assets, core_employees)
-    test_cross_db_query()
\ No newline at end of file
+    main()
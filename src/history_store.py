@@ -0,0 +1,190 @@
+"""
+Chat-history result store: a small in-memory preview per message, full results spilled to disk.
+
+Full results are written as one gzip-compressed pickle of the columnar layout (column names plus
+one list per column, as produced by query_executor), so nothing per-row is kept in the Streamlit
+session. Files are evicted LRU against a per-session and a process-wide byte budget; an evicted
+message keeps its preview. A session's files are dropped when its chat is cleared, or once it
+has been idle for `session_idle_seconds` (Streamlit has no session-end hook). Each process writes to its own subdirectory, removed on exit, and
+leftovers from dead processes are cleared on start-up.
+"""
+import atexit
+import gzip
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+DEFAULT_PREVIEW_ROWS = 100
+_DEFAULT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.cache', 'results'
+)
+
+class StoredResult:
+    def __init__(self, key, preview, row_count):
+        self.key = key
+        # DataFrame with the first preview rows; kept in session state
+        self.preview = preview
+        self.row_count = row_count
+
+class _Entry:
+    def __init__(self, session_id, path, nbytes):
+        self.session_id = session_id
+        self.path = path
+        self.nbytes = nbytes
+
+class ResultStore:
+    def __init__(self, directory=None, preview_rows=DEFAULT_PREVIEW_ROWS, session_max_bytes=64 * 1024 * 1024,
+                 max_bytes=512 * 1024 * 1024, loaded_entries=4, session_idle_seconds=6 * 3600):
+        base = directory or _DEFAULT_DIR
+        _remove_dead_process_dirs(base)
+        self.directory = os.path.join(base, str(os.getpid()))
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(shutil.rmtree, self.directory, True)
+
+        self.preview_rows = preview_rows
+        self.session_max_bytes = session_max_bytes
+        self.max_bytes = max_bytes
+        self.loaded_entries = loaded_entries
+        self.session_idle_seconds = session_idle_seconds
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Recently loaded full DataFrames, so paging through one result does not re-read the file
+        self._loaded = OrderedDict()
+        self._session_bytes = {}
+        # session_id -> last time the session ran (see touch)
+        self._session_seen = {}
+        self.current_bytes = 0
+        self._stats = {"stores": 0, "loads": 0, "load_hits": 0, "evictions": 0, "missing": 0, "preview_only": 0,
+                       "sessions_dropped": 0}
+
+    def put(self, session_id, result):
+        """Store a ColumnarResult; returns a StoredResult whose preview goes into the chat history."""
+        n = min(self.preview_rows, result.row_count)
+        preview = pd.DataFrame({c: result.data[c][:n] for c in result.columns}, columns=result.columns)
+        key = uuid.uuid4().hex
+        if result.row_count <= n:
+            # The preview already is the full result
+            with self._lock:
+                self._stats["preview_only"] += 1
+            return StoredResult(None, preview, result.row_count)
+
+        path = os.path.join(self.directory, f"{key}.pkl.gz")
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=1) as f:
+            pickle.dump({"columns": result.columns, "data": result.data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        nbytes = os.path.getsize(path)
+
+        with self._lock:
+            self._entries[key] = _Entry(session_id, path, nbytes)
+            self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + nbytes
+            self.current_bytes += nbytes
+            self._stats["stores"] += 1
+            self._evict(session_id)
+        return StoredResult(key, preview, result.row_count)
+
+    def load(self, key):
+        """Full DataFrame for a stored result, or None if it was evicted."""
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                self._stats["load_hits"] += 1
+                return self._loaded[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["missing"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["loads"] += 1
+        try:
+            with gzip.open(entry.path, "rb") as f:
+                raw = pickle.load(f)
+        except OSError:
+            # Evicted concurrently
+            return None
+        df = pd.DataFrame(raw["data"], columns=raw["columns"])
+        with self._lock:
+            self._loaded[key] = df
+            while len(self._loaded) > self.loaded_entries:
+                self._loaded.popitem(last=False)
+        return df
+
+    def touch(self, session_id, now=None):
+        """
+        Mark `session_id` as active and drop the files of sessions idle for longer than
+        session_idle_seconds; call once per script run. Returns the dropped session ids.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._session_seen[session_id] = now
+            idle = [s for s, seen in self._session_seen.items() if now - seen > self.session_idle_seconds]
+            for s in idle:
+                self._drop(s)
+        return idle
+
+    def drop_session(self, session_id):
+        """Delete every file of `session_id` (its chat was cleared or the session ended)."""
+        with self._lock:
+            self._drop(session_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["disk_bytes"] = self.current_bytes
+            stats["sessions"] = len(self._session_bytes)
+        return stats
+
+    def _drop(self, session_id):
+        for key in [k for k, e in self._entries.items() if e.session_id == session_id]:
+            self._remove(key)
+        if self._session_seen.pop(session_id, None) is not None:
+            self._stats["sessions_dropped"] += 1
+
+    def _evict(self, session_id):
+        # Oldest entries of the session first, then oldest overall; the newest entry always stays
+        for key, entry in list(self._entries.items())[:-1]:
+            if self._session_bytes.get(session_id, 0) <= self.session_max_bytes:
+                break
+            if entry.session_id == session_id:
+                self._remove(key)
+                self._stats["evictions"] += 1
+        for key in list(self._entries)[:-1]:
+            if self.current_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._loaded.pop(key, None)
+        self.current_bytes -= entry.nbytes
+        remaining = self._session_bytes.get(entry.session_id, 0) - entry.nbytes
+        if remaining > 0:
+            self._session_bytes[entry.session_id] = remaining
+        else:
+            self._session_bytes.pop(entry.session_id, None)
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def _remove_dead_process_dirs(base):
+    if not os.path.isdir(base):
+        return
+    for name in os.listdir(base):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+        except OSError:
+            pass
@@ -0,0 +1,262 @@
+"""
+Index management for the SQLite files.
+
+BASELINE_INDEXES covers the join and filter columns every role uses (asset_id, timestamp,
+quarter, status); generate_data.py builds them, and `--baseline` adds them to existing files.
+IndexAdvisor watches EXPLAIN QUERY PLAN for the SQL the LLM actually generates and proposes
+(or applies) covering indexes for tables that keep getting scanned.
+
+    cd src
+    python index_advisor.py --baseline
+    python index_advisor.py --slow-log slow_queries.jsonl --apply
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+BASELINE_INDEXES = {
+    "db1_sensors.db": [
+        ("sensor_readings", ("asset_id", "timestamp")),
+        ("sensor_readings", ("timestamp",)),
+        ("assets_shared", ("asset_id",)),
+        ("employees_shared", ("employee_id",)),
+    ],
+    "db2_maintenance.db": [
+        ("work_orders", ("asset_id",)),
+        ("work_orders", ("status",)),
+        ("work_orders", ("employee_id",)),
+        ("assets_shared", ("asset_id",)),
+        ("employees_shared", ("employee_id",)),
+    ],
+    "db3_revenue.db": [
+        ("asset_revenue", ("asset_id",)),
+        ("asset_revenue", ("quarter",)),
+        ("assets_shared", ("asset_id",)),
+    ],
+}
+
+MAX_INDEX_COLUMNS = 4
+
+_SQL_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "cross", "outer", "natural", "on", "using", "group",
+    "order", "limit", "having", "union", "except", "intersect", "window", "as",
+}
+_TABLE_REF_RE = re.compile(
+    r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)?)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE
+)
+# A bare "SCAN t" is a full table scan; "SCAN t USING INDEX ..." already walks an index
+_SCAN_RE = re.compile(r"^SCAN (\w+)$")
+_AUTO_INDEX_RE = re.compile(r"^SEARCH (\w+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \(([^)]*)\)")
+
+def index_name(table, columns):
+    return f"idx_{table}_{'_'.join(columns)}"
+
+def ensure_indexes(conn, specs):
+    """Create (table, columns) indexes if missing and refresh planner statistics."""
+    for table, columns in specs:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON {table} ({', '.join(columns)})"
+        )
+    conn.execute("ANALYZE")
+    conn.commit()
+
+def table_aliases(sql):
+    """{alias: (schema, table)} for every FROM/JOIN reference; unaliased tables map to themselves."""
+    aliases = {}
+    for ref, alias in _TABLE_REF_RE.findall(sql):
+        schema, _, table = ref.rpartition(".")
+        if not alias or alias.lower() in _SQL_KEYWORDS:
+            alias = table
+        aliases[alias] = (schema or "main", table)
+    return aliases
+
+def _split_select_list(sql):
+    match = re.search(r"\bFROM\b", sql, re.IGNORECASE)
+    if match is None:
+        return sql, ""
+    return sql[:match.start()], sql[match.start():]
+
+def _column_refs(text, alias):
+    seen = []
+    for column in re.findall(rf"\b{re.escape(alias)}\.(\w+)", text):
+        if column not in seen:
+            seen.append(column)
+    return seen
+
+class IndexRecommendation:
+    def __init__(self, schema, table, columns, occurrences, rows):
+        self.schema = schema
+        self.table = table
+        self.columns = columns
+        self.occurrences = occurrences
+        self.rows = rows
+
+    @property
+    def sql(self):
+        prefix = "" if self.schema == "main" else f"{self.schema}."
+        return f"CREATE INDEX IF NOT EXISTS {prefix}{index_name(self.table, self.columns)} ON {self.table} ({', '.join(self.columns)})"
+
+    def to_dict(self):
+        return {"schema": self.schema, "table": self.table, "columns": list(self.columns),
+                "occurrences": self.occurrences, "rows": self.rows, "sql": self.sql}
+
+class IndexAdvisor:
+    """
+    Collects EXPLAIN QUERY PLAN for executed SQL and counts full scans / automatic indexes per
+    (schema, table, candidate columns). Candidates are the columns the query filters, joins,
+    groups or orders by, followed by the selected columns of that table (covering index).
+    """
+    def __init__(self, min_occurrences=3, min_rows=10000):
+        self.min_occurrences = min_occurrences
+        self.min_rows = min_rows
+        self._lock = threading.Lock()
+        self._candidates = Counter()
+        self._row_counts = {}
+        self.plans_seen = 0
+
+    def observe(self, dbapi_connection, sql, plan=None):
+        """
+        `plan` is the statement's EXPLAIN QUERY PLAN detail strings when the caller already has
+        them (SQLCheck.plan); only without it is the statement prepared again here.
+        """
+        if plan is None:
+            try:
+                plan = [row[-1] for row in dbapi_connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+            except sqlite3.Error:
+                return []
+        found = self._candidates_from_plan(sql, plan)
+        with self._lock:
+            self.plans_seen += 1
+            for schema, table, columns in found:
+                self._candidates[(schema, table, columns)] += 1
+                if (schema, table) not in self._row_counts:
+                    self._row_counts[(schema, table)] = table_row_count(dbapi_connection, schema, table)
+        return found
+
+    def recommendations(self):
+        with self._lock:
+            items = list(self._candidates.items())
+            row_counts = dict(self._row_counts)
+        recs = [
+            IndexRecommendation(schema, table, columns, count, row_counts.get((schema, table)))
+            for (schema, table, columns), count in items
+            if count >= self.min_occurrences and (row_counts.get((schema, table)) or 0) >= self.min_rows
+        ]
+        return sorted(recs, key=lambda r: (r.occurrences, r.rows or 0), reverse=True)
+
+    def apply(self, recommendations, files):
+        """Create the indexes in the files they belong to. `files` is [(schema, path)] as from DBManager.role_files."""
+        paths = dict(files)
+        applied = []
+        for rec in recommendations:
+            path = paths.get(rec.schema)
+            if path is None:
+                continue
+            # The pooled connections may be read-only, so write through a dedicated connection
+            conn = sqlite3.connect(path)
+            try:
+                ensure_indexes(conn, [(rec.table, rec.columns)])
+            finally:
+                conn.close()
+            applied.append(rec)
+            with self._lock:
+                self._candidates.pop((rec.schema, rec.table, rec.columns), None)
+        return applied
+
+    def _candidates_from_plan(self, sql, plan):
+        aliases = table_aliases(sql)
+        select_list, rest = _split_select_list(sql)
+        found = []
+        for detail in plan:
+            auto = _AUTO_INDEX_RE.match(detail)
+            scan = _SCAN_RE.match(detail)
+            if auto:
+                alias = auto.group(1)
+                keys = [part.split("=")[0].strip() for part in auto.group(2).split(" AND ")]
+            elif scan:
+                alias = scan.group(1)
+                keys = None
+            else:
+                continue
+            if alias not in aliases:
+                continue
+            schema, table = aliases[alias]
+            if keys is None:
+                keys = _column_refs(rest, alias)
+            if not keys:
+                continue
+            covering = [c for c in _column_refs(select_list, alias) if c not in keys]
+            columns = tuple((keys + covering)[:MAX_INDEX_COLUMNS])
+            found.append((schema, table, columns))
+        return found
+
+def table_row_count(conn, schema, table):
+    """Row count from sqlite_stat1 when ANALYZE has run, COUNT(*) otherwise; None if unreadable."""
+    try:
+        row = conn.execute(
+            # The first number of any stat row for the table is its row count
+            f"SELECT stat FROM {schema}.sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)
+        ).fetchone()
+        if row is not None:
+            return int(row[0].split()[0])
+    except sqlite3.Error:
+        pass
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+def _data_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=_data_dir())
+    parser.add_argument("--baseline", action="store_true", help="add BASELINE_INDEXES to the existing files")
+    parser.add_argument("--slow-log", help="JSON-lines slow-query log to replay through the advisor")
+    parser.add_argument("--min-occurrences", type=int, default=3)
+    parser.add_argument("--min-rows", type=int, default=10000)
+    parser.add_argument("--apply", action="store_true", help="create the recommended indexes")
+    args = parser.parse_args()
+
+    if args.baseline:
+        for filename, specs in BASELINE_INDEXES.items():
+            conn = sqlite3.connect(os.path.join(args.data_dir, filename))
+            try:
+                ensure_indexes(conn, specs)
+            finally:
+                conn.close()
+            print(f"{filename}: {len(specs)} baseline indexes ensured")
+
+    if args.slow_log:
+        from database_manager import DBManager
+        db_manager = DBManager(data_dir=args.data_dir)
+        advisor = IndexAdvisor(min_occurrences=args.min_occurrences, min_rows=args.min_rows)
+        role_files = {}
+        with open(args.slow_log) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            files = db_manager.role_files(entry.get("role") or "PlantDirector")
+            conn = sqlite3.connect(files[0][1])
+            for alias, path in files[1:]:
+                conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            advisor.observe(conn, entry["sql"])
+            conn.close()
+            for alias, path in files:
+                role_files[alias] = path
+
+        recs = advisor.recommendations()
+        for rec in recs:
+            print(f"{rec.occurrences:4d}x  {rec.rows or '?':>9} rows  {rec.sql}")
+        if not recs:
+            print(f"No recommendations from {advisor.plans_seen} plans.")
+        if args.apply and recs:
+            applied = advisor.apply(recs, list(role_files.items()))
+            print(f"Applied {len(applied)} indexes.")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
 from langchain_community.chat_models import ChatOllama
-from langchain.chains import create_sql_query_chain
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
+from langchain_core.messages import AIMessageChunk
 from operator import itemgetter
+from contextlib import nullcontext
+import asyncio
+import os
+import time
+from query_cache import SQLQueryCache
+from result_cache import ResultCache
+from query_executor import execute_columnar, DEFAULT_BATCH_SIZE, DEFAULT_MAX_ROWS, DEFAULT_MAX_BYTES
+from metrics import REGISTRY, TOKEN_BUCKETS, SlowQueryLog
+from rollups import RollupRewriter, rollups_fresh
+from sql_validator import SQLValidator, parse_statement, complete_statement
+from query_governor import QueryGovernor
+from schema_retriever import SchemaRetriever
+from sql_repair import RepairResult, SQLRepairer
+from sensor_partitions import PartitionLimitError
 
-class LLMEngine:
-    def __init__(self):
-        self.llm = ChatOllama(model="llama3:latest", temperature=0)
-    
-
-    def get_chain(self, db):
-        template = """
+SQL_PROMPT_TEMPLATE = """
 You are an expert SQL assistant specializing in Industrial IoT data analysis. 
 You are writing queries for a SQLite database with multiple attached databases.
 
@@ -55,51 +63,406 @@ Output Format rules:
 Question: {input}
 """
 
-        prompt = PromptTemplate.from_template(template=template)
-        generate_query = create_sql_query_chain(self.llm, db, prompt)
-        
-        # Custom execution function to return dicts with column names
-        def execute_query_with_columns(query):
-            # Layer 2: Python Validation
-            is_safe, message = self.is_safe_query(query)
-            if not is_safe:
-                return f"Security Alert: {message}"
-
-            from sqlalchemy import text
-            # Clean query: remove markdown, strip whitespace, remove trailing text after ;
-            clean_query = query.strip().replace("```sql", "").replace("```", "")
-            if ";" in clean_query:
-                clean_query = clean_query.split(";")[0] + ";"
-            
+_DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.cache', 'query_cache.db'
+)
+
+def similarity_threshold_from_env():
+    # Near-duplicate question matching is opt-in: exact (normalized) questions only unless set
+    threshold = os.environ.get("SQL_CACHE_SIMILARITY")
+    return float(threshold) if threshold else None
+
+# create_sql_query_chain binds the same stop sequence
+LLM_STOP = ["\nSQLResult:"]
+
+def token_usage(prompt_text, message):
+    """(input, output) token counts from the model's metadata, estimated at ~4 chars/token otherwise."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    meta = getattr(message, "response_metadata", None) or {}
+    # Ollama reports prompt_eval_count / eval_count
+    if "eval_count" in meta:
+        return meta.get("prompt_eval_count", 0), meta["eval_count"]
+    return len(prompt_text) // 4, len(message.content) // 4
+
+class LLMEngine:
+    def __init__(self, llm=None, query_cache=None, result_cache=None,
+                 fetch_batch_size=DEFAULT_BATCH_SIZE, max_rows=DEFAULT_MAX_ROWS, max_result_bytes=DEFAULT_MAX_BYTES,
+                 slow_query_log=None, index_advisor=None, rollup_rewriter=None, sql_validator=None, governor=None, schema_retriever=None,
+                 sql_repairer=None, top_k=5):
+        self.llm = llm or ChatOllama(model="llama3:latest", temperature=0)
+        # Deterministic generation (temperature 0) makes question -> SQL safe to reuse
+        self.query_cache = query_cache or SQLQueryCache(
+            _DEFAULT_CACHE_PATH, similarity_threshold=similarity_threshold_from_env()
+        )
+        self.result_cache = result_cache or ResultCache()
+        self.fetch_batch_size = fetch_batch_size
+        self.max_rows = max_rows
+        self.max_result_bytes = max_result_bytes
+        self.prompt = PromptTemplate.from_template(template=SQL_PROMPT_TEMPLATE)
+        self.top_k = top_k
+        self.slow_query_log = slow_query_log or SlowQueryLog()
+        # Optional IndexAdvisor fed with the plan of every executed query
+        self.index_advisor = index_advisor
+        self.rollup_rewriter = rollup_rewriter or RollupRewriter()
+        self.sql_validator = sql_validator or SQLValidator(auto_limit=max_rows)
+        # Per-role deadline / VM-step / row / byte budgets for execution
+        self.governor = governor or QueryGovernor()
+        # Prunes {table_info} to the tables the question needs
+        self.schema_retriever = schema_retriever or SchemaRetriever()
+        # Fixes SQL that fails to prepare before it reaches execution (or a second LLM call)
+        self.sql_repairer = sql_repairer or SQLRepairer()
+
+    def _build_prompt(self, db, question, failed=None):
+        # Same inputs create_sql_query_chain would feed the template
+        if failed is not None:
+            # Repair re-prompt: the failed statement and SQLite's error follow the question
+            question = f"{question}\n\nThis query failed:\n{failed[0]}\nSQLite error: {failed[1]}\nWrite a corrected query."
+        selection = self.schema_retriever.select(db.schema_context(), question)
+        table_info = db.get_table_info(selection.table_names)
+        REGISTRY.inc("schema_selections_total", role=db.role, result="pruned" if selection.pruned else "full")
+        REGISTRY.inc("schema_prompt_tokens_total", selection.full_tokens, role=db.role, kind="full")
+        REGISTRY.inc("schema_prompt_tokens_total", selection.selected_tokens, role=db.role, kind="sent")
+        REGISTRY.observe("schema_tokens_saved", selection.tokens_saved, TOKEN_BUCKETS, role=db.role)
+        with REGISTRY.span("prompt", role=db.role):
+            return self.prompt.format(input=question + "\nSQLQuery: ", table_info=table_info, top_k=str(self.top_k))
+
+    def _finish_generation(self, db, prompt_text, message):
+        input_tokens, output_tokens = token_usage(prompt_text, message)
+        REGISTRY.inc("llm_tokens_total", input_tokens, role=db.role, direction="in")
+        REGISTRY.inc("llm_tokens_total", output_tokens, role=db.role, direction="out")
+        return message.content.strip()
+
+    def _cached_query(self, db, fingerprint, question):
+        cached = self.query_cache.get(db.role, fingerprint, question, db.schema_context().identifier_words)
+        REGISTRY.inc("query_cache_lookups_total", role=db.role, result="miss" if cached is None else "hit")
+        return cached
+
+    def _lookup_query(self, db, question):
+        """(schema fingerprint, cached SQL or None); both may stat files or read the disk cache."""
+        fingerprint = db.schema_fingerprint
+        return fingerprint, self._cached_query(db, fingerprint, question)
+
+    def _cache_query(self, db, fingerprint, question, query):
+        # Refusals and other non-SQL answers are not worth caching
+        if query.strip().upper().startswith(("SELECT", "WITH")):
+            self.query_cache.put(db.role, fingerprint, question, query)
+
+    def generate_query(self, db, question):
+        fingerprint = db.schema_fingerprint
+        cached = self._cached_query(db, fingerprint, question)
+        if cached is not None:
+            return cached
+        prompt_text = self._build_prompt(db, question)
+        with REGISTRY.span("llm", role=db.role):
+            message = self.llm.invoke(prompt_text, stop=LLM_STOP)
+        query = self._finish_generation(db, prompt_text, message)
+        self._cache_query(db, fingerprint, question, query)
+        return query
+
+    async def agenerate_query(self, db, question, llm_slots=None, on_token=None, executor=None):
+        """
+        Async generation via ainvoke; `llm_slots` (an asyncio.Semaphore) bounds concurrent LLM calls.
+        With `on_token`, the completion is streamed to it and cut at the end of the first statement.
+        Schema and query-cache reads (stat calls, the SQLite-backed cache) run on `executor`.
+        """
+        if on_token is not None:
+            pieces = []
+            async with llm_slots or nullcontext():
+                async for piece in self.astream_query(db, question, executor=executor):
+                    pieces.append(piece)
+                    on_token(piece)
+            return "".join(pieces).strip()
+
+        loop = asyncio.get_running_loop()
+        fingerprint, cached = await loop.run_in_executor(executor, self._lookup_query, db, question)
+        if cached is not None:
+            return cached
+        prompt_text = await loop.run_in_executor(executor, self._build_prompt, db, question)
+        async with llm_slots or nullcontext():
+            with REGISTRY.span("llm", role=db.role):
+                message = await self.llm.ainvoke(prompt_text, stop=LLM_STOP)
+        query = self._finish_generation(db, prompt_text, message)
+        await loop.run_in_executor(executor, self._cache_query, db, fingerprint, question, query)
+        return query
+
+    def stream_query(self, db, question):
+        """
+        Yield the SQL text as the model produces it. Generation stops as soon as a complete
+        statement (top-level `;`) has arrived: anything after it would be discarded anyway.
+        """
+        fingerprint = db.schema_fingerprint
+        cached = self._cached_query(db, fingerprint, question)
+        if cached is not None:
+            yield cached
+            return
+        prompt_text = self._build_prompt(db, question)
+        message = AIMessageChunk(content="")
+        with REGISTRY.span("llm", role=db.role):
+            stream = self.llm.stream(prompt_text, stop=LLM_STOP)
+            try:
+                for chunk in stream:
+                    message = message + chunk
+                    yield chunk.content
+                    if complete_statement(message.content) is not None:
+                        REGISTRY.inc("llm_early_stops_total", role=db.role)
+                        break
+            finally:
+                stream.close()
+        query = self._finish_generation(db, prompt_text, message)
+        self._cache_query(db, fingerprint, question, query)
+
+    async def astream_query(self, db, question, executor=None):
+        """
+        Async counterpart of stream_query (astream; closing the stream stops the model).
+        Schema and query-cache reads run on `executor`, off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        fingerprint, cached = await loop.run_in_executor(executor, self._lookup_query, db, question)
+        if cached is not None:
+            yield cached
+            return
+        prompt_text = await loop.run_in_executor(executor, self._build_prompt, db, question)
+        message = AIMessageChunk(content="")
+        with REGISTRY.span("llm", role=db.role):
+            stream = self.llm.astream(prompt_text, stop=LLM_STOP)
             try:
-                with db._engine.connect() as connection:
-                    result = connection.execute(text(clean_query))
-                    # Convert to list of dicts
-                    return [dict(row._mapping) for row in result]
-            except Exception as e:
-                return f"Error: {str(e)}"
-
-        from langchain_core.runnables import RunnableLambda
-        execute_query = RunnableLambda(execute_query_with_columns)
-        
-        chain = (
-            RunnablePassthrough.assign(query=generate_query).assign(result=itemgetter("query") | execute_query)
+                async for chunk in stream:
+                    message = message + chunk
+                    yield chunk.content
+                    if complete_statement(message.content) is not None:
+                        REGISTRY.inc("llm_early_stops_total", role=db.role)
+                        break
+            finally:
+                await stream.aclose()
+        query = self._finish_generation(db, prompt_text, message)
+        await loop.run_in_executor(executor, self._cache_query, db, fingerprint, question, query)
+
+    def repair_query(self, db, query):
+        """
+        Dry-run generated SQL (the validator's EXPLAIN QUERY PLAN prepare, cached for execution)
+        and fix schema mistakes locally. Returns a RepairResult whose `error` is set when the SQL
+        still does not prepare. Statements Layer 2 rejects are returned untouched, and so are
+        statements reading tables the role has no access to or more sensor partitions than can be
+        attached (not retryable either).
+        """
+        parsed = parse_statement(query)
+        if not parsed.ok:
+            return RepairResult(query)
+        with db._engine.connect() as connection:
+            dbapi_connection = connection.connection.dbapi_connection
+            too_broad = []
+
+            def dry_run(sql):
+                try:
+                    binding = db.bind_partitions(dbapi_connection, sql)
+                except PartitionLimitError as e:
+                    too_broad.append(e)
+                    return str(e)
+                return self.sql_validator.check(
+                    dbapi_connection, sql, db.file_versions(sql), row_counts=binding.row_counts if binding else None
+                ).error
+
+            with REGISTRY.span("repair", role=db.role):
+                error = dry_run(parsed.sql)
+                if error is None:
+                    return RepairResult(query)
+                self.sql_repairer.record_failure()
+                REGISTRY.inc("sql_dry_run_failures_total", role=db.role)
+                if db.denied_table(error) or too_broad:
+                    return RepairResult(query, error, retryable=False)
+                result = self.sql_repairer.repair(parsed.sql, error, dry_run, db.schema_context().column_types)
+                if db.denied_table(result.error) or (too_broad and result.error is not None):
+                    return RepairResult(query, result.error, retryable=False)
+        for kind in result.fixes:
+            REGISTRY.inc("sql_local_repairs_total", role=db.role, kind=kind)
+        return result
+
+    def repair_or_retry(self, db, question, query):
+        """repair_query, then re-prompt the LLM with the error (bounded) if local repair fails."""
+        result = self.repair_query(db, query)
+        retries = 0
+        while result.error is not None and result.retryable and retries < self.sql_repairer.max_llm_retries:
+            retries += 1
+            REGISTRY.inc("sql_llm_retries_total", role=db.role)
+            prompt_text = self._build_prompt(db, question, failed=(result.sql, result.error))
+            with REGISTRY.span("llm", role=db.role):
+                message = self.llm.invoke(prompt_text, stop=LLM_STOP)
+            result = self.repair_query(db, self._finish_generation(db, prompt_text, message))
+        return self._finish_repair(db, question, query, result, retries)
+
+    async def arepair_query(self, db, question, query, llm_slots=None, executor=None):
+        """Async repair_or_retry: SQLite work runs on `executor`, LLM retries take an `llm_slots` slot."""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor, self.repair_query, db, query)
+        retries = 0
+        while result.error is not None and result.retryable and retries < self.sql_repairer.max_llm_retries:
+            retries += 1
+            REGISTRY.inc("sql_llm_retries_total", role=db.role)
+            prompt_text = await loop.run_in_executor(
+                executor, lambda: self._build_prompt(db, question, failed=(result.sql, result.error))
+            )
+            async with llm_slots or nullcontext():
+                with REGISTRY.span("llm", role=db.role):
+                    message = await self.llm.ainvoke(prompt_text, stop=LLM_STOP)
+            retried = self._finish_generation(db, prompt_text, message)
+            result = await loop.run_in_executor(executor, self.repair_query, db, retried)
+        # Caching the repaired SQL writes the disk store
+        return await loop.run_in_executor(executor, self._finish_repair, db, question, query, result, retries)
+
+    def _finish_repair(self, db, question, query, result, retries):
+        result.llm_retries = retries
+        self.sql_repairer.record(result)
+        if result.error is not None:
+            outcome = "failed" if result.retryable else "denied"
+        elif retries:
+            outcome = "llm"
+        elif result.fixes:
+            outcome = "local"
+        else:
+            return query
+        REGISTRY.inc("sql_repair_outcomes_total", role=db.role, result=outcome)
+        if result.error is not None:
+            # Execution reports the original statement's error (e.g. main.py's access-denied message)
+            return query
+        # The next identical question gets the working SQL straight from the cache
+        self._cache_query(db, db.schema_fingerprint, question, result.sql)
+        return result.sql
+
+    # Custom execution function returning a ColumnarResult (column names + per-column values)
+    def execute_query(self, db, query, cancel_token=None, on_batch=None):
+        """
+        `cancel_token` (query_governor.CancelToken) lets the caller abandon the query while it runs;
+        `on_batch(columns, rows)` receives result batches as they are fetched.
+        """
+        # Layer 2: Python Validation (single read-only statement, parsed rather than keyword-matched)
+        with REGISTRY.span("validate", role=db.role):
+            is_safe, message = self.is_safe_query(query)
+        if not is_safe:
+            REGISTRY.inc("query_rejections_total", role=db.role, reason="statement")
+            return f"Security Alert: {message}"
+        clean_query = parse_statement(query).sql
+
+        versions = db.file_versions(clean_query)
+        cached = self.result_cache.get(db.role, clean_query, versions)
+        if cached is not None:
+            return cached
+
+        try:
+            with db._engine.connect() as connection:
+                dbapi_connection = connection.connection.dbapi_connection
+                # Partitioned sensor data: attach only the months the query's timestamp bounds reach
+                try:
+                    binding = db.bind_partitions(dbapi_connection, clean_query)
+                except PartitionLimitError as e:
+                    REGISTRY.inc("query_rejections_total", role=db.role, reason="partitions")
+                    return f"Query too broad: {e}"
+                # Layer 3: SQLite authorizer + query plan cost guard
+                with REGISTRY.span("validate", role=db.role):
+                    check = self.sql_validator.check(
+                        dbapi_connection, clean_query, versions, row_counts=binding.row_counts if binding else None
+                    )
+                if not check.ok:
+                    REGISTRY.inc("query_rejections_total", role=db.role, reason="plan")
+                    return f"Security Alert: {check.reason}"
+                if check.auto_limited:
+                    REGISTRY.inc("query_auto_limits_total", role=db.role)
+                rollup_schemas = binding.schemas if binding else ("main",)
+                run_query = self._rewrite_for_rollups(dbapi_connection, clean_query, db.role, rollup_schemas) or check.sql
+                if cancel_token is not None and cancel_token.cancelled:
+                    self.governor.record(db.role, "cancelled")
+                    return "Query stopped: it was cancelled"
+                # Layer 4: resource governor (deadline, VM steps, rows, bytes)
+                budget = self.governor.budget_for(db.role)
+                run = None
+                start = time.perf_counter()
+                try:
+                    with self.governor.govern(dbapi_connection, db.role, cancel_token) as run:
+                        result = execute_columnar(
+                            connection, run_query,
+                            batch_size=self.fetch_batch_size,
+                            max_rows=min(self.max_rows, budget.max_rows),
+                            max_bytes=min(self.max_result_bytes, budget.max_bytes),
+                            role=db.role,
+                            tables=binding.table_labels(check.tables) if binding else check.tables,
+                            on_batch=on_batch,
+                        )
+                except Exception:
+                    if run is not None and run.stopped_by:
+                        return run.message()
+                    raise
+                if result.truncated_by:
+                    self.governor.record(db.role, result.truncated_by)
+                self.slow_query_log.maybe_record(dbapi_connection, run_query, time.perf_counter() - start, db.role)
+                if self.index_advisor is not None:
+                    # The validator's plan is the executed statement's unless the rollup rewrite replaced it
+                    plan = check.plan if run_query == check.sql else None
+                    self.index_advisor.observe(dbapi_connection, run_query, plan)
+        except Exception as e:
+            REGISTRY.inc("query_errors_total", role=db.role)
+            return f"Error: {str(e)}"
+
+        self.result_cache.put(db.role, clean_query, versions, result)
+        return result
+
+    def _rewrite_for_rollups(self, dbapi_connection, query, role, schemas=("main",)):
+        """Rollup SQL for eligible sensor aggregations when the rollups are up to date, else None."""
+        rewritten = self.rollup_rewriter.rewrite(query)
+        if rewritten is None:
+            return None
+        if not rollups_fresh(dbapi_connection, schemas):
+            REGISTRY.inc("rollup_rewrites_total", role=role, result="stale")
+            return None
+        REGISTRY.inc("rollup_rewrites_total", role=role, result="applied")
+        return rewritten
+
+    def get_chain(self, db, streaming=False):
+        """
+        question -> {"question", "query", "result"}. With streaming=True, `chain.stream()` emits the
+        SQL in chunks as it is generated and execution starts once the first statement is complete.
+        """
+        async def agenerate(inputs):
+            return await self.agenerate_query(db, inputs["question"])
+
+        def stream_generate(inputs):
+            yield from self.stream_query(db, inputs["question"])
+
+        async def astream_generate(inputs):
+            async for piece in self.astream_query(db, inputs["question"]):
+                yield piece
+
+        async def arepair(inputs):
+            return await self.arepair_query(db, inputs["question"], inputs["query"])
+
+        async def aexecute(query):
+            # SQLite calls block, so keep them off the event loop
+            return await asyncio.to_thread(self.execute_query, db, query)
+
+        if streaming:
+            generate_query = RunnableLambda(stream_generate, afunc=astream_generate)
+        else:
+            generate_query = RunnableLambda(
+                lambda inputs: self.generate_query(db, inputs["question"]), afunc=agenerate
+            )
+
+        repair_query = RunnableLambda(
+            lambda inputs: self.repair_or_retry(db, inputs["question"], inputs["query"]), afunc=arepair
         )
+        execute_query = RunnableLambda(lambda query: self.execute_query(db, query), afunc=aexecute)
+
+        if streaming:
+            # "query" stays the streamed SQL; execution runs the repaired statement
+            chain = RunnablePassthrough.assign(query=generate_query).assign(result=repair_query | execute_query)
+        else:
+            chain = (
+                RunnablePassthrough.assign(query=generate_query)
+                .assign(query=repair_query)
+                .assign(result=itemgetter("query") | execute_query)
+            )
         return chain
 
     def is_safe_query(self, sql_query):
         """Layer 2: Python Logic Guardrail"""
-        # Normalize query
-        sql_upper = sql_query.upper()
-        
-        # List of forbidden keywords
-        forbidden = [
-            "DROP ", "DELETE ", "INSERT ", "UPDATE ", "ALTER ", 
-            "TRUNCATE ", "CREATE ", "GRANT ", "REVOKE ", "COMMIT"
-        ]
-        
-        for word in forbidden:
-            if word in sql_upper:
-                return False, f"Forbidden keyword detected: {word}"
-                
-        return True, "Query is safe"
+        parsed = parse_statement(sql_query)
+        return parsed.ok, parsed.reason
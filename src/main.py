@@ -1,15 +1,34 @@
 import streamlit as st
 import pandas as pd
-import ast
+import os
+import queue
+import time
+import uuid
 from database_manager import DBManager
 from llm_engine import LLMEngine
+from async_pipeline import AsyncQueryPipeline, PipelineBusyError
+from index_advisor import IndexAdvisor
+from metrics import REGISTRY, start_metrics_server, metrics_port_from_env
+from history_store import ResultStore
+from api_client import APIUnavailableError, QueryAPIClient
 
-# Initialize resources
+# Initialize resources (shared by every Streamlit session in this process)
 @st.cache_resource
 def get_resources():
-    return DBManager(), LLMEngine()
+    # Thin-client mode: QUERY_API_URL=http://localhost:8000 streamlit run main.py (see api_server.py)
+    api_url = os.environ.get("QUERY_API_URL")
+    if api_url:
+        return None, None, QueryAPIClient(api_url), ResultStore(preview_rows=PAGE_SIZE)
+    db_manager, llm_engine = DBManager(), LLMEngine(index_advisor=IndexAdvisor())
+    # Optional Prometheus-style endpoint: METRICS_PORT=9108 streamlit run main.py
+    port = metrics_port_from_env()
+    if port:
+        start_metrics_server(port)
+    return db_manager, llm_engine, AsyncQueryPipeline(db_manager, llm_engine), ResultStore(preview_rows=PAGE_SIZE)
 
-db_manager, llm_engine = get_resources()
+PAGE_SIZE = 100
+
+db_manager, llm_engine, pipeline, result_store = get_resources()
 
 # Page configuration
 st.set_page_config(
@@ -21,6 +40,76 @@ st.set_page_config(
 # Initialize chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# Keys this session's spilled results in the ResultStore
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+# Sessions that stopped running (closed tabs) get their spilled results deleted after a while
+result_store.touch(st.session_state.session_id)
+
+# Only the latest results are drawn on every rerun; older ones wait behind a button
+EAGER_RESULTS = 3
+
+def render_dataframe(message, key):
+    """
+    Show a result from its in-memory preview; further pages load the full result from the
+    ResultStore on demand.
+    """
+    df = message["preview"]
+    shown = message.get("rows_shown", PAGE_SIZE)
+    if shown > len(df) and message["result_key"]:
+        full = result_store.load(message["result_key"])
+        if full is None:
+            st.caption("The full result was evicted to save memory; showing the first rows only.")
+            message["result_key"] = None
+            message["rows_shown"] = shown = len(df)
+        else:
+            df = full
+    with REGISTRY.span("render"):
+        st.dataframe(df.iloc[:shown])
+    if shown < message["row_count"] and message["result_key"]:
+        if st.button(f"Load more ({shown} of {message['row_count']} rows shown)", key=key):
+            message["rows_shown"] = shown + PAGE_SIZE
+            st.rerun()
+
+POLL_SECONDS = 0.1
+
+def wait_for_response(future, placeholder, table_placeholder, updates):
+    """
+    Poll the pipeline instead of blocking, so Streamlit can interrupt the wait (Stop button, new
+    question, closed tab). Leaving without a result cancels the request and its SQLite statement.
+    While waiting, streamed SQL tokens and the first page of fetched rows are drawn from `updates`.
+    """
+    start = time.monotonic()
+    sql_text, columns, preview, fetched = "", None, [], 0
+    try:
+        while True:
+            try:
+                return future.result(timeout=POLL_SECONDS)
+            except TimeoutError:
+                if future.done():
+                    raise
+            while True:
+                try:
+                    kind, payload = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "token":
+                    sql_text += payload
+                else:
+                    columns, rows = payload
+                    fetched += len(rows)
+                    preview.extend(rows[:PAGE_SIZE - len(preview)])
+            elapsed = time.monotonic() - start
+            if sql_text:
+                status = f"Fetched {fetched} rows..." if columns else f"Running query... {elapsed:.0f}s"
+                placeholder.markdown(f"**SQL Query:**\n```sql\n{sql_text}\n```\n\n{status}")
+            else:
+                placeholder.markdown(f"Running query... {elapsed:.0f}s")
+            if preview:
+                table_placeholder.dataframe(pd.DataFrame(preview, columns=columns))
+    finally:
+        if not future.done():
+            future.cancel()
 
 def process_query(prompt, role):
     """Process a query and update chat history."""
@@ -35,18 +124,30 @@ def process_query(prompt, role):
         message_placeholder = st.empty()
         
         try:
-            # Process query
-            user_db = db_manager.get_db_for_session(role=role)
-            chain = llm_engine.get_chain(user_db)
-            response = chain.invoke({"question": prompt})
+            # Process query (bounded, deduplicated across sessions)
+            stop_placeholder = st.empty()
+            # Clicking reruns the script, which abandons (and cancels) the request below
+            stop_placeholder.button("Stop", key=f"stop_{len(st.session_state.messages)}")
+            table_placeholder = st.empty()
+            # Filled from pipeline threads; drawn by this (script) thread
+            updates = queue.Queue()
+            future = pipeline.submit_future(
+                prompt, role,
+                on_token=lambda text: updates.put(("token", text)),
+                on_batch=lambda columns, rows: updates.put(("batch", (columns, rows))),
+            )
+            with REGISTRY.span("request", role=role):
+                response = wait_for_response(future, message_placeholder, table_placeholder, updates)
+            stop_placeholder.empty()
+            table_placeholder.empty()
             
-            result_str = str(response['result']).lower()
-            
-            # Error handling logic
+            result = response['result']
+
+            # Error handling logic (errors come back as strings, data as a ColumnarResult)
             error_message = None
-            df = pd.DataFrame()
-            
-            if 'error' in result_str:
+
+            if isinstance(result, str):
+                result_str = result.lower()
                 if 'no such table' in result_str:
                     if 'revenue' in result_str or 'asset_revenue' in result_str:
                         error_message = f"Access denied: Your role ({role}) cannot access revenue data."
@@ -60,35 +161,54 @@ def process_query(prompt, role):
                     error_message = "SQL syntax error. Please rephrase your question."
                 elif 'ambiguous' in result_str:
                     error_message = "Ambiguous column reference. Please be more specific."
+                elif result_str.startswith('query too broad'):
+                    error_message = result
+                elif result_str.startswith('query stopped'):
+                    error_message = f"{result}. Please try a narrower question."
                 else:
-                    error_message = f"Database error: {response['result']}"
-            
+                    error_message = f"Database error: {result}"
+
             if error_message:
                 message_placeholder.markdown(error_message)
                 st.session_state.messages.append({"role": "assistant", "content": error_message})
             else:
-                result_data = response['result']
-                
                 # Check for empty results
-                if not result_data or (isinstance(result_data, list) and len(result_data) == 0):
+                if len(result) == 0:
                     msg = f"No data found.\n\n**SQL Query:**\n```sql\n{response['query']}\n```"
                     message_placeholder.markdown(msg)
                     st.session_state.messages.append({"role": "assistant", "content": msg})
                 else:
-                    # Result is now a list of dicts, directly create DataFrame
-                    df = pd.DataFrame(result_data)
-                    
-                    msg = f"**SQL Query:**\n```sql\n{response['query']}\n```\n\n**Results:** {len(df)} rows"
+                    # Only a preview stays in the session; the full result spills to disk
+                    with REGISTRY.span("dataframe", role=role):
+                        stored = result_store.put(st.session_state.session_id, result)
+
+                    msg = f"**SQL Query:**\n```sql\n{response['query']}\n```\n\n**Results:** {result.summary()}"
                     message_placeholder.markdown(msg)
-                    st.dataframe(df)
-                    
-                    # Save to history with dataframe
-                    st.session_state.messages.append({
-                        "role": "assistant", 
+
+                    # Save to history with the preview and a handle to the full result
+                    message = {
+                        "role": "assistant",
                         "content": msg,
-                        "dataframe": df
-                    })
+                        "preview": stored.preview,
+                        "result_key": stored.key,
+                        "row_count": stored.row_count,
+                        "rows_shown": PAGE_SIZE
+                    }
+                    st.session_state.messages.append(message)
+                    render_dataframe(message, key=f"more_{len(st.session_state.messages) - 1}")
 
+        except PipelineBusyError:
+            final_error = "The system is busy right now. Please try again in a moment."
+            message_placeholder.markdown(final_error)
+            st.session_state.messages.append({"role": "assistant", "content": final_error})
+        except APIUnavailableError:
+            final_error = "The query server is unavailable right now. Please try again in a moment."
+            message_placeholder.markdown(final_error)
+            st.session_state.messages.append({"role": "assistant", "content": final_error})
+        except TimeoutError:
+            final_error = "The query took too long and was cancelled. Please try a narrower question."
+            message_placeholder.markdown(final_error)
+            st.session_state.messages.append({"role": "assistant", "content": final_error})
         except Exception as e:
             error_msg = str(e).lower()
             final_error = f"Error: {str(e)}"
@@ -135,16 +255,54 @@ with st.sidebar:
         if st.button(query[:40] + "...", help=f"{query} ({example_role})"):
             selected_example = query
 
+    st.markdown("---")
+    if st.button("Clear chat"):
+        # A fresh session: the old one's spilled results are deleted now rather than evicted later
+        result_store.drop_session(st.session_state.session_id)
+        st.session_state.messages = []
+        st.session_state.session_id = uuid.uuid4().hex
+        st.rerun()
+
+    st.markdown("---")
+    with st.expander("Performance Metrics"):
+        if db_manager is None:
+            # Thin client: the API server owns the engines and their metrics
+            stats = pipeline.get_stats()
+            histograms = stats.pop("stages", [])
+            if stats.get("unavailable"):
+                st.warning("Query server unavailable; metrics will show once it is reachable again.")
+        else:
+            stats = {"pool": db_manager.get_stats(), "pipeline": pipeline.get_stats(),
+                     "governor_limits": llm_engine.governor.get_stats(),
+                     "sql_repairs": llm_engine.sql_repairer.get_stats(),
+                     "slow_queries": list(llm_engine.slow_query_log.entries)[-5:],
+                     "index_recommendations": [r.to_dict() for r in llm_engine.index_advisor.recommendations()]}
+            histograms = REGISTRY.to_dict()["histograms"]
+        stats["result_store"] = result_store.get_stats()
+        stage_rows = [
+            {"stage": h["labels"].get("stage"), "role": h["labels"].get("role"), "count": h["count"],
+             "mean_ms": h["sum"] / h["count"] * 1000, "p95_ms (bucket)": h["p95"] * 1000}
+            for h in histograms if h["name"] == "stage_seconds" and h["count"]
+        ]
+        if stage_rows:
+            st.dataframe(pd.DataFrame(stage_rows), hide_index=True)
+        st.json(stats, expanded=False)
+
 # Main Chat Interface
 st.title("Multi-DB SQL Query System")
 st.markdown("Query across Sensors, Maintenance, and Revenue databases with role-based access control.")
 
 # Display chat messages from history on app rerun
-for message in st.session_state.messages:
+for i, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        if "dataframe" in message:
-            st.dataframe(message["dataframe"])
+        if "preview" in message:
+            recent = i >= len(st.session_state.messages) - 2 * EAGER_RESULTS
+            if recent or message.get("open"):
+                render_dataframe(message, key=f"more_{i}")
+            elif st.button(f"Show results ({message['row_count']} rows)", key=f"open_{i}"):
+                message["open"] = True
+                st.rerun()
 
 # Handle Input
 prompt = st.chat_input("Ask a question about your data...")
@@ -0,0 +1,188 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds (Prometheus convention, +Inf implied)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# For histograms of prompt token counts rather than seconds
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w]*(?:\.[A-Za-z_]\w*)?)", re.IGNORECASE)
+
+def tables_in_query(sql):
+    """Best-effort list of tables referenced after FROM/JOIN."""
+    return sorted({match.lower() for match in _TABLE_RE.findall(sql)})
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (what Prometheus would report)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters, exposed as Prometheus text or JSON with no collector.
+
+    Histograms and counters are identified by a metric name plus a sorted tuple of label pairs.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def span(self, stage, role=None, tables=None):
+        """Time a pipeline stage; also attributed to each table touched when `tables` is given."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("stage_seconds", elapsed, stage=stage, role=role or "")
+            for table in tables or ():
+                self.observe("table_stage_seconds", elapsed, stage=stage, role=role or "", table=table)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        with self._lock:
+            histograms = [
+                {
+                    "name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                    "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+                }
+                for (name, labels), h in self._histograms.items()
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+        return {"histograms": histograms, "counters": counters}
+
+    def render_prometheus(self, prefix="sql_chatbot_"):
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{prefix}{name}{_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                for bound, total in h.cumulative():
+                    lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', bound),))} {total}")
+                lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{prefix}{name}_sum{_labels(labels)} {h.sum}")
+                lines.append(f"{prefix}{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class SlowQueryLog:
+    """Keeps SQL and EXPLAIN QUERY PLAN for executions slower than `threshold_ms`, optionally as JSON lines."""
+    def __init__(self, threshold_ms=500, path=None, max_entries=200):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self.entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def maybe_record(self, dbapi_connection, sql, elapsed, role=None):
+        elapsed_ms = elapsed * 1000
+        if self.threshold_ms is None or elapsed_ms < self.threshold_ms:
+            return None
+        try:
+            plan = [row[-1] for row in dbapi_connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+        except Exception as e:
+            plan = [f"<plan unavailable: {e}>"]
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "role": role,
+            "elapsed_ms": round(elapsed_ms, 2),
+            "sql": sql,
+            "plan": plan,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+        REGISTRY.inc("slow_queries_total", role=role or "")
+        return entry
+
+# Process-wide registry shared by DBManager, LLMEngine and the UI
+REGISTRY = MetricsRegistry()
+
+def start_metrics_server(port, registry=REGISTRY, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.render_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(registry.to_dict()), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def metrics_port_from_env():
+    port = os.environ.get("METRICS_PORT")
+    return int(port) if port else None
@@ -0,0 +1,220 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+_TOKEN_RE = re.compile(r"[a-z0-9_\-]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+def normalize_question(question):
+    """Lower-case, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    text = " ".join(question.lower().split())
+    return text.rstrip(" ?!.")
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text)
+
+def _fold(word):
+    # Plural folding, so "readings" still names sensor_readings.reading_id
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def _mentioned(text, vocabulary):
+    """The schema words a question mentions (folded tokens, split on "_" like identifiers)."""
+    return {w for w in map(_fold, re.split(r"[\W_]+", text)) if w in vocabulary}
+
+class SQLQueryCache:
+    """
+    Question -> generated SQL cache keyed by (role, schema fingerprint, normalized question).
+
+    In-memory LRU with a TTL, optionally backed by a SQLite file so several Streamlit
+    processes share what has already been generated. With `similarity_threshold` set,
+    paraphrased questions are matched by TF-IDF cosine similarity over cached questions
+    of the same role and schema. Numbers and schema identifiers must match exactly, so "top 5"
+    never serves "top 10" and "vibration" never serves "temperature".
+    """
+    def __init__(self, path=None, max_entries=512, ttl_seconds=24 * 3600, similarity_threshold=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {
+            "hits": 0, "near_hits": 0, "disk_hits": 0, "misses": 0,
+            "stores": 0, "evictions": 0, "expirations": 0,
+        }
+        if self.path:
+            self._init_store()
+
+    def get(self, role, fingerprint, question, identifiers=frozenset()):
+        """`identifiers` are the schema's table/column words (SchemaContext.identifier_words)."""
+        normalized = normalize_question(question)
+        key = (role, fingerprint, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                sql, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return sql
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        if self.path:
+            row = self._load(key, now)
+            if row is not None:
+                sql, created_at = row
+                with self._lock:
+                    self._insert(key, sql, created_at)
+                    self._stats["disk_hits"] += 1
+                return sql
+
+        if self.similarity_threshold is not None:
+            sql = self._near_match(role, fingerprint, normalized, now, identifiers)
+            if sql is not None:
+                return sql
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, role, fingerprint, question, sql):
+        key = (role, fingerprint, normalize_question(question))
+        created_at = time.time()
+        with self._lock:
+            self._insert(key, sql, created_at)
+            self._stats["stores"] += 1
+        if self.path:
+            self._store(key, sql, created_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM query_cache")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["near_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
+
+    def _insert(self, key, sql, created_at):
+        self._entries[key] = (sql, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _near_match(self, role, fingerprint, normalized, now, identifiers):
+        with self._lock:
+            candidates = [
+                (key[2], sql) for key, (sql, created_at) in self._entries.items()
+                if key[0] == role and key[1] == fingerprint and now - created_at <= self.ttl_seconds
+            ]
+        if not candidates:
+            return None
+
+        numbers = _NUMBER_RE.findall(normalized)
+        vocabulary = {_fold(w) for w in identifiers}
+        mentioned = _mentioned(normalized, vocabulary)
+        docs = [_tokens(normalized)] + [_tokens(question) for question, _ in candidates]
+        doc_freq = Counter(token for doc in docs for token in set(doc))
+        n_docs = len(docs)
+
+        def vector(doc):
+            counts = Counter(doc)
+            vec = {t: c * (math.log((1 + n_docs) / (1 + doc_freq[t])) + 1) for t, c in counts.items()}
+            norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+            return {t: v / norm for t, v in vec.items()}
+
+        query_vec = vector(docs[0])
+        best_score, best_sql = 0.0, None
+        for (question, sql), doc in zip(candidates, docs[1:]):
+            if _NUMBER_RE.findall(question) != numbers or _mentioned(question, vocabulary) != mentioned:
+                continue
+            cand_vec = vector(doc)
+            score = sum(v * cand_vec.get(t, 0.0) for t, v in query_vec.items())
+            if score > best_score:
+                best_score, best_sql = score, sql
+
+        if best_sql is not None and best_score >= self.similarity_threshold:
+            with self._lock:
+                self._stats["near_hits"] += 1
+            return best_sql
+        return None
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_store(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    role TEXT, fingerprint TEXT, question TEXT,
+                    sql TEXT, created_at REAL,
+                    PRIMARY KEY (role, fingerprint, question)
+                )
+            """)
+
+    def _load(self, key, now):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT sql, created_at FROM query_cache WHERE role = ? AND fingerprint = ? AND question = ?",
+                    key,
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        if now - row[1] > self.ttl_seconds:
+            self._delete_expired(now)
+            return None
+        return row
+
+    def _store(self, key, sql, created_at):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_cache (role, fingerprint, question, sql, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    key + (sql, created_at),
+                )
+                # SQL generated against an older schema of this role can never be looked up again
+                conn.execute(
+                    "DELETE FROM query_cache WHERE role = ? AND question = ? AND fingerprint != ?",
+                    (key[0], key[2], key[1]),
+                )
+                conn.execute("DELETE FROM query_cache WHERE created_at < ?", (created_at - self.ttl_seconds,))
+        except sqlite3.Error:
+            # The disk store is best-effort; the in-memory entry is already in place
+            pass
+
+    def _delete_expired(self, now):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,90 @@
+import sys
+import pandas as pd
+from sqlalchemy import text
+from metrics import REGISTRY
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+class ColumnarResult:
+    """Query result held as column names plus one list per column (no per-row dicts)."""
+    def __init__(self, columns, data, row_count, nbytes, truncated=False, truncated_by=None):
+        self.columns = columns
+        self.data = data
+        self.row_count = row_count
+        self.nbytes = nbytes
+        self.truncated = truncated
+        # "rows" or "bytes" when a fetch limit cut the result short
+        self.truncated_by = truncated_by
+
+    def __len__(self):
+        return self.row_count
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def summary(self):
+        if self.truncated:
+            return f"first {self.row_count} rows (truncated, {self.row_count}+ rows)"
+        return f"{self.row_count} rows"
+
+def _unique_columns(keys):
+    # Joins often return the same name twice (e.g. asset_id); keep both, pandas-style
+    columns, seen = [], {}
+    for key in keys:
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        columns.append(key if count == 0 else f"{key}.{count}")
+    return columns
+
+def _batch_bytes(batch):
+    return sum(sys.getsizeof(value) for row in batch for value in row)
+
+def execute_columnar(connection, sql, batch_size=DEFAULT_BATCH_SIZE,
+                     max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES, role=None, tables=None,
+                     on_batch=None):
+    """
+    Run `sql` on a SQLAlchemy connection, pulling rows with fetchmany in `batch_size` chunks
+    straight into per-column lists. Stops once `max_rows` rows or `max_bytes` of values have
+    been read and marks the result as truncated. `on_batch(columns, rows)` sees each kept batch
+    as it arrives, for progressive display.
+    """
+    with REGISTRY.span("execute", role=role, tables=tables):
+        result = connection.execute(text(sql))
+    # Row conversion: SQLite steps lazily, so this also covers most of the scan time
+    with REGISTRY.span("fetch", role=role, tables=tables):
+        columnar = _fetch_columnar(result, batch_size, max_rows, max_bytes, on_batch)
+    REGISTRY.inc("result_rows_total", columnar.row_count, role=role or "")
+    return columnar
+
+def _fetch_columnar(result, batch_size, max_rows, max_bytes, on_batch=None):
+    columns = _unique_columns(result.keys())
+    data = {column: [] for column in columns}
+    row_count = 0
+    nbytes = 0
+    truncated_by = None
+
+    while True:
+        batch = result.fetchmany(min(batch_size, max_rows - row_count + 1))
+        if not batch:
+            break
+        if row_count + len(batch) > max_rows:
+            # The extra row only proves there is more data; it is not kept
+            batch = batch[:max_rows - row_count]
+            truncated_by = "rows"
+        batch_bytes = _batch_bytes(batch)
+        if nbytes + batch_bytes > max_bytes and row_count:
+            truncated_by = "bytes"
+            break
+        for column, values in zip(columns, zip(*batch)):
+            data[column].extend(values)
+        row_count += len(batch)
+        nbytes += batch_bytes
+        if on_batch is not None:
+            on_batch(columns, batch)
+        if truncated_by:
+            break
+
+    result.close()
+    return ColumnarResult(columns, data, row_count, nbytes, truncated_by is not None, truncated_by)
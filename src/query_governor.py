@@ -0,0 +1,137 @@
+"""
+Resource governor for SQLite execution.
+
+Every governed query runs with a SQLite progress handler that aborts the statement (SQLite then
+raises "interrupted") once the role's wall-clock deadline or VM-step budget is spent, or once the
+request is cancelled. Cancellation also calls connection.interrupt() directly, so an abandoned
+request stops at the next VM instruction. Row and byte limits are applied while fetching (see
+query_executor); the governor only records when they cut a result short.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+from query_executor import DEFAULT_MAX_ROWS, DEFAULT_MAX_BYTES
+
+# The progress handler runs every N SQLite VM instructions
+PROGRESS_INTERVAL = 1000
+
+class QueryBudget:
+    def __init__(self, deadline_seconds=30.0, max_vm_steps=500_000_000, max_rows=DEFAULT_MAX_ROWS,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.deadline_seconds = deadline_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+
+# Roles that join across all databases get more room than single-database roles
+ROLE_BUDGETS = {
+    "PlantDirector": QueryBudget(deadline_seconds=60.0, max_vm_steps=2_000_000_000),
+    "MaintenanceManager": QueryBudget(),
+    "RevenueAnalyst": QueryBudget(),
+    "SensorViewer": QueryBudget(deadline_seconds=20.0, max_vm_steps=300_000_000),
+}
+
+LIMIT_MESSAGES = {
+    "deadline": "ran longer than the {deadline_seconds:g}s limit for your role",
+    "steps": "exceeded the work budget for your role ({max_vm_steps:,} SQLite steps)",
+    "cancelled": "was cancelled",
+}
+
+class CancelToken:
+    """Shared by a request and whoever may abandon it; cancel() interrupts any governed connection."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            # sqlite3.Connection.interrupt is safe to call from another thread
+            connection.interrupt()
+
+    def _attach(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def _detach(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+class GovernedRun:
+    def __init__(self, role, budget, cancel_token):
+        self.role = role
+        self.budget = budget
+        self.cancel_token = cancel_token
+        self.started = time.monotonic()
+        self.steps = 0
+        # Which limit stopped the query: "deadline", "steps", "cancelled" (None if none did)
+        self.stopped_by = None
+
+    def message(self):
+        template = LIMIT_MESSAGES[self.stopped_by]
+        return "Query stopped: it " + template.format(**vars(self.budget))
+
+class QueryGovernor:
+    def __init__(self, budgets=None, default_budget=None, progress_interval=PROGRESS_INTERVAL):
+        self.budgets = ROLE_BUDGETS if budgets is None else budgets
+        self.default_budget = default_budget or QueryBudget()
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        self._fired = {}
+
+    def budget_for(self, role):
+        return self.budgets.get(role, self.default_budget)
+
+    @contextmanager
+    def govern(self, dbapi_connection, role, cancel_token=None):
+        """Install the role's deadline/step budget (and the cancel token) on a raw sqlite3 connection."""
+        run = GovernedRun(role, self.budget_for(role), cancel_token)
+        deadline = run.started + run.budget.deadline_seconds if run.budget.deadline_seconds else None
+        interval = self.progress_interval
+
+        def progress():
+            run.steps += interval
+            if cancel_token is not None and cancel_token.cancelled:
+                run.stopped_by = "cancelled"
+            elif deadline is not None and time.monotonic() > deadline:
+                run.stopped_by = "deadline"
+            elif run.budget.max_vm_steps and run.steps > run.budget.max_vm_steps:
+                run.stopped_by = "steps"
+            # Any non-zero return aborts the running statement
+            return 1 if run.stopped_by else 0
+
+        dbapi_connection.set_progress_handler(progress, interval)
+        if cancel_token is not None:
+            cancel_token._attach(dbapi_connection)
+        try:
+            yield run
+        except BaseException:
+            # interrupt() from cancel() aborts without going through the progress handler
+            if run.stopped_by is None and cancel_token is not None and cancel_token.cancelled:
+                run.stopped_by = "cancelled"
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token._detach(dbapi_connection)
+            dbapi_connection.set_progress_handler(None, interval)
+            if run.stopped_by:
+                self.record(role, run.stopped_by)
+
+    def record(self, role, limit):
+        """Count a limit firing: deadline, steps, cancelled, rows or bytes."""
+        with self._lock:
+            self._fired[(role, limit)] = self._fired.get((role, limit), 0) + 1
+        REGISTRY.inc("governor_limits_total", role=role or "", limit=limit)
+
+    def get_stats(self):
+        with self._lock:
+            return {f"{role}:{limit}": count for (role, limit), count in sorted(self._fired.items())}
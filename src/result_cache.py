@@ -0,0 +1,126 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+_STRING_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+_WHITESPACE_RE = re.compile(r"\s+")
+# SQL whose result depends on when or how often it runs: 'now' and the argument-less date/time
+# forms, CURRENT_* keywords, random() and connection state functions
+_NONDETERMINISTIC_RE = re.compile(
+    r"'now'|\bcurrent_(?:timestamp|date|time)\b"
+    r"|\b(?:random|randomblob|changes|total_changes|last_insert_rowid)\s*\("
+    r"|\b(?:date|time|datetime|julianday|unixepoch)\s*\(\s*\)"
+    r"|\bstrftime\s*\(\s*'(?:[^']|'')*'\s*\)",
+    re.IGNORECASE,
+)
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop trailing semicolons."""
+    parts = _STRING_LITERAL_RE.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else _WHITESPACE_RE.sub(" ", part)
+        for i, part in enumerate(parts)
+    )
+
+def is_deterministic(sql):
+    """False when the same SQL over the same files may return different rows on the next run."""
+    return _NONDETERMINISTIC_RE.search(sql) is None
+
+def estimate_size(value):
+    """Rough deep size in bytes of a query result (list of dicts, or anything with `nbytes`)."""
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class ResultCache:
+    """
+    Byte-budgeted LRU of executed query results keyed by (role, normalized SQL, file versions).
+
+    `versions` identifies the current contents of the database files a query reads, as
+    (name, mtime_ns, size) tuples (see CustomSQLDatabase.file_versions). When a file shows up
+    with a new version, every entry of the role that read it is dropped, so rewriting a
+    database invalidates its results; queries over other files (e.g. older sensor partitions)
+    keep theirs. Non-deterministic SQL (datetime('now', ...), random()) is never cached, and
+    neither are results cut short by a row or byte limit, which depend on the limits in force.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_fraction=0.25):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * max_entry_fraction)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._role_versions = {}
+        self.current_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0, "oversized": 0,
+                       "uncacheable": 0, "truncated": 0}
+
+    def get(self, role, sql, versions):
+        if not is_deterministic(sql):
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return None
+        key = (role, normalize_sql(sql), versions)
+        with self._lock:
+            self._check_versions(role, versions)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, role, sql, versions, result):
+        if not is_deterministic(sql):
+            return False
+        if getattr(result, "truncated", False):
+            with self._lock:
+                self._stats["truncated"] += 1
+            return False
+        size = estimate_size(result)
+        key = (role, normalize_sql(sql), versions)
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self._stats["oversized"] += 1
+                return False
+            self._check_versions(role, versions)
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self.current_bytes += size
+            self._stats["stores"] += 1
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self._stats["evictions"] += 1
+        return True
+
+    def invalidate(self, role=None):
+        with self._lock:
+            self._drop(lambda key: role is None or key[0] == role)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self.current_bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _check_versions(self, role, versions):
+        known = self._role_versions.setdefault(role, {})
+        changed = {v[0] for v in versions if known.get(v[0], v) != v}
+        if changed:
+            self._drop(lambda key: key[0] == role and any(v[0] in changed for v in key[2]))
+        known.update((v[0], v) for v in versions)
+
+    def _drop(self, predicate):
+        for key in [key for key in self._entries if predicate(key)]:
+            self.current_bytes -= self._entries.pop(key)[1]
+            self._stats["invalidations"] += 1
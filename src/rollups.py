@@ -0,0 +1,278 @@
+"""
+Per-asset hourly/daily rollups of sensor_readings with transparent query rewriting.
+
+The rollup tables live in db1_sensors.db next to the raw data and hold, per (asset_id, bucket),
+the row count plus count/sum/min/max/sum-of-squares of temperature and vibration. They are
+refreshed incrementally from a rowid watermark, so sensor_readings must be append-only.
+Table names start with "_" so the schema context never shows them to the LLM. With partitioned
+sensor storage (sensor_partitions.py) every partition file carries its own rollups; buckets never
+span months, so the TEMP views over them answer the rewritten queries exactly.
+
+    cd src
+    python rollups.py --refresh      # after appending readings
+    python rollups.py --rebuild      # after replacing sensor_readings
+"""
+import argparse
+import os
+import re
+import sqlite3
+
+METRIC_COLUMNS = ("temperature", "vibration")
+
+GRANULARITIES = {
+    # name: (table, SQLite expression for the bucket start)
+    "hourly": ("_rollup_sensor_hourly", "strftime('%Y-%m-%d %H:00:00', timestamp)"),
+    "daily": ("_rollup_sensor_daily", "strftime('%Y-%m-%d 00:00:00', timestamp)"),
+}
+STATE_TABLE = "_rollup_state"
+
+def _create_tables(conn):
+    metric_defs = ",\n".join(
+        f"cnt_{c} INTEGER, sum_{c} REAL, min_{c} REAL, max_{c} REAL, sumsq_{c} REAL" for c in METRIC_COLUMNS
+    )
+    for table, _ in GRANULARITIES.values():
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                asset_id TEXT,
+                bucket TEXT,
+                n INTEGER,
+                {metric_defs},
+                PRIMARY KEY (asset_id, bucket)
+            )
+        """)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} (name TEXT PRIMARY KEY, last_rowid INTEGER)")
+
+def refresh_rollups(conn, rebuild=False):
+    """
+    Fold readings added since the last refresh into every rollup. Returns the number of new readings.
+    Pass rebuild=True after sensor_readings was recreated rather than appended to.
+    """
+    if rebuild:
+        with conn:
+            for table, _ in GRANULARITIES.values():
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"DROP TABLE IF EXISTS {STATE_TABLE}")
+    _create_tables(conn)
+    row = conn.execute(f"SELECT last_rowid FROM {STATE_TABLE} WHERE name = 'sensor_readings'").fetchone()
+    last_rowid = row[0] if row else 0
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM sensor_readings").fetchone()[0] or 0
+    if max_rowid <= last_rowid:
+        return 0
+
+    aggregates = ", ".join(
+        f"COUNT({c}), SUM({c}), MIN({c}), MAX({c}), SUM({c} * {c})" for c in METRIC_COLUMNS
+    )
+    columns = ", ".join(f"cnt_{c}, sum_{c}, min_{c}, max_{c}, sumsq_{c}" for c in METRIC_COLUMNS)
+    merge = ", ".join(
+        f"cnt_{c} = cnt_{c} + excluded.cnt_{c}, "
+        f"sum_{c} = COALESCE(sum_{c} + excluded.sum_{c}, sum_{c}, excluded.sum_{c}), "
+        f"min_{c} = COALESCE(MIN(min_{c}, excluded.min_{c}), min_{c}, excluded.min_{c}), "
+        f"max_{c} = COALESCE(MAX(max_{c}, excluded.max_{c}), max_{c}, excluded.max_{c}), "
+        f"sumsq_{c} = COALESCE(sumsq_{c} + excluded.sumsq_{c}, sumsq_{c}, excluded.sumsq_{c})"
+        for c in METRIC_COLUMNS
+    )
+    with conn:
+        for table, bucket_expr in GRANULARITIES.values():
+            conn.execute(f"""
+                INSERT INTO {table} (asset_id, bucket, n, {columns})
+                SELECT asset_id, {bucket_expr}, COUNT(*), {aggregates}
+                FROM sensor_readings
+                WHERE rowid > ? AND rowid <= ?
+                GROUP BY 1, 2
+                ON CONFLICT (asset_id, bucket) DO UPDATE SET n = n + excluded.n, {merge}
+            """, (last_rowid, max_rowid))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} (name, last_rowid) VALUES ('sensor_readings', ?)",
+            (max_rowid,),
+        )
+    return max_rowid - last_rowid
+
+def rollups_fresh(conn, schemas=("main",)):
+    """
+    True when the rollups cover every reading currently in sensor_readings, in each of `schemas`
+    (the attached sensor partitions when the data is partitioned).
+    """
+    if not schemas:
+        return False
+    for schema in schemas:
+        try:
+            row = conn.execute(
+                f"SELECT last_rowid FROM {schema}.{STATE_TABLE} WHERE name = 'sensor_readings'"
+            ).fetchone()
+            max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {schema}.sensor_readings").fetchone()[0] or 0
+        except sqlite3.Error:
+            return False
+        if row is None or row[0] != max_rowid:
+            return False
+    return True
+
+_QUERY_RE = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+sensor_readings(?:\s+(?:AS\s+)?(?P<alias>(?!WHERE\b|GROUP\b)\w+))?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?P<tail>\s+(?:HAVING|ORDER\s+BY|LIMIT)\b.*?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_BUCKET_FMT_RE = re.compile(r"%[A-Za-z]")
+_HOUR_LITERAL_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(?: (\d{2}):00(?::00)?)?$")
+_AGGREGATE_TEMPLATES = (
+    ("AVG", "(SUM({p}sum_{c}) * 1.0 / SUM({p}cnt_{c}))"),
+    ("SUM", "SUM({p}sum_{c})"),
+    ("MIN", "MIN({p}min_{c})"),
+    ("MAX", "MAX({p}max_{c})"),
+    ("COUNT", "SUM({p}cnt_{c})"),
+)
+# Calls that aggregate over rows; after rewriting, each must read one of the rollup columns
+_AGGREGATE_CALL_RE = re.compile(r"\b(?:AVG|SUM|MIN|MAX|COUNT|TOTAL|GROUP_CONCAT|STRING_AGG)\s*\(([^()]*)\)", re.IGNORECASE)
+_ROLLUP_ARGUMENT_RE = re.compile(
+    rf"^\s*(?:\w+\.)?(?:n|(?:cnt|sum|min|max)_(?:{'|'.join(METRIC_COLUMNS)}))\s*$", re.IGNORECASE
+)
+
+class RollupRewriter:
+    """
+    Rewrites GROUP BY asset_id / time-bucket aggregations over sensor_readings to read the rollups.
+
+    Only a conservative shape is accepted: a single-table SELECT whose non-aggregate expressions are
+    asset_id or strftime()/date() buckets no finer than an hour, whose aggregates are
+    AVG/SUM/MIN/MAX/COUNT over temperature or vibration (or COUNT(*) / COUNT(1)), and whose WHERE
+    clause is an AND of asset_id equality/IN tests and `timestamp >= / <` literals aligned to the
+    bucket. Any other aggregate (COUNT(asset_id), SUM(1), ...) would count rollup rows rather than
+    readings, so it keeps the query on the raw table.
+    Anything else returns None and runs against the raw table. Sums are re-associated per bucket,
+    so floating-point results can differ from the raw scan in the last bits.
+    """
+    def rewrite(self, sql):
+        match = _QUERY_RE.match(sql)
+        if match is None or re.search(r"\bJOIN\b|\bUNION\b|\bSELECT\b.*\bSELECT\b", sql, re.IGNORECASE | re.DOTALL):
+            return None
+        alias = match.group("alias")
+        # Optional qualifier in front of a column: "s." or "sensor_readings."
+        ref = rf"(?:{re.escape(alias)}\.|sensor_readings\.)" if alias else r"(?:sensor_readings\.)"
+        state = {"granularity": "daily"}
+
+        bucket_re = re.compile(
+            rf"strftime\(\s*'(?P<fmt>[^']*)'\s*,\s*(?P<p>{ref})?timestamp\s*\)"
+            rf"|date\(\s*(?P<p2>{ref})?timestamp\s*\)",
+            re.IGNORECASE,
+        )
+
+        def bucket(m):
+            if m.group("fmt") is None:
+                return f"date({m.group('p2') or ''}bucket)"
+            specifiers = set(_BUCKET_FMT_RE.findall(m.group("fmt")))
+            if not specifiers <= {"%Y", "%m", "%d", "%H"}:
+                raise _NotEligible()
+            if "%H" in specifiers:
+                state["granularity"] = "hourly"
+            return f"strftime('{m.group('fmt')}', {m.group('p') or ''}bucket)"
+
+        def substitute(text):
+            text = bucket_re.sub(bucket, text)
+            # COUNT(*) and COUNT of a non-NULL literal count readings, which is the bucket's n
+            text = re.sub(r"\bCOUNT\(\s*(?:\*|\d+|'[^']*')\s*\)", "SUM(n)", text, flags=re.IGNORECASE)
+            for name, template in _AGGREGATE_TEMPLATES:
+                text = re.sub(
+                    rf"\b{name}\(\s*(?P<p>{ref})?(?P<c>{'|'.join(METRIC_COLUMNS)})\s*\)",
+                    lambda m: template.format(p=m.group("p") or "", c=m.group("c")),
+                    text, flags=re.IGNORECASE,
+                )
+            return text
+
+        def substitute_select(text):
+            items = []
+            for item in _split_top_level(text):
+                new = substitute(item)
+                # Name unaliased rewritten expressions after the original text, e.g. "MAX(temperature)"
+                has_alias = re.search(r"\s\w+\s*$", item.rsplit(")", 1)[-1])
+                items.append((new, None if new == item or has_alias else item.strip()))
+            return items
+
+        try:
+            select_items = substitute_select(match.group("select"))
+            group = substitute(match.group("group"))
+            tail = substitute(match.group("tail") or "")
+            where = match.group("where")
+            if where:
+                where = self._rewrite_where(where, ref, state)
+        except _NotEligible:
+            return None
+
+        # Any raw column still referenced means the query needs per-reading data
+        remaining = " ".join([new for new, _ in select_items] + [group, tail, where or ""])
+        if re.search(r"\b(reading_id|timestamp|temperature|vibration)\b|\bDISTINCT\b|\bOVER\b", remaining, re.IGNORECASE):
+            return None
+        # ... and so does an aggregate the templates did not produce (nested calls included)
+        if re.search(r"\b(?:AVG|SUM|MIN|MAX|COUNT|TOTAL|GROUP_CONCAT|STRING_AGG)\s*\(", _AGGREGATE_CALL_RE.sub(
+            lambda m: "" if _ROLLUP_ARGUMENT_RE.match(m.group(1)) else m.group(0), remaining
+        ), re.IGNORECASE):
+            return None
+
+        table = GRANULARITIES[state["granularity"]][0]
+        from_clause = f"{table} AS {alias}" if alias else table
+        unqualify = lambda text: re.sub(r"\bsensor_readings\.", "", text, flags=re.IGNORECASE)
+        select = ", ".join(
+            unqualify(new.strip()) if name is None else f'{unqualify(new.strip())} AS "{name}"'
+            for new, name in select_items
+        )
+        group, tail = unqualify(group), unqualify(tail)
+        sql = f"SELECT {select} FROM {from_clause}"
+        if where:
+            sql += f" WHERE {where}"
+        return f"{sql} GROUP BY {group}{tail};"
+
+    def _rewrite_where(self, where, ref, state):
+        rewritten = []
+        for conjunct in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE):
+            c = conjunct.strip()
+            if re.fullmatch(rf"{ref}?asset_id\s*(?:=\s*'[^']*'|IN\s*\(\s*'[^']*'(?:\s*,\s*'[^']*')*\s*\))", c, re.IGNORECASE):
+                rewritten.append(re.sub(r"^sensor_readings\.", "", c, flags=re.IGNORECASE))
+                continue
+            # Only bucket-aligned >= / < bounds select whole buckets, so only those stay exact
+            m = re.fullmatch(rf"(?P<p>{ref})?timestamp\s*(?P<op>>=|<)\s*'(?P<lit>[^']*)'", c, re.IGNORECASE)
+            aligned = _HOUR_LITERAL_RE.match(m.group("lit")) if m else None
+            if aligned is None:
+                raise _NotEligible()
+            if aligned.group(1) not in (None, "00"):
+                state["granularity"] = "hourly"
+            prefix = m.group("p") or ""
+            if prefix.lower() == "sensor_readings.":
+                prefix = ""
+            rewritten.append(f"{prefix}bucket {m.group('op')} '{m.group('lit')}'")
+        return " AND ".join(rewritten)
+
+class _NotEligible(Exception):
+    pass
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or string literals."""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def _data_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(_data_dir(), "db1_sensors.db"))
+    parser.add_argument("--refresh", action="store_true", help="fold new readings into the rollups")
+    parser.add_argument("--rebuild", action="store_true", help="drop and rebuild the rollups from scratch")
+    args = parser.parse_args()
+    if args.refresh or args.rebuild:
+        conn = sqlite3.connect(args.db)
+        try:
+            print(f"Rolled up {refresh_rollups(conn, rebuild=args.rebuild)} new readings.")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+SAMPLE_ROWS = 2
+MAX_SAMPLE_VALUE_LEN = 100
+
+class SchemaContext:
+    """Rendered prompt schema for one role: ordered (qualified_table, block) pairs plus their fingerprint."""
+    def __init__(self, fingerprint, tables, stat_key=None, schema_versions=None):
+        self.fingerprint = fingerprint
+        self.tables = tables
+        self.stat_key = stat_key
+        # PRAGMA schema_version per attached file when the tables were read
+        self.schema_versions = schema_versions
+        self._columns = None
+        self._identifier_words = None
+
+    @property
+    def table_names(self):
+        return [name for name, _ in self.tables]
+
+    @property
+    def columns(self):
+        """{qualified_table: [column, ...]}, read back from the rendered CREATE TABLE blocks."""
+        return {name: list(types) for name, types in self.column_types.items()}
+
+    @property
+    def column_types(self):
+        """{qualified_table: {column: declared type}}; the type is "" when the column declares none."""
+        if self._columns is None:
+            columns = {}
+            for name, block in self.tables:
+                create = block.split("\n)", 1)[0]
+                parts = [line.strip().rstrip(",").split(None, 1) for line in create.split("\n")[1:] if line.strip()]
+                columns[name] = {part[0]: (part[1] if len(part) > 1 else "") for part in parts}
+            self._columns = columns
+        return self._columns
+
+    @property
+    def identifier_words(self):
+        """Words of the table and column names ("work_orders" -> "work", "orders"), lower-cased."""
+        if self._identifier_words is None:
+            words = set()
+            for name, types in self.column_types.items():
+                for identifier in [name, *types]:
+                    words.update(w for w in identifier.lower().replace(".", "_").split("_") if w)
+            self._identifier_words = frozenset(words)
+        return self._identifier_words
+
+    def render(self, table_names=None):
+        if table_names is None:
+            return "\n\n".join(block for _, block in self.tables)
+        wanted = set(table_names)
+        return "\n\n".join(block for name, block in self.tables if name in wanted)
+
+class SchemaContextCache:
+    """
+    Builds each role's `table_info` once, straight from the attached databases' real schemas.
+    The fingerprint hashes the role and its CREATE TABLE statements only, so data writes keep
+    cached SQL valid. File mtime/size decide when anything is re-read: with the same PRAGMA
+    schema_version only the sample rows are refreshed, otherwise the schema is rebuilt. Entries
+    (with their stat and schema versions) are persisted as JSON so a cold start does not pay for
+    reflection or sample-row queries.
+    """
+    def __init__(self, cache_path=None, sample_rows=SAMPLE_ROWS):
+        self.cache_path = cache_path
+        self.sample_rows = sample_rows
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {"hits": 0, "misses": 0, "sample_refreshes": 0, "disk_loads": 0}
+        self._load()
+
+    def get(self, role, files):
+        """`files` is [(schema_name, path)] with "main" first, as returned by DBManager.role_files."""
+        stat_key = _stat_key(files)
+        with self._lock:
+            entry = self._entries.get(role)
+            # Fast path: nothing on disk moved, so no need to open a connection at all
+            if entry is not None and entry.stat_key == stat_key:
+                self._stats["hits"] += 1
+                return entry
+
+        # A file changed: re-read the tables and sample rows. The fingerprint only moves with the DDL.
+        schema_versions = self._schema_versions(files)
+        tables = self._build(files)
+        if entry is not None and entry.schema_versions == schema_versions:
+            # Data-only write: same CREATE statements, fresher sample rows
+            entry = SchemaContext(entry.fingerprint, tables, stat_key, schema_versions)
+            counter = "sample_refreshes"
+        else:
+            entry = SchemaContext(self.fingerprint(role, tables), tables, stat_key, schema_versions)
+            counter = "misses"
+        with self._lock:
+            self._stats[counter] += 1
+            self._entries[role] = entry
+            self._save()
+        return entry
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    @staticmethod
+    def fingerprint(role, tables):
+        # Sample rows follow the CREATE statement after a blank line and are left out
+        raw = json.dumps([role, [block.split("\n\n", 1)[0] for _, block in tables]])
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def _schema_versions(self, files):
+        conn = _connect(files)
+        try:
+            return [[alias, conn.execute(f"PRAGMA {alias}.schema_version").fetchone()[0]] for alias, _ in files]
+        finally:
+            conn.close()
+
+    def _build(self, files):
+        conn = _connect(files)
+        try:
+            main_tables = set(_list_tables(conn, "main"))
+            tables = []
+            for alias, _ in files:
+                for table in _list_tables(conn, alias):
+                    # Attached files carry their own copies of the shared dimension tables;
+                    # the LLM should only see the ones in the main database.
+                    if alias != "main" and table in main_tables:
+                        continue
+                    qualified = table if alias == "main" else f"{alias}.{table}"
+                    tables.append((qualified, self._render_table(conn, alias, table, qualified)))
+        finally:
+            conn.close()
+        return tables
+
+    def _render_table(self, conn, alias, table, qualified):
+        columns = conn.execute(f'PRAGMA {alias}.table_info("{table}")').fetchall()
+        column_defs = ",\n".join(f"\t{col[1]} {col[2] or ''}".rstrip() for col in columns)
+        create = f"CREATE TABLE {qualified} (\n{column_defs}\n)"
+        if not self.sample_rows:
+            return create
+
+        cursor = conn.execute(f'SELECT * FROM {alias}."{table}" LIMIT {int(self.sample_rows)}')
+        header = "\t".join(col[0] for col in cursor.description)
+        rows = [
+            "\t".join(str(value)[:MAX_SAMPLE_VALUE_LEN] for value in row)
+            for row in cursor.fetchall()
+        ]
+        sample = "\n".join([header] + rows)
+        return (
+            f"{create}\n\n/*\n{self.sample_rows} rows from {qualified} table:\n{sample}\n*/"
+        )
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return
+        for role, entry in raw.items():
+            stat_key = entry.get("stat_key")
+            self._entries[role] = SchemaContext(
+                entry["fingerprint"], [tuple(t) for t in entry["tables"]],
+                tuple(tuple(s) for s in stat_key) if stat_key else None, entry.get("schema_versions"),
+            )
+            self._stats["disk_loads"] += 1
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        raw = {
+            role: {"fingerprint": entry.fingerprint, "tables": entry.tables, "stat_key": entry.stat_key,
+                   "schema_versions": entry.schema_versions}
+            for role, entry in self._entries.items()
+        }
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(raw, f)
+        os.replace(tmp_path, self.cache_path)
+
+def _stat_key(files):
+    key = []
+    for alias, path in files:
+        st = os.stat(path)
+        key.append((alias, st.st_mtime_ns, st.st_size))
+    return tuple(key)
+
+def _connect(files):
+    conn = sqlite3.connect(files[0][1])
+    for alias, path in files[1:]:
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+    return conn
+
+def _list_tables(conn, alias):
+    rows = conn.execute(
+        f"SELECT name FROM {alias}.sqlite_master "
+        # Leading "_" marks internal tables (e.g. rollups) that the LLM should not see
+        "WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '\\_%' ESCAPE '\\' "
+        "ORDER BY name"
+    ).fetchall()
+    return [row[0] for row in rows]
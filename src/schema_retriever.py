@@ -0,0 +1,173 @@
+"""
+Offline schema retriever: picks the tables a question needs so the prompt carries only their
+CREATE statements (and sample rows) instead of the role's whole schema.
+
+Tables are scored with a synonym map ("work orders" -> maintenance.work_orders) plus TF-IDF
+cosine between the question and each table's rendered block (name, columns, sample values).
+Join-key tables such as assets_shared are always kept. When nothing scores confidently the
+full schema is used, so pruning can only shorten prompts, never starve them.
+"""
+import math
+import re
+import threading
+from collections import Counter
+
+# Phrase -> tables it implies; phrases are matched on stemmed words
+TABLE_SYNONYMS = {
+    "work order": ["maintenance.work_orders"],
+    "maintenance": ["maintenance.work_orders"],
+    "repair": ["maintenance.work_orders"],
+    "ticket": ["maintenance.work_orders"],
+    "cost": ["maintenance.work_orders"],
+    "expense": ["maintenance.work_orders"],
+    "priority": ["maintenance.work_orders"],
+    "blocked": ["maintenance.work_orders"],
+    "in progress": ["maintenance.work_orders"],
+    "sensor": ["sensor_readings"],
+    "reading": ["sensor_readings"],
+    "vibration": ["sensor_readings"],
+    "temperature": ["sensor_readings"],
+    "temp": ["sensor_readings"],
+    "hot": ["sensor_readings"],
+    "trend": ["sensor_readings"],
+    "hourly": ["sensor_readings"],
+    "revenue": ["revenue.asset_revenue"],
+    "sales": ["revenue.asset_revenue"],
+    "income": ["revenue.asset_revenue"],
+    "earning": ["revenue.asset_revenue"],
+    "financial": ["revenue.asset_revenue"],
+    "profit": ["revenue.asset_revenue"],
+    "usd": ["revenue.asset_revenue"],
+    "quarter": ["revenue.asset_revenue"],
+    "region": ["revenue.asset_revenue"],
+    "employee": ["employees_shared"],
+    "staff": ["employees_shared"],
+    "worker": ["employees_shared"],
+    "operator": ["employees_shared"],
+    "technician": ["employees_shared", "maintenance.work_orders"],
+    "engineer": ["employees_shared"],
+    "clearance": ["employees_shared"],
+    "who": ["employees_shared"],
+    "asset": ["assets_shared"],
+    "machine": ["assets_shared"],
+    "equipment": ["assets_shared"],
+    "plant": ["assets_shared"],
+    "department": ["assets_shared"],
+    "critical": ["assets_shared"],
+    "criticality": ["assets_shared"],
+}
+# Shared dimension tables every join goes through
+ALWAYS_INCLUDE = ("assets_shared",)
+# Tokens every table block contains, which carry no signal
+_STOPWORDS = {
+    "create", "table", "rows", "from", "text", "real", "integer", "timestamp", "the", "a", "an",
+    "of", "for", "and", "or", "in", "on", "by", "with", "to", "is", "are", "what", "show", "me",
+    "list", "all", "top", "which", "how", "many", "per", "each", "highest", "lowest", "average",
+}
+_WORD_RE = re.compile(r"[a-z][a-z0-9]*")
+
+def _stem(word):
+    # Plural folding is enough for schema vocabulary ("orders" -> "order")
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def _words(text):
+    # Identifiers split on "_" / "." so asset_revenue yields "asset" and "revenue"
+    return [_stem(w) for w in _WORD_RE.findall(text.lower().replace("_", " ")) if w not in _STOPWORDS]
+
+def estimate_tokens(text):
+    return len(text) // 4
+
+class SchemaSelection:
+    def __init__(self, table_names, scores, confidence, full_tokens, selected_tokens):
+        # None means "use the full schema" (low confidence)
+        self.table_names = table_names
+        self.scores = scores
+        self.confidence = confidence
+        self.full_tokens = full_tokens
+        self.selected_tokens = selected_tokens
+
+    @property
+    def pruned(self):
+        return self.table_names is not None
+
+    @property
+    def tokens_saved(self):
+        return self.full_tokens - self.selected_tokens
+
+class SchemaRetriever:
+    """
+    `min_score`: a table is kept when its score reaches this (synonym hits count 1.0 each, TF-IDF
+    cosine adds 0..1). `min_confidence`: below this best score the full schema is used instead.
+    """
+    def __init__(self, synonyms=None, always_include=ALWAYS_INCLUDE, min_score=0.2, min_confidence=0.3):
+        self.synonyms = [
+            (" ".join(_stem(w) for w in phrase.split()), tables)
+            for phrase, tables in (TABLE_SYNONYMS if synonyms is None else synonyms).items()
+        ]
+        self.always_include = always_include
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def select(self, context, question):
+        """Score `context` (a SchemaContext) against the question; returns a SchemaSelection."""
+        full_tokens = estimate_tokens(context.render())
+        scores = self.score(context, question)
+        candidates = {name: score for name, score in scores.items() if name not in self.always_include}
+        confidence = max(candidates.values(), default=0.0)
+        if confidence < self.min_confidence:
+            return SchemaSelection(None, scores, confidence, full_tokens, full_tokens)
+
+        names = [
+            name for name in context.table_names
+            if name in self.always_include or scores.get(name, 0.0) >= self.min_score
+        ]
+        selected_tokens = estimate_tokens(context.render(names))
+        return SchemaSelection(names, scores, confidence, full_tokens, selected_tokens)
+
+    def score(self, context, question):
+        words = _words(question)
+        text = " " + " ".join(words) + " "
+        index = self._index(context)
+        scores = {name: 0.0 for name in context.table_names}
+
+        for phrase, tables in self.synonyms:
+            if f" {phrase} " in text:
+                for table in tables:
+                    if table in scores:
+                        scores[table] += 1.0
+
+        query_vec = index.vector(Counter(words))
+        for name, doc_vec in index.docs.items():
+            scores[name] += sum(v * doc_vec.get(t, 0.0) for t, v in query_vec.items())
+        return scores
+
+    def _index(self, context):
+        # The fingerprint covers only the DDL; sample rows refresh under it and are indexed too
+        key = (context.fingerprint, hash(tuple(block for _, block in context.tables)))
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = _TfidfIndex(context.tables)
+                # One index per live schema; old fingerprints are not needed again
+                if len(self._indexes) >= 32:
+                    self._indexes.clear()
+                self._indexes[key] = index
+            return index
+
+class _TfidfIndex:
+    def __init__(self, tables):
+        counts = {name: Counter(_words(block)) for name, block in tables}
+        doc_freq = Counter(token for c in counts.values() for token in c)
+        n_docs = len(counts)
+        self.idf = {t: math.log((1 + n_docs) / (1 + df)) + 1 for t, df in doc_freq.items()}
+        self.docs = {name: self.vector(c) for name, c in counts.items()}
+
+    def vector(self, counts):
+        # Words unseen in any table get no weight
+        vec = {t: c * self.idf[t] for t, c in counts.items() if t in self.idf}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
@@ -0,0 +1,472 @@
+"""
+Time-partitioned storage for sensor_readings, with partition pruning at query time.
+
+Readings live in one SQLite file per month under data/sensor_partitions/ (sensors_2025_06.db),
+each holding a sensor_readings table plus its own indexes and rollups. Compaction merges closed
+months into range files (sensors_2024_01_2024_12.db); a range file hides the monthly or smaller
+range files it covers, so a merge can be published before its inputs are deleted.
+
+At query time DBManager ATTACHes only the partitions the statement's `timestamp` bounds can
+touch and defines TEMP views named sensor_readings, _rollup_sensor_hourly and
+_rollup_sensor_daily over them, so generated SQL and RollupRewriter output run unchanged.
+db1_sensors.db keeps an empty sensor_readings table as the schema the prompt shows.
+
+    cd src
+    python sensor_partitions.py --migrate                # split db1_sensors.db into partitions
+    python sensor_partitions.py --compact-after-months 3 --retain-months 24
+
+One writer process at a time; readers may run throughout.
+"""
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from index_advisor import table_row_count
+from rollups import GRANULARITIES, refresh_rollups
+
+SENSOR_TABLE = "sensor_readings"
+SENSOR_COLUMNS_DDL = """
+    reading_id INTEGER,
+    asset_id TEXT,
+    timestamp TIMESTAMP,
+    temperature REAL,
+    vibration REAL
+"""
+PARTITION_INDEXES = [
+    ("idx_sensor_asset_time", ("asset_id", "timestamp")),
+    ("idx_sensor_time", ("timestamp",)),
+]
+DEFAULT_MAX_ATTACHED = 10
+
+_FILE_RE = re.compile(r"^sensors_(\d{4})_(\d{2})(?:_(\d{4})_(\d{2}))?\.db$")
+_ALIAS_RE = re.compile(r"^sensors_\d{4}_\d{2}(?:_\d{4}_\d{2})?$")
+
+# Pruning only trusts a single SELECT whose WHERE is a plain conjunction
+_UNPRUNABLE_RE = re.compile(r"\b(?:OR|NOT|CASE|UNION|INTERSECT|EXCEPT|LEFT|RIGHT|FULL|OUTER)\b", re.IGNORECASE)
+_WHERE_RE = re.compile(r"\bWHERE\b(?P<where>.*?)(?=\bGROUP\s+BY\b|\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|;|$)",
+                       re.IGNORECASE | re.DOTALL)
+_SENSOR_REF_RE = re.compile(
+    r"\b(?:FROM|JOIN)\s+(?:main\.)?sensor_readings\b(?:\s+(?:AS\s+)?(?P<alias>\w+))?", re.IGNORECASE
+)
+_VALUE = r"(?:'(?P<{0}lit>\d{{4}}-\d{{2}}[^']*)'|(?P<{0}fn>(?:datetime|date)\(\s*'now'(?:\s*,\s*'[^']*')*\s*\)))"
+_COMPARISON_RE = re.compile(
+    rf"(?:\b(?P<q>\w+)\.)?\btimestamp\s*(?:(?P<op><=|>=|<|>|=)\s*{_VALUE.format('a')}"
+    rf"|BETWEEN\s+{_VALUE.format('b')}\s+AND\s+{_VALUE.format('c')})",
+    re.IGNORECASE,
+)
+_MONTH_START_RE = re.compile(r"^\d{4}-\d{2}(?:-01(?:[ T]00:00(?::00(?:\.0+)?)?)?)?$")
+# datetime('now', ...) bounds are evaluated by SQLite itself so modifiers mean what they mean in the query
+_now_conn = sqlite3.connect(":memory:", check_same_thread=False)
+_now_lock = threading.Lock()
+
+class PartitionLimitError(ValueError):
+    pass
+
+class Partition:
+    """One partition file covering the months first..last (inclusive, "YYYY-MM")."""
+    def __init__(self, path, first, last):
+        self.path = path
+        self.first = first
+        self.last = last
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def alias(self):
+        return self.filename[:-3]
+
+    def covers(self, month):
+        return self.first <= month <= self.last
+
+def partition_filename(first, last=None):
+    name = "sensors_" + first.replace("-", "_")
+    if last is not None and last != first:
+        name += "_" + last.replace("-", "_")
+    return name + ".db"
+
+def time_bounds(sql):
+    """
+    (first, last) months the statement's sensor_readings rows can fall in; None for an open end.
+    Bounds come from `timestamp` comparisons against literals or date/datetime('now', ...) in the
+    WHERE clause, and only when pruning cannot change the result.
+    """
+    refs = _SENSOR_REF_RE.findall(sql)
+    if len(refs) != 1 or len(re.findall(r"\bSELECT\b", sql, re.IGNORECASE)) != 1 or _UNPRUNABLE_RE.search(sql):
+        return None, None
+    where = _WHERE_RE.search(sql)
+    if where is None:
+        return None, None
+    names = {"sensor_readings", refs[0].lower()} if refs[0] else {"sensor_readings"}
+
+    first, last = None, None
+    for m in _COMPARISON_RE.finditer(where.group("where")):
+        if m.group("q") and m.group("q").lower() not in names:
+            continue
+        if m.group("op"):
+            value = _bound_value(m, "a")
+            lower = upper = None
+            if m.group("op") in (">", ">=", "="):
+                lower = value[:7]
+            if m.group("op") in ("<", "<=", "="):
+                upper = _upper_month(value, inclusive=m.group("op") != "<")
+        else:
+            lower, upper = _bound_value(m, "b")[:7], _upper_month(_bound_value(m, "c"), inclusive=True)
+        if lower is not None and (first is None or lower > first):
+            first = lower
+        if upper is not None and (last is None or upper < last):
+            last = upper
+    return first, last
+
+def _bound_value(match, prefix):
+    if match.group(prefix + "lit") is not None:
+        return match.group(prefix + "lit")
+    with _now_lock:
+        return _now_conn.execute(f"SELECT {match.group(prefix + 'fn')}").fetchone()[0]
+
+def _upper_month(value, inclusive):
+    if not inclusive and _MONTH_START_RE.match(value):
+        # "< '2025-07-01'" excludes all of July
+        return _add_months(value[:7], -1)
+    return value[:7]
+
+def _add_months(month, n):
+    year, mon = int(month[:4]), int(month[5:7]) + n
+    year, mon = year + (mon - 1) // 12, (mon - 1) % 12 + 1
+    return f"{year:04d}-{mon:02d}"
+
+def _month_of(day):
+    return day.strftime("%Y-%m")
+
+class PartitionBinding:
+    def __init__(self, partitions, row_count):
+        self.partitions = partitions
+        # For the validator's plan costing: the view's rows, not the empty template's
+        self.row_counts = {("main", SENSOR_TABLE): row_count}
+
+    @property
+    def schemas(self):
+        return [p.alias for p in self.partitions]
+
+    def table_labels(self, tables):
+        """SQLCheck.tables with partition reads ("sensors_2025_06.sensor_readings") named after their table."""
+        schemas = set(self.schemas)
+        return sorted({t.split(".", 1)[1] if t.split(".", 1)[0] in schemas else t for t in tables})
+
+class SensorPartitions:
+    def __init__(self, directory, connection_profile=None):
+        self.directory = directory
+        self.connection_profile = connection_profile
+        self._lock = threading.Lock()
+        self._listing = (None, [])
+        self._row_counts = {}
+
+    def partitions(self):
+        """Live partitions ordered by first month; the directory is rescanned only when it changes."""
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if self._listing[0] == dir_mtime:
+                return self._listing[1]
+        found = []
+        for name in os.listdir(self.directory):
+            m = _FILE_RE.match(name)
+            if m is None:
+                continue
+            first = f"{m.group(1)}-{m.group(2)}"
+            last = f"{m.group(3)}-{m.group(4)}" if m.group(3) else first
+            found.append(Partition(os.path.join(self.directory, name), first, last))
+        # A range file supersedes every partition it contains (its inputs may not be deleted yet)
+        live = [
+            p for p in found
+            if not any(o is not p and o.first <= p.first and p.last <= o.last
+                       and (o.first, o.last) != (p.first, p.last) for o in found)
+        ]
+        live.sort(key=lambda p: p.first)
+        with self._lock:
+            self._listing = (dir_mtime, live)
+        return live
+
+    def for_query(self, sql):
+        first, last = time_bounds(sql)
+        return [
+            p for p in self.partitions()
+            if (first is None or p.last >= first) and (last is None or p.first <= last)
+        ]
+
+    def versions(self, sql=None):
+        """(alias, mtime_ns, size) of the partitions `sql` reads (all of them when sql is None)."""
+        versions = []
+        for p in (self.partitions() if sql is None else self.for_query(sql)):
+            try:
+                st = os.stat(p.path)
+                versions.append((p.alias, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                versions.append((p.alias, None, None))
+        return tuple(versions)
+
+    def bind(self, conn, sql, reserved_attachments=0):
+        """
+        Attach the partitions `sql` needs to a pooled connection (detaching the rest) and point the
+        TEMP views at them. Connections keep their binding, so repeated windows cost nothing.
+        """
+        selected = self.for_query(sql)
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, "getlimit") else DEFAULT_MAX_ATTACHED
+        if len(selected) > limit - reserved_attachments:
+            raise PartitionLimitError(
+                f"Query spans {len(selected)} sensor partitions but at most {limit - reserved_attachments} "
+                f"can be attached; add a timestamp range to the question, or compact older months "
+                f"(sensor_partitions.py --compact-after-months N)"
+            )
+        attached = {row[1] for row in conn.execute("PRAGMA database_list") if _ALIAS_RE.match(row[1])}
+        wanted = {p.alias: p for p in selected}
+        views = self._view_definitions(conn, selected, attached)
+        current = dict(conn.execute("SELECT name, sql FROM temp.sqlite_master WHERE type = 'view'").fetchall())
+
+        if attached != set(wanted) or any(current.get(name) != f"CREATE VIEW {name} AS {body}" for name, body in views):
+            with _schema_writes(conn):
+                for name in current:
+                    conn.execute(f'DROP VIEW IF EXISTS temp."{name}"')
+                for alias in attached - set(wanted):
+                    conn.execute(f"DETACH DATABASE {alias}")
+                for alias in set(wanted) - attached:
+                    self._attach(conn, wanted[alias])
+                for name, body in self._view_definitions(conn, selected, set(wanted)):
+                    conn.execute(f"CREATE TEMP VIEW {name} AS {body}")
+        return PartitionBinding(selected, sum(self._row_count(conn, p) for p in selected))
+
+    def _attach(self, conn, partition):
+        if self.connection_profile is not None:
+            self.connection_profile.attach(conn, partition.alias, partition.filename, partition.path)
+        else:
+            conn.execute(f"ATTACH DATABASE ? AS {partition.alias}", (partition.path,))
+
+    def _view_definitions(self, conn, selected, attached):
+        """[(view, body)] for the raw view and, when every partition has them, the rollup views."""
+        if not selected:
+            # Nothing in range: the empty template keeps the query valid
+            return [(SENSOR_TABLE, f"SELECT * FROM main.{SENSOR_TABLE}")]
+        views = [(SENSOR_TABLE, " UNION ALL ".join(f"SELECT * FROM {p.alias}.{SENSOR_TABLE}" for p in selected))]
+        if all(p.alias in attached for p in selected):
+            for table, _ in GRANULARITIES.values():
+                if all(_has_table(conn, p.alias, table) for p in selected):
+                    views.append((table, " UNION ALL ".join(f"SELECT * FROM {p.alias}.{table}" for p in selected)))
+        return views
+
+    def _row_count(self, conn, partition):
+        try:
+            st = os.stat(partition.path)
+        except FileNotFoundError:
+            return 0
+        key = (partition.path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key in self._row_counts:
+                return self._row_counts[key]
+        count = table_row_count(conn, partition.alias, SENSOR_TABLE) or 0
+        with self._lock:
+            if len(self._row_counts) > 1024:
+                self._row_counts.clear()
+            self._row_counts[key] = count
+        return count
+
+@contextmanager
+def _schema_writes(conn):
+    # TEMP views are schema writes, which query_only refuses; the files themselves stay mode=ro
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    if query_only:
+        conn.execute("PRAGMA query_only = OFF")
+    try:
+        yield
+    finally:
+        if query_only:
+            conn.execute("PRAGMA query_only = ON")
+
+def _has_table(conn, schema, table):
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+def _create_schema(conn):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {SENSOR_TABLE} ({SENSOR_COLUMNS_DDL})")
+    for name, columns in PARTITION_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {SENSOR_TABLE} ({', '.join(columns)})")
+
+class PartitionWriter:
+    """Routes readings to their partition file, creating monthly files as needed."""
+    def __init__(self, partitions, refresh=True):
+        self.partitions = partitions
+        # Fold each write into the partition's rollups straight away
+        self.refresh = refresh
+        os.makedirs(partitions.directory, exist_ok=True)
+
+    def write(self, rows):
+        """
+        Append (reading_id, asset_id, timestamp, temperature, vibration) rows. Months already merged
+        into a range file are appended there. Returns {partition filename: rows written}.
+        """
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row[2])[:7], []).append(row)
+        by_file = {}
+        for month, month_rows in by_month.items():
+            existing = next((p for p in self.partitions.partitions() if p.covers(month)), None)
+            path = existing.path if existing else self._create(month)
+            by_file.setdefault(path, []).extend(month_rows)
+
+        written = {}
+        for path, file_rows in by_file.items():
+            conn = sqlite3.connect(path)
+            try:
+                with conn:
+                    conn.executemany(f"INSERT INTO {SENSOR_TABLE} VALUES (?, ?, ?, ?, ?)", file_rows)
+                if self.refresh:
+                    refresh_rollups(conn)
+            finally:
+                conn.close()
+            written[os.path.basename(path)] = len(file_rows)
+        return written
+
+    def apply_retention(self, retain_months, today=None):
+        """Delete partitions that end before the last `retain_months` months; returns their names."""
+        cutoff = _add_months(_month_of(today or datetime.date.today()), -(retain_months - 1))
+        removed = []
+        for p in self.partitions.partitions():
+            if p.last < cutoff:
+                # Readers that still have it attached keep the open file until they rebind
+                os.remove(p.path)
+                removed.append(p.filename)
+        return removed
+
+    def compact(self, after_months, today=None):
+        """
+        Merge every closed month older than `after_months` into one range file per year, sorted by
+        timestamp, indexed, ANALYZEd and VACUUMed, with rollups rebuilt. Returns the new filenames.
+        """
+        cutoff = _add_months(_month_of(today or datetime.date.today()), -after_months)
+        by_year = {}
+        for p in self.partitions.partitions():
+            if p.last < cutoff:
+                by_year.setdefault(p.first[:4], []).append(p)
+        created = []
+        for year, sources in sorted(by_year.items()):
+            if len(sources) == 1 and sources[0].first != sources[0].last:
+                # Already one range file
+                continue
+            target = os.path.join(self.partitions.directory,
+                                  partition_filename(sources[0].first, max(p.last for p in sources)))
+            self._merge(sources, target)
+            for p in sources:
+                if p.path != target:
+                    os.remove(p.path)
+            created.append(os.path.basename(target))
+        return created
+
+    def migrate(self, sensors_db_path, chunk_rows=100_000):
+        """
+        Move sensor_readings out of db1_sensors.db into partitions and leave an empty template table
+        (and no rollups) behind. The file is rewritten with VACUUM, so pooled engines rebuild.
+        """
+        conn = sqlite3.connect(sensors_db_path)
+        try:
+            cursor = conn.execute(f"SELECT reading_id, asset_id, timestamp, temperature, vibration "
+                                  f"FROM {SENSOR_TABLE} ORDER BY timestamp")
+            moved = 0
+            refresh, self.refresh = self.refresh, False
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    self.write(rows)
+                    moved += len(rows)
+            finally:
+                self.refresh = refresh
+            if refresh:
+                for p in self.partitions.partitions():
+                    p_conn = sqlite3.connect(p.path)
+                    try:
+                        refresh_rollups(p_conn, rebuild=True)
+                        p_conn.execute("ANALYZE")
+                        p_conn.commit()
+                    finally:
+                        p_conn.close()
+            with conn:
+                conn.execute(f"DELETE FROM {SENSOR_TABLE}")
+                for table, _ in GRANULARITIES.values():
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute("DROP TABLE IF EXISTS _rollup_state")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        return moved
+
+    def _create(self, month):
+        path = os.path.join(self.partitions.directory, partition_filename(month))
+        tmp_path = path + ".tmp"
+        conn = sqlite3.connect(tmp_path)
+        try:
+            _create_schema(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        # Readers only ever see fully initialized files
+        os.replace(tmp_path, path)
+        return path
+
+    def _merge(self, sources, target):
+        tmp_path = target + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(f"CREATE TABLE {SENSOR_TABLE} ({SENSOR_COLUMNS_DDL})")
+            for i, p in enumerate(sources):
+                conn.execute(f"ATTACH DATABASE ? AS src{i}", (p.path,))
+            union = " UNION ALL ".join(f"SELECT * FROM src{i}.{SENSOR_TABLE}" for i in range(len(sources)))
+            with conn:
+                conn.execute(f"INSERT INTO {SENSOR_TABLE} SELECT * FROM ({union}) ORDER BY timestamp")
+            for i in range(len(sources)):
+                conn.execute(f"DETACH DATABASE src{i}")
+            _create_schema(conn)
+            refresh_rollups(conn, rebuild=True)
+            conn.execute("ANALYZE")
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        os.replace(tmp_path, target)
+
+def default_partition_dir(data_dir):
+    return os.path.join(data_dir, "sensor_partitions")
+
+def _data_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=_data_dir())
+    parser.add_argument("--migrate", action="store_true", help="move db1_sensors.db readings into partitions")
+    parser.add_argument("--compact-after-months", type=int, help="merge months older than this into yearly files")
+    parser.add_argument("--retain-months", type=int, help="delete partitions older than this many months")
+    args = parser.parse_args()
+
+    writer = PartitionWriter(SensorPartitions(default_partition_dir(args.data_dir)))
+    if args.migrate:
+        moved = writer.migrate(os.path.join(args.data_dir, "db1_sensors.db"))
+        print(f"Moved {moved} readings into {len(writer.partitions.partitions())} partitions.")
+    if args.compact_after_months is not None:
+        print(f"Compacted into: {', '.join(writer.compact(args.compact_after_months)) or 'nothing to do'}")
+    if args.retain_months is not None:
+        print(f"Removed: {', '.join(writer.apply_retention(args.retain_months)) or 'nothing'}")
+    for p in writer.partitions.partitions():
+        print(f"  {p.filename}: {p.first} .. {p.last}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Local repair of generated SQL that SQLite refuses to prepare, so a typo costs a few milliseconds
+instead of another LLM generation.
+
+The dry run is the prepare SQLValidator already does (EXPLAIN QUERY PLAN, cached per SQL and file
+versions), so a statement that prepares cleanly costs nothing extra at execution. Each prepare
+error is matched against the role's cached schema and fixed in place when the fix is unambiguous:
+
+- "no such table: work_orders"       -> the attached table of that name (maintenance.work_orders),
+                                         or the closest table name the role can see
+- "no such column: s.temprature"     -> the closest column of the table `s` refers to
+- "no such column: s.amount_usd"     -> the alias of the one joined table that has the column
+- "no such column: work_orders.cost" -> the alias given to work_orders in FROM/JOIN
+- "ambiguous column name: asset_id"  -> qualified with the first FROM/JOIN table that has it
+
+A replacement inside SUM/AVG/TOTAL must have a numeric declared type, so SUM(revenue) never
+becomes SUM(revenue_id) on a TEXT column.
+
+Anything else (syntax errors, columns of tables the query does not join) is left to LLMEngine,
+which re-prompts the model with the error at most `max_llm_retries` times. Tables of databases the
+role does not attach are never repaired or retried: the original error is the right answer.
+"""
+import difflib
+import re
+import threading
+
+from index_advisor import table_aliases
+from sql_validator import word_spans
+
+_NO_TABLE_RE = re.compile(r"^no such table: (?:main\.)?(?P<name>[\w.]+)$")
+_NO_COLUMN_RE = re.compile(r"^no such column: (?:(?P<qualifier>\w+)\.)?(?P<column>\w+)$")
+_AMBIGUOUS_RE = re.compile(r"^ambiguous column name: (?:\w+\.)?(?P<column>\w+)$")
+# Aggregates whose argument only makes sense as a number
+_NUMERIC_AGGREGATES = r"(?:SUM|AVG|TOTAL)"
+
+class RepairResult:
+    def __init__(self, sql, error=None, fixes=(), llm_retries=0, retryable=True):
+        self.sql = sql
+        # Prepare error still left after repair, None once the SQL prepares
+        self.error = error
+        # False when the error cannot be fixed by anyone (e.g. a table the role may not read)
+        self.retryable = retryable
+        # Kind of each local fix applied, in order
+        self.fixes = list(fixes)
+        self.llm_retries = llm_retries
+
+class SQLRepairer:
+    """
+    `max_local_fixes`: fixes tried per statement before giving up locally.
+    `max_llm_retries`: re-prompts LLMEngine may spend when local repair fails.
+    `min_similarity`: difflib ratio a misspelled name needs to be replaced by its closest match.
+    """
+    def __init__(self, max_local_fixes=4, max_llm_retries=1, min_similarity=0.7):
+        self.max_local_fixes = max_local_fixes
+        self.max_llm_retries = max_llm_retries
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._stats = {"dry_run_failures": 0, "repaired_locally": 0, "llm_retries": 0, "repaired_by_llm": 0,
+                       "unrepaired": 0, "denied": 0}
+
+    def repair(self, sql, error, dry_run, columns):
+        """
+        Fix `sql` (which failed to prepare with `error`) until `dry_run(sql)` returns None.
+        `columns` is {qualified_table: {column: declared type}} from the schema context (a plain
+        column list works too, without the type check). Returns a RepairResult.
+        """
+        fixes, seen = [], {sql}
+        while error is not None and len(fixes) < self.max_local_fixes:
+            fixed = self.fix(sql, error, columns)
+            if fixed is None or fixed[0] in seen:
+                break
+            sql, kind = fixed
+            seen.add(sql)
+            fixes.append(kind)
+            error = dry_run(sql)
+        return RepairResult(sql, error, fixes)
+
+    def fix(self, sql, error, columns):
+        """One local fix for a prepare error: (new_sql, kind), or None when there is no safe one."""
+        m = _NO_TABLE_RE.match(error)
+        if m:
+            return self._fix_table(sql, m.group("name"), columns)
+        m = _NO_COLUMN_RE.match(error)
+        if m:
+            return self._fix_column(sql, m.group("qualifier"), m.group("column"), columns)
+        m = _AMBIGUOUS_RE.match(error)
+        if m:
+            return self._fix_ambiguous(sql, m.group("column"), columns)
+        return None
+
+    def record(self, result):
+        """Count the outcome of one repair_query call (after any LLM retries)."""
+        with self._lock:
+            self._stats["llm_retries"] += result.llm_retries
+            if result.error is not None and not result.retryable:
+                self._stats["denied"] += 1
+            elif result.error is not None:
+                self._stats["unrepaired"] += 1
+            elif result.llm_retries:
+                self._stats["repaired_by_llm"] += 1
+            elif result.fixes:
+                self._stats["repaired_locally"] += 1
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["dry_run_failures"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _fix_table(self, sql, name, columns):
+        schema, _, table = name.rpartition(".")
+        by_base = {}
+        for qualified in columns:
+            by_base.setdefault(qualified.rpartition(".")[2].lower(), []).append(qualified)
+        if table.lower() in by_base and len(by_base[table.lower()]) == 1:
+            kind, target = "table_prefix", by_base[table.lower()][0]
+        else:
+            match = self._closest(table, list(by_base))
+            if match is None or len(by_base[match]) != 1:
+                return None
+            kind, target = "table_name", by_base[match][0]
+        # Rewrite "[schema.]table" wherever it is not itself a column qualifier
+        replaced = _replace_words(
+            sql, lambda word, prev, nxt, prev_word: (
+                word.lower() == table.lower() and nxt != "."
+                and ((prev == "." and prev_word is not None and prev_word.lower() == schema.lower())
+                     if schema else prev != ".")
+            ),
+            target, include_qualifier=bool(schema),
+        )
+        return (replaced, kind) if replaced != sql else None
+
+    def _fix_column(self, sql, qualifier, column, columns):
+        aliases = {a: _qualified(schema, table) for a, (schema, table) in table_aliases(sql).items()}
+        in_query = {a: columns.get(t, []) for a, t in aliases.items()}
+        if qualifier is None:
+            # Unqualified misspelling: closest column of any table the query reads
+            pool = sorted({c for cols in in_query.values() for c in cols})
+            match = self._closest(column, pool)
+            if match is None or not self._fits_aggregate(sql, None, column, match, in_query.values()):
+                return None
+            replaced = _replace_words(
+                sql, lambda word, prev, nxt, prev_word: (
+                    word.lower() == column.lower() and prev != "." and nxt not in (".", "(")
+                ),
+                match,
+            )
+            return (replaced, "column_name") if replaced != sql else None
+
+        alias = next((a for a in aliases if a.lower() == qualifier.lower()), None)
+        if alias is None:
+            # A table name used as qualifier although FROM gave the table an alias
+            owners = [a for a, t in aliases.items() if t.rpartition(".")[2].lower() == qualifier.lower()]
+            if len(owners) != 1:
+                return None
+            return _replace_qualified(sql, qualifier, column, owners[0], column), "column_qualifier"
+
+        if any(c.lower() == column.lower() for c in in_query[alias]):
+            return None
+        owners = [a for a, cols in in_query.items() if any(c.lower() == column.lower() for c in cols)]
+        if len(owners) == 1:
+            return _replace_qualified(sql, qualifier, column, owners[0], column), "column_qualifier"
+        match = self._closest(column, in_query[alias])
+        if match is None or not self._fits_aggregate(sql, qualifier, column, match, [in_query[alias]]):
+            return None
+        return _replace_qualified(sql, qualifier, column, qualifier, match), "column_name"
+
+    def _fix_ambiguous(self, sql, column, columns):
+        aliases = {a: _qualified(schema, table) for a, (schema, table) in table_aliases(sql).items()}
+        # FROM/JOIN order: the first table is the query's primary entity (usually assets_shared)
+        owner = next(
+            (a for a, t in aliases.items() if any(c.lower() == column.lower() for c in columns.get(t, []))), None
+        )
+        if owner is None:
+            return None
+        replaced = _replace_words(
+            sql, lambda word, prev, nxt, prev_word: (
+                word.lower() == column.lower() and prev != "." and nxt not in (".", "(")
+                and (prev_word or "").upper() != "AS"
+            ),
+            f"{owner}.{column}",
+        )
+        return (replaced, "ambiguous_column") if replaced != sql else None
+
+    def _closest(self, name, candidates):
+        lowered = {c.lower(): c for c in candidates}
+        if name.lower() in lowered:
+            return lowered[name.lower()]
+        matches = difflib.get_close_matches(name.lower(), list(lowered), n=1, cutoff=self.min_similarity)
+        return lowered[matches[0]] if matches else None
+
+    @staticmethod
+    def _fits_aggregate(sql, qualifier, column, match, tables):
+        """False when `column` is the argument of SUM/AVG/TOTAL and `match` is not declared numeric."""
+        ref = rf"{re.escape(qualifier)}\.{re.escape(column)}" if qualifier else re.escape(column)
+        if not re.search(rf"\b{_NUMERIC_AGGREGATES}\s*\([^()]*(?<![\w.]){ref}\b", sql, re.IGNORECASE):
+            return True
+        types = [
+            cols[c] for cols in tables if isinstance(cols, dict) for c in cols if c.lower() == match.lower()
+        ]
+        return all(_affinity(t) in ("INTEGER", "REAL", "NUMERIC") for t in types)
+
+def _affinity(declared):
+    """SQLite's column affinity for a declared type (https://sqlite.org/datatype3.html#affname)."""
+    declared = declared.upper()
+    if "INT" in declared:
+        return "INTEGER"
+    if any(t in declared for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if "BLOB" in declared or not declared:
+        return "BLOB"
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+def _qualified(schema, table):
+    return table if schema in ("", "main") else f"{schema}.{table}"
+
+def _replace_words(sql, predicate, replacement, include_qualifier=False):
+    """
+    Replace each word outside literals/comments for which predicate(word, char before, char after,
+    previous word) holds. With include_qualifier, the "schema." in front of the word goes too.
+    """
+    spans = word_spans(sql)
+    out, pos, prev_word = [], 0, None
+    for i, (word, start, end) in enumerate(spans):
+        prev = sql[start - 1] if start > 0 else ""
+        nxt = sql[end] if end < len(sql) else ""
+        if predicate(word, prev, nxt, prev_word):
+            cut = spans[i - 1][1] if include_qualifier and prev == "." and i > 0 else start
+            out.append(sql[pos:cut])
+            out.append(replacement)
+            pos = end
+        prev_word = word
+    out.append(sql[pos:])
+    return "".join(out)
+
+def _replace_qualified(sql, qualifier, column, new_qualifier, new_column):
+    return re.sub(
+        rf"\b{re.escape(qualifier)}\.{re.escape(column)}\b", f"{new_qualifier}.{new_column}", sql, flags=re.IGNORECASE
+    )
@@ -0,0 +1,303 @@
+"""
+Parser-based SQL validation and cost guard (replaces keyword substring matching).
+
+Two layers, both cached:
+1. parse_statement(): a literal/comment/identifier-aware tokenizer. It accepts exactly one SELECT or
+   WITH statement (trailing prose after the `;` is dropped, a second statement is rejected) and
+   notes whether the statement has a top-level LIMIT. Pure function of the text, so lru_cache'd.
+2. SQLValidator.check(): prepares `EXPLAIN QUERY PLAN <sql>` on the live connection under a
+   SQLite authorizer. SQLite's own parser reports every action; anything other than reading
+   tables and calling functions is denied, and the tables/schemas read are collected. The plan is
+   then costed with table row counts: cartesian joins over large tables are rejected and unbounded
+   full scans of large tables get an automatic LIMIT. Cached per (sql, file versions).
+"""
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from index_advisor import table_aliases, table_row_count
+
+ALLOWED_FIRST_KEYWORDS = ("SELECT", "WITH")
+# Words that start a SQLite statement; seeing one after the first `;` means a second statement
+STATEMENT_KEYWORDS = {
+    "ALTER", "ANALYZE", "ATTACH", "BEGIN", "COMMIT", "CREATE", "DELETE", "DETACH", "DROP", "END",
+    "EXPLAIN", "INSERT", "PRAGMA", "REINDEX", "RELEASE", "REPLACE", "ROLLBACK", "SAVEPOINT",
+    "SELECT", "UPDATE", "VACUUM", "VALUES", "WITH",
+}
+DENIED_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"}
+
+_READ_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+}
+_ACTION_NAMES = {
+    getattr(sqlite3, f"SQLITE_{name}"): name
+    for name in (
+        "CREATE_INDEX", "CREATE_TABLE", "CREATE_TEMP_INDEX", "CREATE_TEMP_TABLE", "CREATE_TEMP_TRIGGER",
+        "CREATE_TEMP_VIEW", "CREATE_TRIGGER", "CREATE_VIEW", "DELETE", "DROP_INDEX", "DROP_TABLE",
+        "DROP_TEMP_INDEX", "DROP_TEMP_TABLE", "DROP_TEMP_TRIGGER", "DROP_TEMP_VIEW", "DROP_TRIGGER",
+        "DROP_VIEW", "INSERT", "PRAGMA", "TRANSACTION", "UPDATE", "ATTACH", "DETACH", "ALTER_TABLE",
+        "REINDEX", "ANALYZE", "CREATE_VTABLE", "DROP_VTABLE", "SAVEPOINT",
+    )
+    if hasattr(sqlite3, f"SQLITE_{name}")
+}
+# Comma-separated FROM items ("FROM a x, b y"), which table_aliases (FROM/JOIN only) does not see
+_COMMA_REF_RE = re.compile(r",\s*([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)?)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+_PLAN_SCAN_RE = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+
+class ParsedStatement:
+    def __init__(self, ok, reason, sql=None, has_limit=False):
+        self.ok = ok
+        self.reason = reason
+        # Single statement, markdown fences and trailing text removed, ending in ";"
+        self.sql = sql
+        self.has_limit = has_limit
+
+def _tokens(text):
+    """
+    Yield (kind, value, depth, start) for words and `;`/`(`/`)` punctuation, skipping string
+    literals, quoted identifiers and comments. `depth` is the parenthesis depth of the token.
+    """
+    i, n, depth = 0, len(text), 0
+    while i < n:
+        c = text[i]
+        if c in "'\"`[":
+            close = "]" if c == "[" else c
+            j = i + 1
+            while j < n:
+                if text[j] == close:
+                    # '' and "" are escaped quotes inside literals / identifiers
+                    if close != "]" and j + 1 < n and text[j + 1] == close:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            if j >= n:
+                yield "error", "unterminated literal", depth, i
+                return
+            yield "literal", text[i:j + 1], depth, i
+            i = j + 1
+        elif text.startswith("--", i):
+            j = text.find("\n", i)
+            i = n if j < 0 else j + 1
+        elif text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+        elif c == "(":
+            yield "punct", c, depth, i
+            depth += 1
+            i += 1
+        elif c == ")":
+            depth -= 1
+            yield "punct", c, depth, i
+            i += 1
+        elif c == ";":
+            yield "punct", c, depth, i
+            i += 1
+        elif c.isalpha() or c == "_":
+            j = i + 1
+            while j < n and (text[j].isalnum() or text[j] in "_$"):
+                j += 1
+            yield "word", text[i:j].upper(), depth, i
+            i = j
+        else:
+            i += 1
+
+def word_spans(text):
+    """(word, start, end) for every keyword/identifier outside literals and comments, as written."""
+    return [
+        (text[start:start + len(value)], start, start + len(value))
+        for kind, value, _, start in _tokens(text) if kind == "word"
+    ]
+
+@lru_cache(maxsize=2048)
+def parse_statement(sql):
+    text = sql.strip().replace("```sql", "").replace("```", "").strip()
+    first, end, has_limit, final_depth = None, None, False, 0
+    for kind, value, depth, start in _tokens(text):
+        if end is None:
+            final_depth = depth + (value == "(")
+        if kind == "error":
+            return ParsedStatement(False, f"Malformed SQL: {value}")
+        if end is not None:
+            # Past the first statement: prose is tolerated, another statement is not
+            if kind == "word" and value in STATEMENT_KEYWORDS:
+                return ParsedStatement(False, "Multiple SQL statements are not allowed")
+            if kind == "word":
+                break
+            continue
+        if first is None:
+            if kind != "word":
+                return ParsedStatement(False, "Query must start with SELECT or WITH")
+            first = value
+            if first not in ALLOWED_FIRST_KEYWORDS:
+                return ParsedStatement(False, f"Only SELECT queries are allowed (got {first})")
+        if kind == "punct" and value == ";" and depth == 0:
+            end = start
+        elif kind == "word" and value == "LIMIT" and depth == 0:
+            has_limit = True
+        elif kind == "punct" and depth < 0:
+            return ParsedStatement(False, "Malformed SQL: unbalanced parentheses")
+    if first is None:
+        return ParsedStatement(False, "Empty query")
+    if final_depth != 0:
+        return ParsedStatement(False, "Malformed SQL: unbalanced parentheses")
+    statement = (text if end is None else text[:end]).rstrip()
+    return ParsedStatement(True, "Query is safe", statement + ";", has_limit)
+
+def complete_statement(text):
+    """
+    The first statement of `text` up to and including its top-level `;`, or None while the
+    statement is still incomplete (used to stop streamed generation early).
+    """
+    text = text.replace("```sql", "").replace("```", "")
+    for kind, value, depth, start in _tokens(text):
+        if kind == "error":
+            # An unterminated literal is just still being generated
+            return None
+        if kind == "punct" and value == ";" and depth == 0:
+            return text[:start + 1].strip()
+    return None
+
+class SQLCheck:
+    def __init__(self, ok, reason, sql=None, tables=(), estimated_rows=None, auto_limited=False, error=None,
+                 plan=None):
+        self.ok = ok
+        self.reason = reason
+        # SQLite's prepare error for a permitted statement (e.g. "no such column: x"), else None
+        self.error = error
+        # SQL to execute (may carry an automatic LIMIT)
+        self.sql = sql
+        # "table" for main, "schema.table" for attached databases, as in the metric labels
+        self.tables = list(tables)
+        self.estimated_rows = estimated_rows
+        self.auto_limited = auto_limited
+        # EXPLAIN QUERY PLAN detail strings from the prepare, reused by IndexAdvisor.observe
+        self.plan = plan
+
+    @property
+    def schemas(self):
+        return sorted({t.split(".")[0] if "." in t else "main" for t in self.tables})
+
+def _is_view(conn, schema, name):
+    # Reads of a view's own columns are reported too; the tables beneath it are what it reads
+    row = conn.execute(f"SELECT type FROM {schema}.sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None and row[0] == "view"
+
+class SQLValidator:
+    """
+    Authorizer + EXPLAIN QUERY PLAN check of a parsed statement on a live connection.
+
+    `large_table_rows`: tables at least this big count as large.
+    `max_join_rows`: nested full scans whose row-count product exceeds this are rejected.
+    `auto_limit`: LIMIT appended to statements that fully scan a large table and have none.
+    """
+    def __init__(self, large_table_rows=1_000_000, max_join_rows=10_000_000, auto_limit=10_000, max_entries=1024):
+        self.large_table_rows = large_table_rows
+        self.max_join_rows = max_join_rows
+        self.auto_limit = auto_limit
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, dbapi_connection, sql, versions=None, row_counts=None):
+        """
+        `row_counts` ({(schema, table): rows}) overrides the counted size of tables, e.g. for
+        sensor_readings when it is a view over attached partitions.
+        """
+        key = (sql, versions)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        parsed = parse_statement(sql)
+        result = self._check(dbapi_connection, parsed, row_counts) if parsed.ok else SQLCheck(False, parsed.reason)
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _check(self, conn, parsed, row_counts=None):
+        statement = parsed.sql[:-1]
+        tables, denied = set(), []
+
+        def authorizer(action, arg1, arg2, db_name, source):
+            if action not in _READ_ACTIONS:
+                denied.append(_ACTION_NAMES.get(action, str(action)))
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_FUNCTION and (arg2 or "").lower() in DENIED_FUNCTIONS:
+                denied.append(f"function {arg2}")
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ and arg1 and not arg1.startswith("sqlite_"):
+                # The table actually read, never `source` (the view or CTE the read went through)
+                tables.add((db_name or "main", arg1))
+            return sqlite3.SQLITE_OK
+
+        # Setting an authorizer expires cached statements, so the prepare below always consults it
+        conn.set_authorizer(authorizer)
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+        except sqlite3.Error as e:
+            if denied:
+                return SQLCheck(False, f"Statement not permitted ({', '.join(denied)})")
+            # Unknown tables/columns: left to sql_repair, or reported by the execution path
+            return SQLCheck(True, str(e), parsed.sql, error=str(e))
+        finally:
+            conn.set_authorizer(None)
+
+        rows, large_scan, join_rows = self._estimate(conn, statement, plan, row_counts or {})
+        tables = sorted(
+            (name if schema in ("main", "temp") else f"{schema}.{name}").lower()
+            for schema, name in tables if not _is_view(conn, schema, name)
+        )
+        details = [row[-1] for row in plan]
+        if join_rows > self.max_join_rows:
+            return SQLCheck(False, f"Query joins large tables without a usable join condition "
+                                   f"(~{join_rows:,} row combinations)", tables=tables, estimated_rows=join_rows)
+        if large_scan and not parsed.has_limit and self.auto_limit:
+            return SQLCheck(True, "Automatic LIMIT added to a full scan of a large table",
+                            f"{statement}\nLIMIT {self.auto_limit};", tables, rows, auto_limited=True, plan=details)
+        return SQLCheck(True, "Query is safe", parsed.sql, tables, rows, plan=details)
+
+    def _estimate(self, conn, statement, plan, row_counts):
+        """(rows scanned, scans a large table, worst nested-scan product) from the plan rows."""
+        aliases = {}
+        for ref, alias in _COMMA_REF_RE.findall(statement):
+            schema, _, table = ref.rpartition(".")
+            aliases[alias or table] = (schema or "main", table)
+        aliases.update(table_aliases(statement))
+        scans_by_parent = {}
+        for node_id, parent, _, detail in plan:
+            match = _PLAN_SCAN_RE.match(detail)
+            if match is None or match.group(1) not in aliases:
+                continue
+            schema, table = aliases[match.group(1)]
+            count = row_counts.get((schema, table))
+            if count is None:
+                count = table_row_count(conn, schema, table) or 0
+            scans_by_parent.setdefault(parent, []).append(count)
+
+        rows, large_scan, join_rows = 0, False, 0
+        for counts in scans_by_parent.values():
+            rows += sum(counts)
+            large_scan = large_scan or any(c >= self.large_table_rows for c in counts)
+            if len(counts) > 1:
+                product = 1
+                for c in counts:
+                    product *= max(c, 1)
+                join_rows = max(join_rows, product)
+        return rows, large_scan, join_rows
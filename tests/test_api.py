@@ -0,0 +1,79 @@
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+import api_server
+from api_client import APIUnavailableError, QueryAPIClient
+from async_pipeline import PipelineBusyError
+from query_executor import ColumnarResult
+from sensor_partitions import PartitionLimitError
+
+class _StubPipeline:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def run(self, question, role):
+        if isinstance(self.outcome, BaseException):
+            raise self.outcome
+        return {"question": question, "query": "SELECT 1;", "result": self.outcome}
+
+def _client(outcome):
+    # The lifespan (real engines and Ollama) is skipped: no `with`, state set by hand
+    api_server.app.state.pipeline = _StubPipeline(outcome)
+    return TestClient(api_server.app, raise_server_exceptions=False)
+
+def _post(client, role="SensorViewer", fmt="json"):
+    return client.post("/query", json={"question": "How many readings?", "format": fmt}, headers={"X-Role": role})
+
+def test_query_returns_records_and_columns():
+    client = _client(ColumnarResult(["n"], {"n": [3]}, 1, 0, None))
+    assert _post(client).json()["records"] == [{"n": 3}]
+    body = _post(client, fmt="columnar").json()
+    assert (body["columns"], body["data"], body["row_count"]) == (["n"], {"n": [3]}, 1)
+
+def test_unknown_role_is_a_client_error():
+    response = _post(_client(ColumnarResult([], {}, 0, 0, None)), role="Intern")
+    assert response.status_code == 400
+    assert "Unknown role" in response.json()["detail"]
+
+def test_other_value_errors_are_not_reported_as_unknown_role():
+    response = _post(_client(PartitionLimitError("Query spans 12 sensor partitions")))
+    assert response.status_code == 500
+
+def test_busy_pipeline_gets_429_with_retry_after():
+    response = _post(_client(PipelineBusyError("32 requests pending")))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+def test_sql_error_is_returned_as_422():
+    response = _post(_client("Error: no such table: revenue.asset_revenue"))
+    assert response.status_code == 422
+    assert response.json()["error"].startswith("Error: no such table")
+
+def _unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_client_reports_a_server_that_is_down():
+    client = QueryAPIClient(f"http://127.0.0.1:{_unused_port()}")
+    assert client.get_stats()["unavailable"]
+    with pytest.raises(APIUnavailableError):
+        client.submit("How many readings?", "SensorViewer")
+
+def test_client_stats_do_not_wait_for_a_hung_server():
+    # Accepts connections (via the backlog) but never answers
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(4)
+        client = QueryAPIClient(f"http://127.0.0.1:{server.getsockname()[1]}", timeout=30, stats_timeout=0.2)
+        start = time.monotonic()
+        stats = client.get_stats()
+        assert stats["unavailable"]
+        assert time.monotonic() - start < 5
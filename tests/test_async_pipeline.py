@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+from async_pipeline import AsyncQueryPipeline
+
+class _RecordingDB:
+    role = "SensorViewer"
+
+    def __init__(self, threads):
+        self._threads = threads
+
+    @property
+    def schema_fingerprint(self):
+        self._threads.append(("fingerprint", threading.get_ident()))
+        return "fp"
+
+class _RecordingManager:
+    def __init__(self):
+        self.threads = []
+
+    def get_db_for_session(self, role):
+        self.threads.append(("session", threading.get_ident()))
+        return _RecordingDB(self.threads)
+
+class _CannedEngine:
+    async def agenerate_query(self, db, question, llm_slots=None, on_token=None, executor=None):
+        return "SELECT 1"
+
+    async def arepair_query(self, db, question, query, llm_slots=None, executor=None):
+        return query
+
+    def execute_query(self, db, query, cancel_token=None, on_batch=None):
+        return [{"1": 1}]
+
+def test_session_setup_runs_off_the_event_loop():
+    manager = _RecordingManager()
+    pipeline = AsyncQueryPipeline(manager, _CannedEngine())
+
+    async def main():
+        response = await pipeline.run("How many readings?", "SensorViewer")
+        return response, threading.get_ident()
+
+    response, loop_thread = asyncio.run(main())
+    assert response["result"] == [{"1": 1}]
+    assert [name for name, _ in manager.threads] == ["session", "fingerprint"]
+    assert all(thread != loop_thread for _, thread in manager.threads)
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("langchain_community")
+
+from benchmark import prepare_scaled_data, run_request
+from database_manager import DBManager
+from fake_llm import CannedSQLChatModel
+from llm_engine import LLMEngine
+from query_cache import SQLQueryCache, normalize_question
+from rollups import refresh_rollups, rollups_fresh
+
+def _make_data_dir(path):
+    path.mkdir()
+    sensors = sqlite3.connect(path / "db1_sensors.db")
+    sensors.execute("CREATE TABLE assets_shared (asset_id TEXT, name TEXT)")
+    sensors.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                    "temperature REAL, vibration REAL)")
+    sensors.executemany("INSERT INTO sensor_readings VALUES (?, ?, ?, ?, ?)", [
+        (i, f"AST-{i % 3:03d}", f"2025-06-01 {i % 24:02d}:00:00", 70.0 + i, i / 10) for i in range(1, 31)
+    ])
+    refresh_rollups(sensors)
+    sensors.commit()
+    sensors.close()
+    for filename in ("db2_maintenance.db", "db3_revenue.db"):
+        sqlite3.connect(path / filename).close()
+    return str(path)
+
+def test_generated_sql_is_repaired_before_execution(tmp_path):
+    question = "Average vibration per asset"
+    llm = CannedSQLChatModel(responses={
+        normalize_question(question): "SELECT asset_id, AVG(vibraton) FROM sensor_readings GROUP BY asset_id;"
+    })
+    engine = LLMEngine(llm=llm, query_cache=SQLQueryCache())
+    timings = run_request(DBManager(data_dir=_make_data_dir(tmp_path / "data")), engine, "SensorViewer", question)
+    assert timings["repair"] >= 0 and timings["total"] >= timings["repair"]
+
+def test_scaled_copy_keeps_the_rollups_fresh(tmp_path):
+    dest = prepare_scaled_data(_make_data_dir(tmp_path / "data"), 3, str(tmp_path / "scaled"))
+    conn = sqlite3.connect(f"{dest}/db1_sensors.db")
+    assert conn.execute("SELECT COUNT(*) FROM sensor_readings").fetchone()[0] == 90
+    assert rollups_fresh(conn)
+    assert conn.execute("SELECT SUM(n) FROM _rollup_sensor_daily").fetchone()[0] == 90
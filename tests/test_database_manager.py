@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("langchain_community")
+
+from database_manager import DBManager
+
+def _make_data_dir(path):
+    sensors = sqlite3.connect(path / "db1_sensors.db")
+    sensors.execute("CREATE TABLE assets_shared (asset_id TEXT, name TEXT)")
+    sensors.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                    "temperature REAL, vibration REAL)")
+    sensors.execute("INSERT INTO assets_shared VALUES ('AST-001', 'Press')")
+    sensors.execute("INSERT INTO sensor_readings VALUES (1, 'AST-001', '2025-06-01 00:00:00', 70.0, 1.5)")
+    sensors.commit()
+    sensors.close()
+    for filename, ddl in (("db2_maintenance.db", "CREATE TABLE work_orders (order_id TEXT, asset_id TEXT)"),
+                          ("db3_revenue.db", "CREATE TABLE asset_revenue (revenue_id TEXT, asset_id TEXT)")):
+        conn = sqlite3.connect(path / filename)
+        conn.execute(ddl)
+        conn.commit()
+        conn.close()
+    return str(path)
+
+def _call_with_timeout(fn, timeout=10):
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.setdefault("value", fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "call did not return (deadlock?)"
+    return outcome["value"]
+
+def test_get_db_for_session_builds_and_reuses_entry(tmp_path):
+    manager = DBManager(data_dir=_make_data_dir(tmp_path))
+
+    db = _call_with_timeout(lambda: manager.get_db_for_session("PlantDirector"))
+    again = _call_with_timeout(lambda: manager.get_db_for_session("PlantDirector"))
+
+    assert again is db
+    stats = manager.get_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["checkouts"] >= 1
+    with db._engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT COUNT(*) FROM revenue.asset_revenue").fetchall()
+    assert rows == [(0,)]
+
+def test_concurrent_first_requests_build_once(tmp_path):
+    manager = DBManager(data_dir=_make_data_dir(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_db_for_session("SensorViewer")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(results) == 4
+    assert all(db is results[0] for db in results)
+    assert manager.get_stats()["misses"] == 1
+
+def test_concurrent_checkouts_do_not_block(tmp_path):
+    manager = DBManager(data_dir=_make_data_dir(tmp_path), pool_size=2, max_overflow=2)
+    db = _call_with_timeout(lambda: manager.get_db_for_session("PlantDirector"))
+    before = manager.get_stats()["checkouts"]
+    barrier = threading.Barrier(8)
+
+    def query():
+        barrier.wait()
+        # Checkouts race with stats reads and with session lookups for the same role
+        manager.get_stats()
+        assert manager.get_db_for_session("PlantDirector") is db
+        with db._engine.connect() as connection:
+            return connection.exec_driver_sql("SELECT COUNT(*) FROM sensor_readings").fetchall()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(query()), daemon=True) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive(), "checkout did not return (deadlock?)"
+
+    assert results == [[(1,)]] * 8
+    assert manager.get_stats()["checkouts"] >= before + 8
+
+def test_unknown_role_is_rejected(tmp_path):
+    manager = DBManager(data_dir=_make_data_dir(tmp_path))
+    with pytest.raises(ValueError):
+        manager.get_db_for_session("Intern")
+
+def test_denied_table_names_databases_the_role_does_not_attach(tmp_path):
+    manager = DBManager(data_dir=_make_data_dir(tmp_path))
+    viewer = manager.get_db_for_session("SensorViewer")
+    director = manager.get_db_for_session("PlantDirector")
+
+    assert viewer.denied_table("no such table: revenue.asset_revenue")
+    assert viewer.denied_table("no such table: asset_revenue")
+    assert not viewer.denied_table("no such table: sensor_reading")
+    assert not viewer.denied_table("no such column: amount_usd")
+    assert not director.denied_table("no such table: revenue.asset_revenu")
+
+def test_data_writes_keep_the_schema_fingerprint(tmp_path):
+    data_dir = _make_data_dir(tmp_path)
+    db = DBManager(data_dir=data_dir).get_db_for_session("SensorViewer")
+    before = db.schema_context()
+
+    conn = sqlite3.connect(os.path.join(data_dir, "db1_sensors.db"))
+    with conn:
+        conn.execute("INSERT INTO assets_shared (asset_id, name) VALUES ('A-999', 'New press')")
+    conn.close()
+    after = db.schema_context()
+    assert after.fingerprint == before.fingerprint
+
+    conn = sqlite3.connect(os.path.join(data_dir, "db1_sensors.db"))
+    with conn:
+        conn.execute("ALTER TABLE assets_shared ADD COLUMN site TEXT")
+    conn.close()
+    assert db.schema_context().fingerprint != before.fingerprint
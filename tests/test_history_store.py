@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from history_store import ResultStore
+
+class _Result:
+    def __init__(self, n):
+        self.columns = ["n"]
+        self.data = {"n": list(range(n))}
+        self.row_count = n
+
+def test_drop_session_deletes_only_that_sessions_files(tmp_path):
+    store = ResultStore(directory=str(tmp_path), preview_rows=2)
+    mine, theirs = store.put("a", _Result(10)), store.put("b", _Result(10))
+    store.drop_session("a")
+    assert store.load(mine.key) is None
+    assert store.load(theirs.key) is not None
+    assert store.get_stats()["sessions"] == 1
+    assert len(os.listdir(store.directory)) == 1
+
+def test_idle_sessions_are_dropped_on_touch(tmp_path):
+    store = ResultStore(directory=str(tmp_path), preview_rows=2, session_idle_seconds=60)
+    store.touch("a", now=0)
+    store.touch("b", now=0)
+    old, active = store.put("a", _Result(10)), store.put("b", _Result(10))
+    assert store.touch("b", now=50) == []
+    assert store.touch("b", now=100) == ["a"]
+    assert store.load(old.key) is None
+    assert store.load(active.key) is not None
+    assert store.get_stats()["sessions_dropped"] == 1
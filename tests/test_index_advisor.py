@@ -0,0 +1,35 @@
+import sqlite3
+
+from index_advisor import IndexAdvisor
+from sql_validator import SQLValidator
+
+class _CountingConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.statements = []
+
+    def execute(self, sql, *args):
+        self.statements.append(sql)
+        return self._conn.execute(sql, *args)
+
+def _connection():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE sensor_readings (asset_id TEXT, temperature REAL)")
+    conn.executemany("INSERT INTO sensor_readings VALUES (?, ?)", [(f"AST-{i % 7}", i) for i in range(50)])
+    return conn
+
+def test_observe_reuses_the_validator_plan():
+    conn = _connection()
+    sql = "SELECT s.temperature FROM sensor_readings s WHERE s.asset_id = 'AST-1';"
+    check = SQLValidator().check(conn, sql)
+    assert any(detail.startswith("SCAN") for detail in check.plan)
+
+    counting = _CountingConnection(conn)
+    found = IndexAdvisor().observe(counting, check.sql, check.plan)
+    assert found == [("main", "sensor_readings", ("asset_id", "temperature"))]
+    assert not any(s.startswith("EXPLAIN") for s in counting.statements)
+
+def test_observe_without_a_plan_prepares_the_statement():
+    counting = _CountingConnection(_connection())
+    IndexAdvisor().observe(counting, "SELECT s.temperature FROM sensor_readings s WHERE s.asset_id = 'AST-1'")
+    assert any(s.startswith("EXPLAIN QUERY PLAN") for s in counting.statements)
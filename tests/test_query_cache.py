@@ -0,0 +1,56 @@
+import pytest
+
+from query_cache import SQLQueryCache
+from schema_cache import SchemaContext
+
+CONTEXT = SchemaContext("fp", [
+    ("assets_shared", "CREATE TABLE assets_shared (\n\tasset_id TEXT,\n\tname TEXT\n)"),
+    ("sensor_readings", "CREATE TABLE sensor_readings (\n\tasset_id TEXT,\n\ttemperature REAL,\n\tvibration REAL\n)"),
+])
+
+def test_near_matching_is_off_by_default():
+    cache = SQLQueryCache()
+    cache.put("SensorViewer", "fp", "Show me the top 5 assets with highest vibration", "SELECT 1")
+    assert cache.get("SensorViewer", "fp", "Show the top 5 assets with the highest vibration") is None
+
+def test_near_match_requires_the_same_schema_identifiers():
+    cache = SQLQueryCache(similarity_threshold=0.5)
+    cache.put("SensorViewer", "fp", "Show me the top 5 assets with highest vibration", "SELECT vibration")
+    words = CONTEXT.identifier_words
+    assert cache.get("SensorViewer", "fp", "Show me the top 5 assets with highest temperature", words) is None
+    assert cache.get("SensorViewer", "fp", "Show me top 5 assets with the highest vibration", words) == (
+        "SELECT vibration"
+    )
+    assert cache.get("SensorViewer", "fp", "Show me the top 10 assets with highest vibration", words) is None
+
+def _rows(path):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT fingerprint, question, sql FROM query_cache ORDER BY question").fetchall()
+    finally:
+        conn.close()
+
+def test_disk_store_drops_superseded_and_expired_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "query_cache.db")
+    cache = SQLQueryCache(path, ttl_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr("query_cache.time.time", lambda: clock[0])
+
+    cache.put("SensorViewer", "old", "average temperature", "SELECT 1")
+    cache.put("SensorViewer", "old", "max vibration", "SELECT 2")
+    cache.put("SensorViewer", "new", "average temperature", "SELECT 3")
+    assert _rows(path) == [("new", "average temperature", "SELECT 3"), ("old", "max vibration", "SELECT 2")]
+
+    clock[0] += 120
+    cache.put("SensorViewer", "new", "hottest asset", "SELECT 4")
+    assert _rows(path) == [("new", "hottest asset", "SELECT 4")]
+
+def test_near_matching_is_enabled_only_through_the_environment(monkeypatch):
+    pytest.importorskip("langchain_community")
+    from llm_engine import similarity_threshold_from_env
+
+    monkeypatch.delenv("SQL_CACHE_SIMILARITY", raising=False)
+    assert similarity_threshold_from_env() is None
+    monkeypatch.setenv("SQL_CACHE_SIMILARITY", "0.9")
+    assert similarity_threshold_from_env() == 0.9
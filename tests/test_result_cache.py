@@ -0,0 +1,46 @@
+import pytest
+
+from result_cache import ResultCache, is_deterministic
+
+VERSIONS = (("main", 1, 100),)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM sensor_readings WHERE timestamp >= datetime('now', '-1 day')",
+    "SELECT date('NOW')",
+    "SELECT * FROM sensor_readings WHERE timestamp > CURRENT_TIMESTAMP",
+    "SELECT * FROM assets_shared ORDER BY RANDOM() LIMIT 3",
+    "SELECT strftime('%Y-%m', 'now')",
+    "SELECT strftime('%Y')",
+    "SELECT julianday()",
+])
+def test_time_and_random_dependent_sql_is_not_deterministic(sql):
+    assert not is_deterministic(sql)
+
+def test_plain_sql_is_deterministic():
+    assert is_deterministic(
+        "SELECT strftime('%Y-%m', timestamp), AVG(temperature) FROM sensor_readings "
+        "WHERE timestamp >= datetime('2025-06-01', '-1 day') GROUP BY 1"
+    )
+
+def test_non_deterministic_results_are_never_cached():
+    cache = ResultCache()
+    sql = "SELECT COUNT(*) FROM sensor_readings WHERE timestamp >= datetime('now', '-1 hour')"
+    assert cache.put("SensorViewer", sql, VERSIONS, [{"n": 1}]) is False
+    assert cache.get("SensorViewer", sql, VERSIONS) is None
+    assert cache.get_stats()["uncacheable"] == 1
+
+    assert cache.put("SensorViewer", "SELECT 1", VERSIONS, [{"n": 1}]) is True
+    assert cache.get("SensorViewer", "SELECT 1", VERSIONS) == [{"n": 1}]
+
+class _Result:
+    def __init__(self, truncated):
+        self.truncated = truncated
+        self.nbytes = 16
+
+def test_truncated_results_are_not_cached():
+    cache = ResultCache()
+    assert cache.put("SensorViewer", "SELECT n FROM t", VERSIONS, _Result(truncated=True)) is False
+    assert cache.get("SensorViewer", "SELECT n FROM t", VERSIONS) is None
+    assert cache.get_stats()["truncated"] == 1
+
+    assert cache.put("SensorViewer", "SELECT n FROM t", VERSIONS, _Result(truncated=False)) is True
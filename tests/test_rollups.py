@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from rollups import RollupRewriter, refresh_rollups, rollups_fresh
+
+def _connection():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                 "temperature REAL, vibration REAL)")
+    rows = []
+    for i in range(600):
+        asset = f"AST-{i % 7:03d}"
+        # Readings every 17 minutes over a week; a few NULL metrics so cnt_* differs from n
+        timestamp = f"2025-06-{1 + (i * 17) // 1440:02d} {(i * 17) // 60 % 24:02d}:{i * 17 % 60:02d}:00"
+        temperature = None if i % 29 == 0 else 60 + (i * 37) % 41 / 2
+        vibration = None if i % 31 == 0 else (i * 13) % 17 / 10
+        rows.append((i, asset, timestamp, temperature, vibration))
+    conn.executemany("INSERT INTO sensor_readings VALUES (?, ?, ?, ?, ?)", rows)
+    refresh_rollups(conn)
+    return conn
+
+REWRITTEN = [
+    "SELECT asset_id, AVG(temperature), SUM(temperature), MIN(temperature), MAX(temperature), COUNT(temperature) "
+    "FROM sensor_readings GROUP BY asset_id ORDER BY asset_id",
+    "SELECT s.asset_id, AVG(s.vibration), SUM(s.vibration), MIN(s.vibration), MAX(s.vibration), COUNT(s.vibration) "
+    "FROM sensor_readings s GROUP BY s.asset_id ORDER BY s.asset_id",
+    "SELECT asset_id, COUNT(*) FROM sensor_readings GROUP BY asset_id ORDER BY asset_id",
+    "SELECT asset_id, COUNT(1) AS readings FROM sensor_readings GROUP BY asset_id ORDER BY readings DESC, asset_id LIMIT 3",
+    "SELECT date(timestamp) AS day, AVG(temperature) FROM sensor_readings GROUP BY day ORDER BY day",
+    "SELECT strftime('%Y-%m-%d %H', timestamp) AS hour, MAX(vibration), COUNT(*) FROM sensor_readings "
+    "WHERE asset_id = 'AST-002' GROUP BY hour ORDER BY hour",
+    "SELECT asset_id, AVG(temperature) FROM sensor_readings "
+    "WHERE asset_id IN ('AST-001', 'AST-004') AND timestamp >= '2025-06-03' AND timestamp < '2025-06-05 12:00:00' "
+    "GROUP BY asset_id ORDER BY asset_id",
+]
+
+@pytest.mark.parametrize("sql", REWRITTEN)
+def test_rewritten_query_returns_the_raw_result(sql):
+    conn = _connection()
+    rewritten = RollupRewriter().rewrite(sql)
+    assert rewritten is not None and "_rollup_sensor_" in rewritten
+    raw = conn.execute(sql).fetchall()
+    rolled = conn.execute(rewritten).fetchall()
+    # Sums are re-associated per bucket, so floats agree only approximately
+    assert rolled == [tuple(pytest.approx(v) if isinstance(v, float) else v for v in row) for row in raw]
+
+@pytest.mark.parametrize("sql", [
+    # Aggregates over non-metric columns or constants would count rollup rows, not readings
+    "SELECT asset_id, COUNT(asset_id) AS n FROM sensor_readings GROUP BY asset_id ORDER BY n DESC LIMIT 3",
+    "SELECT asset_id, SUM(1) FROM sensor_readings GROUP BY asset_id",
+    "SELECT asset_id, GROUP_CONCAT(asset_id) FROM sensor_readings GROUP BY asset_id",
+    "SELECT asset_id, COUNT(DISTINCT asset_id) FROM sensor_readings GROUP BY asset_id",
+    "SELECT asset_id, TOTAL(temperature) FROM sensor_readings GROUP BY asset_id",
+    "SELECT asset_id, MAX(AVG(temperature)) FROM sensor_readings GROUP BY asset_id",
+    "SELECT strftime('%Y-%m-%d %H:%M', timestamp), AVG(temperature) FROM sensor_readings GROUP BY 1",
+    "SELECT asset_id, AVG(temperature) FROM sensor_readings WHERE timestamp >= '2025-06-03 10:30:00' GROUP BY asset_id",
+])
+def test_query_the_rollups_cannot_answer_stays_raw(sql):
+    assert RollupRewriter().rewrite(sql) is None
+
+def test_rollups_go_stale_until_refreshed():
+    conn = _connection()
+    assert rollups_fresh(conn)
+    conn.execute("INSERT INTO sensor_readings VALUES (600, 'AST-001', '2025-06-08 00:00:00', 70.0, 1.0)")
+    assert not rollups_fresh(conn)
+    assert refresh_rollups(conn) == 1
+    assert rollups_fresh(conn)
@@ -0,0 +1,46 @@
+import sqlite3
+
+from schema_cache import SchemaContextCache
+
+def _files(tmp_path):
+    path = str(tmp_path / "db1_sensors.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sensor_readings (asset_id TEXT, temperature REAL)")
+    conn.execute("INSERT INTO sensor_readings VALUES ('AST-001', 70.0)")
+    conn.commit()
+    conn.close()
+    return [("main", path)]
+
+def _write(files, sql):
+    conn = sqlite3.connect(files[0][1])
+    with conn:
+        conn.execute(sql)
+    conn.close()
+
+def test_second_instance_reuses_the_persisted_context(tmp_path):
+    files = _files(tmp_path)
+    cache_path = str(tmp_path / "cache" / "schema_context.json")
+    first = SchemaContextCache(cache_path).get("SensorViewer", files)
+
+    restarted = SchemaContextCache(cache_path)
+    entry = restarted.get("SensorViewer", files)
+    assert entry.fingerprint == first.fingerprint
+    assert entry.tables == first.tables
+    assert restarted.get_stats() == {"hits": 1, "misses": 0, "sample_refreshes": 0, "disk_loads": 1}
+
+def test_data_writes_refresh_samples_and_ddl_changes_the_fingerprint(tmp_path):
+    files = _files(tmp_path)
+    cache = SchemaContextCache(str(tmp_path / "schema_context.json"), sample_rows=5)
+    before = cache.get("SensorViewer", files)
+
+    _write(files, "INSERT INTO sensor_readings VALUES ('AST-002', 71.5)")
+    after = cache.get("SensorViewer", files)
+    assert after.fingerprint == before.fingerprint
+    assert "AST-002" in after.render()
+
+    _write(files, "ALTER TABLE sensor_readings ADD COLUMN vibration REAL")
+    altered = cache.get("SensorViewer", files)
+    assert altered.fingerprint != before.fingerprint
+    assert "vibration REAL" in altered.render()
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["sample_refreshes"]) == (2, 1)
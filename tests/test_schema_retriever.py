@@ -0,0 +1,44 @@
+import pytest
+
+from metrics import REGISTRY
+from schema_cache import SchemaContext
+from schema_retriever import SchemaRetriever
+
+def _context(sample_status):
+    tables = [
+        ("assets_shared", "CREATE TABLE assets_shared (\n\tasset_id TEXT\n)"),
+        ("maintenance.work_orders",
+         f"CREATE TABLE maintenance.work_orders (\n\torder_id TEXT,\n\tstatus TEXT\n)\n\n/*\n{sample_status}\n*/"),
+        ("sensor_readings", "CREATE TABLE sensor_readings (\n\tasset_id TEXT,\n\tvibration REAL\n)"),
+    ]
+    return SchemaContext("same-ddl", tables)
+
+def test_index_follows_sample_rows_under_the_same_fingerprint():
+    retriever = SchemaRetriever(synonyms={})
+    before = retriever.score(_context("Open"), "which are escalated")
+    after = retriever.score(_context("Escalated"), "which are escalated")
+    assert before["maintenance.work_orders"] == 0.0
+    assert after["maintenance.work_orders"] > 0.0
+
+class _StubDB:
+    role = "SensorViewer"
+
+    def schema_context(self):
+        return _context("Open")
+
+    def get_table_info(self, table_names=None):
+        return "\n\n".join(block for name, block in _context("Open").tables
+                            if table_names is None or name in table_names)
+
+def test_tokens_saved_are_recorded_per_prompt():
+    pytest.importorskip("langchain_community")
+    from llm_engine import LLMEngine
+    from query_cache import SQLQueryCache
+
+    REGISTRY.reset()
+    engine = LLMEngine(llm=object(), query_cache=SQLQueryCache())
+    for question in ("average vibration per asset", "open work orders"):
+        engine._build_prompt(_StubDB(), question)
+    (histogram,) = [h for h in REGISTRY.to_dict()["histograms"] if h["name"] == "schema_tokens_saved"]
+    assert histogram["count"] == 2 and histogram["sum"] > 0
+    assert histogram["p50"] > 0
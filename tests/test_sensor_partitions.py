@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+
+from sensor_partitions import PartitionLimitError, PartitionWriter, SensorPartitions, time_bounds
+
+@pytest.mark.parametrize("sql, bounds", [
+    ("SELECT * FROM sensor_readings WHERE timestamp >= '2025-03-15' AND timestamp < '2025-06-01'",
+     ("2025-03", "2025-05")),
+    ("SELECT * FROM sensor_readings WHERE timestamp < '2025-06-02'", (None, "2025-06")),
+    ("SELECT * FROM sensor_readings WHERE timestamp BETWEEN '2025-02-01' AND '2025-04-30 23:59:59'",
+     ("2025-02", "2025-04")),
+    ("SELECT AVG(s.temperature) FROM sensor_readings s WHERE s.asset_id = 'AST-001' AND s.timestamp > '2025-01-10'",
+     ("2025-01", None)),
+    ("SELECT * FROM sensor_readings WHERE timestamp = '2025-07-04 10:00:00'", ("2025-07", "2025-07")),
+])
+def test_literal_timestamp_bounds(sql, bounds):
+    assert time_bounds(sql) == bounds
+
+def test_now_bounds_are_evaluated_by_sqlite():
+    month = sqlite3.connect(":memory:").execute("SELECT strftime('%Y-%m', datetime('now', '-1 day'))").fetchone()[0]
+    assert time_bounds("SELECT * FROM sensor_readings WHERE timestamp >= datetime('now', '-1 day')") == (month, None)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM sensor_readings",
+    "SELECT * FROM sensor_readings WHERE timestamp >= '2025-03-01' OR asset_id = 'AST-001'",
+    "SELECT * FROM sensor_readings a JOIN sensor_readings b ON a.asset_id = b.asset_id WHERE a.timestamp > '2025-03-01'",
+    "SELECT * FROM sensor_readings WHERE timestamp > '2025-03-01' UNION SELECT * FROM sensor_readings",
+    "SELECT * FROM sensor_readings s JOIN assets_shared a ON s.asset_id = a.asset_id WHERE a.timestamp > '2025-03-01'",
+])
+def test_unprunable_queries_read_every_partition(sql):
+    assert time_bounds(sql) == (None, None)
+
+def _partitions(directory, months):
+    partitions = SensorPartitions(str(directory))
+    rows = [(i, "AST-001", f"{month}-15 12:00:00", 70.0 + i, 1.0) for i, month in enumerate(months)]
+    PartitionWriter(partitions).write(rows)
+    return partitions
+
+MONTHS = [f"2025-{m:02d}" for m in range(1, 7)]
+
+def test_for_query_prunes_to_the_bounded_months(tmp_path):
+    partitions = _partitions(tmp_path, MONTHS)
+    selected = partitions.for_query(
+        "SELECT * FROM sensor_readings WHERE timestamp >= '2025-03-01' AND timestamp < '2025-05-01'"
+    )
+    assert [p.first for p in selected] == ["2025-03", "2025-04"]
+    assert len(partitions.for_query("SELECT * FROM sensor_readings")) == len(MONTHS)
+
+def test_bind_attaches_only_the_selected_partitions(tmp_path):
+    partitions = _partitions(tmp_path, MONTHS)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                 "temperature REAL, vibration REAL)")
+    sql = "SELECT timestamp FROM sensor_readings WHERE timestamp >= '2025-05-01' ORDER BY timestamp"
+    binding = partitions.bind(conn, sql)
+    assert binding.schemas == ["sensors_2025_05", "sensors_2025_06"]
+    attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith("sensors_")]
+    assert sorted(attached) == binding.schemas
+    assert [row[0] for row in conn.execute(sql)] == ["2025-05-15 12:00:00", "2025-06-15 12:00:00"]
+
+def test_bind_refuses_more_partitions_than_can_be_attached(tmp_path):
+    partitions = _partitions(tmp_path, MONTHS)
+    conn = sqlite3.connect(":memory:")
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 6)
+    bounded = "SELECT * FROM sensor_readings WHERE timestamp >= '2025-03-01'"
+    assert len(partitions.bind(conn, bounded).partitions) == 4
+    with pytest.raises(PartitionLimitError, match="6 sensor partitions but at most 4"):
+        partitions.bind(conn, "SELECT * FROM sensor_readings", reserved_attachments=2)
+
+def test_unbounded_query_past_the_limit_is_a_clean_error(tmp_path):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("langchain_community")
+    from database_manager import DBManager
+    from llm_engine import LLMEngine
+    from query_cache import SQLQueryCache
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for filename in ("db1_sensors.db", "db2_maintenance.db", "db3_revenue.db"):
+        sqlite3.connect(data_dir / filename).close()
+    # PlantDirector attaches two databases, leaving 8 of SQLite's 10 for partitions
+    _partitions(data_dir / "sensor_partitions", [f"2024-{m:02d}" for m in range(1, 10)])
+    conn = sqlite3.connect(data_dir / "db1_sensors.db")
+    conn.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                 "temperature REAL, vibration REAL)")
+    conn.close()
+
+    db = DBManager(data_dir=str(data_dir)).get_db_for_session("PlantDirector")
+    engine = LLMEngine(llm=object(), query_cache=SQLQueryCache())
+    sql = "SELECT AVG(temperature) FROM sensor_readings"
+
+    repaired = engine.repair_query(db, sql)
+    assert repaired.error.startswith("Query spans 9 sensor partitions")
+    assert not repaired.retryable
+    assert engine.execute_query(db, sql).startswith("Query too broad: Query spans 9 sensor partitions")
+
+    bounded = engine.execute_query(db, "SELECT COUNT(*) FROM sensor_readings WHERE timestamp >= '2024-08-01'")
+    assert bounded.data[bounded.columns[0]] == [2]
+
+def test_regenerating_data_replaces_stale_partitions(tmp_path):
+    for module in ("numpy", "pandas", "faker"):
+        pytest.importorskip(module)
+    from generate_data import repartition
+
+    stale = _partitions(tmp_path / "sensor_partitions", ["2024-01", "2024-02"])
+    conn = sqlite3.connect(tmp_path / "db1_sensors.db")
+    conn.execute("CREATE TABLE sensor_readings (reading_id INTEGER, asset_id TEXT, timestamp TIMESTAMP, "
+                 "temperature REAL, vibration REAL)")
+    conn.execute("INSERT INTO sensor_readings VALUES (1, 'AST-002', '2025-06-01 08:00:00', 71.0, 1.2)")
+    conn.commit()
+    conn.close()
+
+    repartition(str(tmp_path))
+    assert [p.first for p in stale.partitions()] == ["2025-06"]
@@ -0,0 +1,35 @@
+from sql_repair import SQLRepairer
+
+COLUMNS = {
+    "assets_shared": {"asset_id": "TEXT", "name": "TEXT"},
+    "sensor_readings": {"reading_id": "INTEGER", "asset_id": "TEXT", "temperature": "REAL", "vibration": "REAL"},
+    "revenue.asset_revenue": {"revenue_id": "TEXT", "asset_id": "TEXT", "quarter": "TEXT", "amount_usd": "REAL"},
+}
+
+def test_misspelled_column_is_replaced_by_its_closest_match():
+    sql = "SELECT AVG(s.temprature) FROM sensor_readings s"
+    fixed = SQLRepairer().fix(sql, "no such column: s.temprature", COLUMNS)
+    assert fixed == ("SELECT AVG(s.temperature) FROM sensor_readings s", "column_name")
+
+def test_prefix_alone_is_not_a_close_enough_match():
+    sql = "SELECT r.quarter, r.rev FROM revenue.asset_revenue r"
+    assert SQLRepairer().fix(sql, "no such column: r.rev", COLUMNS) is None
+
+def test_text_column_is_never_swapped_into_a_numeric_aggregate():
+    repairer = SQLRepairer()
+    qualified = "SELECT r.quarter, SUM(r.revenue) FROM revenue.asset_revenue r GROUP BY r.quarter"
+    assert repairer.fix(qualified, "no such column: r.revenue", COLUMNS) is None
+    unqualified = "SELECT quarter, SUM(revenue) FROM revenue.asset_revenue GROUP BY quarter"
+    assert repairer.fix(unqualified, "no such column: revenue", COLUMNS) is None
+    # Outside an aggregate the same rename is fine
+    plain = "SELECT r.revenue FROM revenue.asset_revenue r"
+    assert repairer.fix(plain, "no such column: r.revenue", COLUMNS) == (
+        "SELECT r.revenue_id FROM revenue.asset_revenue r", "column_name"
+    )
+
+def test_missing_schema_prefix_is_added():
+    sql = "SELECT a.name FROM assets_shared a JOIN asset_revenue r ON a.asset_id = r.asset_id"
+    fixed = SQLRepairer().fix(sql, "no such table: asset_revenue", COLUMNS)
+    assert fixed == (
+        "SELECT a.name FROM assets_shared a JOIN revenue.asset_revenue r ON a.asset_id = r.asset_id", "table_prefix"
+    )
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from sql_validator import SQLValidator, parse_statement
+
+def _connection(rows=50):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE sensor_readings (asset_id TEXT, temperature REAL)")
+    conn.execute("CREATE TABLE assets_shared (asset_id TEXT, name TEXT)")
+    conn.executemany("INSERT INTO sensor_readings VALUES (?, ?)", [(f"AST-{i % 5}", i) for i in range(rows)])
+    conn.executemany("INSERT INTO assets_shared VALUES (?, ?)", [(f"AST-{i}", "Press") for i in range(5)])
+    conn.execute("ATTACH DATABASE ':memory:' AS revenue")
+    conn.execute("CREATE TABLE revenue.asset_revenue (asset_id TEXT, amount_usd REAL)")
+    return conn
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; DROP TABLE sensor_readings;",
+    "SELECT ';' AS x; DELETE FROM sensor_readings",
+    "SELECT 1 /* ; */; ATTACH DATABASE 'x.db' AS x",
+])
+def test_second_statement_is_rejected(sql):
+    parsed = parse_statement(sql)
+    assert not parsed.ok
+    assert "Multiple SQL statements" in parsed.reason
+
+def test_trailing_prose_and_literals_do_not_count_as_statements():
+    parsed = parse_statement("SELECT 'a;b' AS x; -- the query above lists assets")
+    assert parsed.ok
+    assert parsed.sql == "SELECT 'a;b' AS x;"
+
+@pytest.mark.parametrize("sql", [
+    "PRAGMA query_only = OFF;",
+    "ATTACH DATABASE 'other.db' AS other;",
+    "DELETE FROM sensor_readings;",
+])
+def test_non_select_statements_are_rejected(sql):
+    check = SQLValidator().check(_connection(), sql)
+    assert not check.ok
+    assert "Only SELECT queries are allowed" in check.reason
+
+@pytest.mark.parametrize("sql, denied", [
+    ("SELECT load_extension('evil.so');", "function load_extension"),
+    ("SELECT * FROM pragma_table_info('sensor_readings');", "Statement not permitted"),
+])
+def test_authorizer_denies_non_read_actions(sql, denied):
+    check = SQLValidator().check(_connection(), sql)
+    assert not check.ok
+    assert "Statement not permitted" in check.reason and denied in check.reason
+
+def test_cartesian_join_of_large_tables_is_rejected():
+    validator = SQLValidator(large_table_rows=1, max_join_rows=100)
+    check = validator.check(_connection(), "SELECT * FROM sensor_readings s, assets_shared a;")
+    assert not check.ok
+    assert "without a usable join condition" in check.reason
+
+def test_full_scan_of_large_table_gets_a_limit():
+    validator = SQLValidator(large_table_rows=10, auto_limit=25)
+    check = validator.check(_connection(), "SELECT * FROM sensor_readings;")
+    assert check.ok and check.auto_limited
+    assert check.sql.endswith("LIMIT 25;")
+    assert len(_connection().execute(check.sql).fetchall()) == 25
+
+    limited = validator.check(_connection(), "SELECT * FROM sensor_readings LIMIT 5;")
+    assert limited.ok and not limited.auto_limited
+
+def test_tables_report_names_tables_not_ctes_or_views():
+    conn = _connection()
+    conn.execute("CREATE TEMP VIEW hot AS SELECT * FROM sensor_readings WHERE temperature > 40")
+    validator = SQLValidator()
+
+    cte = validator.check(conn, "WITH x AS (SELECT * FROM sensor_readings) SELECT * FROM x;")
+    assert cte.tables == ["sensor_readings"]
+    view = validator.check(conn, "SELECT h.asset_id, r.amount_usd FROM hot h JOIN revenue.asset_revenue r "
+                                 "ON h.asset_id = r.asset_id;")
+    assert view.tables == ["revenue.asset_revenue", "sensor_readings"]
+    assert view.schemas == ["main", "revenue"]